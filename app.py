@@ -1,21 +1,47 @@
 from flask import Flask
-from db import db
+from db import db, configure_engine, engine_options
 from routes import main_routes
+from commands import register_commands
+from metrics import set_metrics_enabled
+from nlp_parser import preload_model
 
-app = Flask(__name__)
 
-# Configure the database URI
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///references.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+def create_app(config='config.ProductionConfig'):
+    """
+    Creates the Flask application.
 
-# Initialize the database with the Flask app
-db.init_app(app)
+    Args:
+        config (str or class): Configuration object, e.g. 'config.DevelopmentConfig'.
+
+    Returns:
+        Flask: The configured application.
+    """
+    app = Flask(__name__)
+    app.config.from_object(config)
+
+    # Initialize the database with the Flask app, with a sized pool and tuned SQLite connections
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+    db.init_app(app)
+    with app.app_context():
+        configure_engine(db.engine, app.config)
+
+    # Register the routes from the routes.py file
+    app.register_blueprint(main_routes)
+
+    # Register the maintenance commands (flask rebuild-search-index, ...)
+    register_commands(app)
+
+    set_metrics_enabled(app.config['METRICS_ENABLED'])
+
+    # In a pre-fork server this runs in the master, so workers inherit the loaded model
+    if app.config['PRELOAD_MODEL']:
+        preload_model()
+    return app
 
-# Register the routes from the routes.py file
-app.register_blueprint(main_routes)
 
 if __name__ == '__main__':
+    app = create_app('config.DevelopmentConfig')
     # Create the database tables if they do not exist
     with app.app_context():
         db.create_all()
-    app.run(debug=True)
+    app.run()
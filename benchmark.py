@@ -0,0 +1,351 @@
+import argparse
+import glob
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from synthetic_corpus import FIELDS, STYLES, generate_corpus, pathological_references
+from parsed_reference import ParsedReference
+from config import Config
+
+# Directory the benchmark results are written to, one JSON file per run
+RESULTS_DIR = 'benchmark_results'
+
+# Fields compared against the corpus labels
+SCORED_FIELDS = ('authors', 'year', 'title', 'journal', 'volume', 'issue', 'pages', 'doi')
+
+# Lowest accepted per-field accuracy by parser; a run below any of them exits with status 1.
+# The cascade and nlp_parser find every DOI link, so losing them again fails the benchmark.
+ACCURACY_FLOORS = {
+    'ParserCascade': {'doi': 0.99},
+    'nlp_parser': {'doi': 0.99},
+}
+
+# Seconds a time-budgeted cascade may take on a --regression input on top of its
+# budgets, for the NLP stage and replacing killed sandbox processes
+REGRESSION_GRACE = 3.0
+
+
+def _clean(value):
+    if value is None:
+        return ''
+    return str(value).strip().rstrip('.').strip()
+
+
+def _fields(parsed):
+    """
+    Maps a ParsedReference to the corpus label fields; book titles count as the journal.
+    """
+    result = {field: _clean(getattr(parsed, field)) for field in FIELDS}
+    result['journal'] = _clean(parsed.journal or parsed.book_title)
+    return result
+
+
+class ParserAdapter:
+    """
+    Runs one of the parsers over a list of lines and returns dictionaries keyed by FIELDS.
+    """
+
+    def __init__(self, name, parse_batch, parse_one):
+        self.name = name
+        self.parse_batch = parse_batch
+        self.parse_one = parse_one
+
+
+def _nlp_parser_adapter():
+    from nlp_parser import nlp_parser
+    return ParserAdapter(
+        'nlp_parser',
+        lambda lines: [_fields(parsed) for parsed in nlp_parser('\n'.join(lines), gazetteer_path=Config.GAZETTEER_PATH)],
+        lambda line: _fields(nlp_parser(line, gazetteer_path=Config.GAZETTEER_PATH)[0])
+    )
+
+
+def _brute_force_adapter():
+    from reference_parser import BruteForceReferenceParser
+    return ParserAdapter(
+        'BruteForceReferenceParser',
+        lambda lines: [_fields(parsed) for parsed in BruteForceReferenceParser('\n'.join(lines)).get_parsed_references()],
+        lambda line: _fields(BruteForceReferenceParser(line).get_parsed_references()[0])
+    )
+
+
+def _reference_parser_adapter():
+    from reference_parser import ReferenceParser
+    return ParserAdapter(
+        'ReferenceParser',
+        lambda lines: [_fields(ReferenceParser(line).get_parsed_reference()) for line in lines],
+        lambda line: _fields(ReferenceParser(line).get_parsed_reference())
+    )
+
+
+def _parse_reference_string_adapter():
+    from routes import parse_reference_string
+
+    def parse_one(line):
+        try:
+            author, title, journal, year, volume, issue, pages, doi = parse_reference_string(line)
+        except ValueError:
+            return dict.fromkeys(FIELDS, '')
+        return _fields(ParsedReference(
+            authors=author, title=title, journal=journal, year=year,
+            volume=volume, issue=issue, pages=pages, doi=doi, original_string=line
+        ))
+
+    return ParserAdapter('parse_reference_string', lambda lines: [parse_one(line) for line in lines], parse_one)
+
+
+def _cascade_adapter():
+    from cascade import ParserCascade
+    cascade = ParserCascade(gazetteer_path=Config.GAZETTEER_PATH)
+    return ParserAdapter(
+        'ParserCascade',
+        lambda lines: [_fields(parsed) for parsed in cascade.parse_lines(lines)],
+        lambda line: _fields(cascade.parse_lines([line])[0])
+    )
+
+
+PARSERS = {
+    'ParserCascade': _cascade_adapter,
+    'nlp_parser': _nlp_parser_adapter,
+    'BruteForceReferenceParser': _brute_force_adapter,
+    'ReferenceParser': _reference_parser_adapter,
+    'parse_reference_string': _parse_reference_string_adapter,
+}
+
+
+def _nlp_fields_lines(lines):
+    from gazetteer import get_gazetteer
+    from nlp_parser import _parse_reference
+    gazetteer = get_gazetteer(Config.GAZETTEER_PATH)
+    return [_parse_reference(line, gazetteer) for line in lines]
+
+
+def _parse_reference_string_lines(lines):
+    parse_one = _parse_reference_string_adapter().parse_one
+    return [parse_one(line) for line in lines]
+
+
+def run_regression(budget, scale=1.0):
+    """
+    Runs the pathological inputs through every regex based parser, each in a sandbox
+    process with the given budget, and through a ParserCascade with that time budget.
+
+    The parsers that still run over the budget are reported. Every run is bounded
+    by the budget, so the whole suite finishes in bounded time. Times include
+    starting a new sandbox after one was killed.
+
+    Args:
+        budget (float): Seconds allowed per reference and parser.
+        scale (float): Size of the inputs relative to synthetic_corpus.PATHOLOGICAL.
+
+    Returns:
+        bool: Whether the cascade stayed within its budgets on every input.
+    """
+    from cascade import ParserCascade, ISOLATED_STAGES, STAGES
+    from sandbox import run_isolated
+
+    parsers = {
+        'ReferenceParser': STAGES['reference'],
+        'BruteForce': STAGES['brute_force'],
+        'nlp_parser': _nlp_fields_lines,
+        'parse_ref_string': _parse_reference_string_lines,
+    }
+    cascade = ParserCascade(time_budget=budget, gazetteer_path=Config.GAZETTEER_PATH)
+    # Start a sandbox and load the model before anything is timed
+    cascade.parse_lines(['Smith, J. (2015). Warm up. Journal of Testing, 1(2), 3–4.'])
+    bound = budget * len(ISOLATED_STAGES) + REGRESSION_GRACE
+
+    print(f"{'input':<30}{'chars':>8}" + ''.join(f'{name:>18}' for name in parsers) + f"{'ParserCascade':>18}")
+    ok = True
+    for name, text in pathological_references(scale):
+        cells = []
+        for parser_name, function in parsers.items():
+            start = time.perf_counter()
+            result = run_isolated(parser_name, function, [text], budget)[0]
+            cells.append('over budget' if result is None else f'{(time.perf_counter() - start) * 1000:.0f} ms')
+
+        start = time.perf_counter()
+        parsed = cascade.parse_lines([text])[0]
+        elapsed = time.perf_counter() - start
+        if elapsed > bound:
+            ok = False
+        cells.append(f"{elapsed * 1000:.0f} ms {parsed.parser}" + ('' if elapsed <= bound else ' SLOW'))
+        print(f'{name:<30}{len(text):>8}' + ''.join(f'{cell:>18}' for cell in cells))
+
+    print(f"Budget {budget} s per line and parser; the cascade must finish each input within {bound} s: "
+          + ('ok' if ok else 'FAILED'))
+    return ok
+
+
+def _percentile(values, percent):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def score(corpus, predictions):
+    """
+    Returns per-field accuracy overall and per citation style (exact match after trimming).
+    """
+    totals = {field: 0 for field in SCORED_FIELDS}
+    by_style = {}
+    counts = {}
+    for item, predicted in zip(corpus, predictions):
+        style_totals = by_style.setdefault(item['style'], {field: 0 for field in SCORED_FIELDS})
+        counts[item['style']] = counts.get(item['style'], 0) + 1
+        for field in SCORED_FIELDS:
+            if _clean(item['labels'][field]) == predicted[field]:
+                totals[field] += 1
+                style_totals[field] += 1
+    accuracy = {field: round(correct / len(corpus), 4) for field, correct in totals.items()}
+    accuracy_by_style = {
+        style: {field: round(correct / counts[style], 4) for field, correct in style_totals.items()}
+        for style, style_totals in sorted(by_style.items())
+    }
+    return accuracy, accuracy_by_style
+
+
+def run_parser(adapter, corpus, latency_sample, measure_memory=True):
+    """
+    Measures throughput, per-reference latency, peak memory and accuracy of one parser.
+    """
+    lines = [item['text'] for item in corpus]
+
+    start = time.perf_counter()
+    predictions = adapter.parse_batch(lines)
+    elapsed = time.perf_counter() - start
+
+    latencies = []
+    for line in lines[:latency_sample]:
+        line_start = time.perf_counter()
+        adapter.parse_one(line)
+        latencies.append((time.perf_counter() - line_start) * 1000)
+
+    peak_memory = None
+    if measure_memory:
+        tracemalloc.start()
+        adapter.parse_batch(lines)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    accuracy, accuracy_by_style = score(corpus, predictions)
+    return {
+        'lines_per_sec': round(len(lines) / elapsed, 1),
+        'p50_ms': round(statistics.median(latencies), 4) if latencies else None,
+        'p99_ms': round(_percentile(latencies, 99), 4) if latencies else None,
+        'max_ms': round(max(latencies), 4) if latencies else None,
+        'peak_memory_mb': round(peak_memory / 1e6, 2) if peak_memory is not None else None,
+        'accuracy': accuracy,
+        'accuracy_by_style': accuracy_by_style,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(results, results_dir=RESULTS_DIR):
+    os.makedirs(results_dir, exist_ok=True)
+    path = os.path.join(results_dir, f"{results['timestamp'].replace(':', '')}.json")
+    with open(path, 'w', encoding='utf-8') as results_file:
+        json.dump(results, results_file, indent=2)
+    return path
+
+
+def latest_results(results_dir=RESULTS_DIR, exclude=None):
+    paths = sorted(path for path in glob.glob(os.path.join(results_dir, '*.json')) if path != exclude)
+    if not paths:
+        return None
+    with open(paths[-1], encoding='utf-8') as results_file:
+        return json.load(results_file)
+
+
+def check_accuracy_floors(results, floors=ACCURACY_FLOORS):
+    """
+    Returns a message for every parser field whose accuracy is below its floor in ACCURACY_FLOORS.
+    """
+    failures = []
+    for name, result in results['parsers'].items():
+        for field, floor in floors.get(name, {}).items():
+            if result['accuracy'][field] < floor:
+                failures.append(f"{name} {field} accuracy {result['accuracy'][field]:.3f} is below {floor}")
+    return failures
+
+
+def print_report(results, baseline=None):
+    print(f"{'parser':<28}{'lines/s':>12}{'p50 ms':>10}{'p99 ms':>10}{'peak MB':>10}  accuracy")
+    for name, result in results['parsers'].items():
+        mean_accuracy = statistics.mean(result['accuracy'].values())
+        line = (f"{name:<28}{result['lines_per_sec']:>12}{result['p50_ms']:>10}{result['p99_ms']:>10}"
+                f"{result['peak_memory_mb'] if result['peak_memory_mb'] is not None else '-':>10}  {mean_accuracy:.3f}")
+        previous = baseline['parsers'].get(name) if baseline else None
+        if previous:
+            speed = result['lines_per_sec'] / previous['lines_per_sec'] - 1 if previous['lines_per_sec'] else 0
+            accuracy_change = mean_accuracy - statistics.mean(previous['accuracy'].values())
+            line += f"   ({speed:+.1%} speed, {accuracy_change:+.3f} accuracy vs {baseline['git_commit'] or baseline['timestamp']})"
+        print(line)
+        print('    ' + ', '.join(f'{field}={value:.3f}' for field, value in result['accuracy'].items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the reference parsers on a synthetic labelled corpus.')
+    parser.add_argument('--lines', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--styles', nargs='+', choices=STYLES, default=list(STYLES))
+    parser.add_argument('--adversarial-share', type=float, default=0.01)
+    parser.add_argument('--adversarial-length', type=int, default=2000)
+    parser.add_argument('--parsers', nargs='+', choices=sorted(PARSERS), default=list(PARSERS))
+    parser.add_argument('--latency-sample', type=int, default=1000, help='Number of lines timed one by one.')
+    parser.add_argument('--no-memory', action='store_true', help='Skip the traced run that measures peak memory.')
+    parser.add_argument('--results-dir', default=RESULTS_DIR)
+    parser.add_argument('--no-save', action='store_true')
+    parser.add_argument('--compare', action='store_true', help='Compare with the latest saved run.')
+    parser.add_argument('--regression', action='store_true',
+                        help='Run the pathological inputs under the parse time budget instead of the corpus.')
+    parser.add_argument('--budget', type=float, default=Config.PARSE_TIME_BUDGET or 2.0,
+                        help='Seconds per reference in --regression mode.')
+    parser.add_argument('--regression-scale', type=float, default=1.0,
+                        help='Size of the --regression inputs relative to their defaults.')
+    args = parser.parse_args()
+
+    if args.regression:
+        sys.exit(0 if run_regression(args.budget, args.regression_scale) else 1)
+
+    corpus = list(generate_corpus(args.lines, args.styles, args.seed, args.adversarial_share, args.adversarial_length))
+    results = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': _git_commit(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'corpus': {
+            'lines': args.lines, 'seed': args.seed, 'styles': args.styles,
+            'adversarial_share': args.adversarial_share, 'adversarial_length': args.adversarial_length,
+        },
+        'parsers': {},
+    }
+    for name in args.parsers:
+        adapter = PARSERS[name]()
+        results['parsers'][name] = run_parser(adapter, corpus, args.latency_sample, not args.no_memory)
+
+    baseline = latest_results(args.results_dir) if args.compare else None
+    print_report(results, baseline)
+    if not args.no_save:
+        print(f'Results saved to {save_results(results, args.results_dir)}')
+
+    failures = check_accuracy_floors(results)
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+import threading
+from collections import OrderedDict
+from flask import current_app, render_template, request, stream_template
+from sqlalchemy import event, func, select, text
+from db import db
+from models import Reference
+
+# Number of rendered bibliographies kept in memory per process
+BIBLIOGRAPHY_CACHE_SIZE = 64
+
+# Rendered pages longer than this (in characters) are not kept in memory
+MAX_CACHED_LENGTH = 5_000_000
+
+# Projects with more references than this are streamed to the client
+STREAM_THRESHOLD = 2000
+
+# Rows fetched from the database at a time while streaming
+STREAM_BATCH_SIZE = 500
+
+# Every insert, delete and update of a printed field bumps the project's revision,
+# whichever code path (ORM, bulk insert, import, background job) made the change.
+# Bulk statements fire the triggers once per row, which is cheap next to the row itself.
+REVISION_TRIGGERS_DDL = [
+    """
+    CREATE TRIGGER IF NOT EXISTS reference_revision_insert AFTER INSERT ON reference BEGIN
+        UPDATE project SET revision = revision + 1, updated_at = CURRENT_TIMESTAMP WHERE id = new.project_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS reference_revision_delete AFTER DELETE ON reference BEGIN
+        UPDATE project SET revision = revision + 1, updated_at = CURRENT_TIMESTAMP WHERE id = old.project_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS reference_revision_update
+    AFTER UPDATE OF author, title, journal, year, volume, issue, pages, doi, project_id ON reference BEGIN
+        UPDATE project SET revision = revision + 1, updated_at = CURRENT_TIMESTAMP
+        WHERE id IN (old.project_id, new.project_id);
+    END
+    """
+]
+
+
+def create_revision_triggers(connection):
+    """
+    Creates the triggers that keep Project.revision current if they do not exist yet.
+    """
+    for statement in REVISION_TRIGGERS_DDL:
+        connection.execute(text(statement))
+
+
+@event.listens_for(Reference.__table__, 'after_create')
+def _create_revision_triggers_with_table(target, connection, **kw):
+    create_revision_triggers(connection)
+
+
+class BibliographyCache:
+    """
+    Rendered print pages keyed by project id, each tagged with the project revision it was rendered at.
+
+    A lookup only succeeds for the project's current revision, so any change to
+    its references (seen through the revision triggers) invalidates the page in
+    every process without explicit notifications.
+    """
+
+    def __init__(self, max_entries=BIBLIOGRAPHY_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, project_id, revision):
+        with self.lock:
+            entry = self.entries.get(project_id)
+            if entry is None or entry[0] != revision:
+                return None
+            self.entries.move_to_end(project_id)
+            return entry[1]
+
+    def put(self, project_id, revision, page):
+        if len(page) > MAX_CACHED_LENGTH:
+            return
+        with self.lock:
+            self.entries[project_id] = (revision, page)
+            self.entries.move_to_end(project_id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+def _stream_and_store(chunks, cache, project_id, revision):
+    """
+    Passes rendered chunks through to the client and caches the whole page once it is complete.
+    """
+    parts = []
+    length = 0
+    for chunk in chunks:
+        yield chunk
+        if parts is not None:
+            parts.append(chunk)
+            length += len(chunk)
+            if length > MAX_CACHED_LENGTH:
+                parts = None
+    if parts is not None:
+        cache.put(project_id, revision, ''.join(parts))
+
+
+def render_bibliography(project, order_by, cache, template='print_references.html'):
+    """
+    Returns the print page of a project as a conditional response.
+
+    Browsers revalidate with If-None-Match / If-Modified-Since and get a 304 while
+    the project revision is unchanged. Otherwise the page comes from the cache or
+    is rendered, as a stream for projects with more than STREAM_THRESHOLD references.
+
+    Args:
+        project (Project): The project to print.
+        order_by (list): Order of the references.
+        cache (BibliographyCache): Cache of rendered pages.
+        template (str): Template rendered with 'project' and 'references'.
+
+    Returns:
+        Response: The page, or an empty 304 response.
+    """
+    not_modified = _validated(current_app.response_class(), project).make_conditional(request)
+    if not_modified.status_code == 304:
+        return not_modified
+
+    page = cache.get(project.id, project.revision)
+    if page is None:
+        query = select(Reference).where(Reference.project_id == project.id).order_by(*order_by)
+        count = db.session.scalar(select(func.count(Reference.id)).where(Reference.project_id == project.id))
+        if count > current_app.config.get('PRINT_STREAM_THRESHOLD', STREAM_THRESHOLD):
+            references = db.session.execute(query.execution_options(yield_per=STREAM_BATCH_SIZE)).scalars()
+            chunks = stream_template(template, project=project, references=references)
+            body = _stream_and_store(chunks, cache, project.id, project.revision)
+            return _validated(current_app.response_class(body, mimetype='text/html'), project)
+        page = render_template(template, project=project, references=db.session.execute(query).scalars().all())
+        cache.put(project.id, project.revision, page)
+    return _validated(current_app.response_class(page, mimetype='text/html'), project)
+
+
+def _validated(response, project):
+    """
+    Sets the validators of a project's print page: an ETag from its revision and Last-Modified.
+    """
+    response.set_etag(f'project-{project.id}-{project.revision}')
+    response.last_modified = project.updated_at
+    # Let caches store the page but revalidate it on every use
+    response.cache_control.no_cache = True
+    return response
@@ -0,0 +1,223 @@
+import re
+from collections import defaultdict
+from sqlalchemy import case, delete, select, update
+from db import db
+from models import Reference
+from dedup import check_references, forget_references
+
+# Fields a batch update may change, see Reference.to_dict()
+EDITABLE_FIELDS = ('author', 'title', 'journal', 'year', 'volume', 'issue', 'pages', 'doi', 'reviewed')
+
+# Fields that feed duplicate detection; changing one re-checks the reference
+DEDUP_FIELDS = ('title', 'year', 'doi')
+
+# A year of up to four digits, optionally with the letter parsers add to tell apart
+# works of one author in the same year (2009a)
+YEAR_VALUE = re.compile(r'\d{1,4}[a-z]?')
+
+# Maximum number of items accepted in one batch
+MAX_BATCH_SIZE = 5000
+
+# SQLite limits the number of bound parameters per statement, so very large
+# batches are split into several statements of this many rows
+STATEMENT_CHUNK_SIZE = 500
+
+
+class BatchError(ValueError):
+    """
+    Raised when a batch request is malformed as a whole.
+    """
+
+
+def _chunks(items, size=STATEMENT_CHUNK_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _validate_value(field, value):
+    """
+    Returns an error message for a field value, or None if it is acceptable.
+    """
+    column = Reference.__table__.c[field]
+    if value is None:
+        return None if column.nullable else f'{field} may not be null'
+    if field == 'reviewed':
+        return None if isinstance(value, bool) else 'reviewed must be true or false'
+    if field == 'year':
+        # Parsed years may carry a suffix such as 2009a; an empty string clears the year
+        if isinstance(value, int) and not isinstance(value, bool):
+            return None if 0 <= value <= 9999 else 'year must have at most four digits'
+        if isinstance(value, str) and (value == '' or YEAR_VALUE.fullmatch(value)):
+            return None
+        return 'year must be up to four digits with an optional letter, e.g. 2009a'
+    if not isinstance(value, str):
+        return f'{field} must be a string'
+    length = getattr(column.type, 'length', None)
+    if length and len(value) > length:
+        return f'{field} is longer than {length} characters'
+    return None
+
+
+def _item_id(item):
+    ref_id = item.get('id') if isinstance(item, dict) else item
+    if isinstance(ref_id, bool) or not isinstance(ref_id, int):
+        return None
+    return ref_id
+
+
+def _set_by_id(ids, column, values):
+    """
+    Builds "column = CASE id WHEN ... END" for the rows in ids, keeping the current value of other rows.
+    """
+    return case({ref_id: values[ref_id] for ref_id in ids if ref_id in values}, value=Reference.id, else_=column)
+
+
+def apply_batch(project_id, batch):
+    """
+    Applies a batch of updates, review toggles and deletes to the references of a project.
+
+    Every operation type runs as one set-based statement (split only for very large
+    batches), all inside the caller's transaction. Updated references are marked as
+    reviewed, as in edit_reference, unless the item sets 'reviewed' itself. Changes to
+    titles, years and DOIs, and deletions of references others were marked as
+    duplicates of, are re-checked for duplicates.
+
+    Args:
+        project_id (int): Project the references must belong to.
+        batch (dict): {'update': [{'id': 1, 'title': ...}, ...],
+                       'review': [1, {'id': 2, 'reviewed': False}, ...],
+                       'delete': [3, 4, ...]}
+
+    Returns:
+        list: One result per item, in request order: {'op', 'id', 'status'} plus
+        'error' for rejected items and 'reference' (Reference.to_dict()) for changed ones.
+    """
+    if not isinstance(batch, dict):
+        raise BatchError('Expected a JSON object with "update", "review" and/or "delete" lists')
+    operations = {op: batch.get(op) or [] for op in ('update', 'review', 'delete')}
+    for op, items in operations.items():
+        if not isinstance(items, list):
+            raise BatchError(f'"{op}" must be a list')
+    if sum(len(items) for items in operations.values()) > MAX_BATCH_SIZE:
+        raise BatchError(f'A batch may contain at most {MAX_BATCH_SIZE} items')
+
+    requested = {_item_id(item) for items in operations.values() for item in items} - {None}
+    existing = set()
+    for chunk in _chunks(requested):
+        existing.update(db.session.execute(
+            select(Reference.id).where(Reference.id.in_(chunk), Reference.project_id == project_id)
+        ).scalars())
+
+    results = []
+    changes = defaultdict(dict)   # field -> {id: value}
+    reviewed = {}                 # id -> reviewed flag from the review list
+    deleted = []
+
+    def accept(op, item, check):
+        ref_id = _item_id(item)
+        result = {'op': op, 'id': ref_id}
+        results.append(result)
+        if ref_id is None:
+            result.update(status='invalid', error='id must be an integer')
+        elif ref_id not in existing:
+            result.update(status='not_found', error=f'Reference {ref_id} is not in project {project_id}')
+        else:
+            error = check(ref_id, item)
+            if error:
+                result.update(status='invalid', error=error)
+            else:
+                result['status'] = 'ok'
+
+    def check_update(ref_id, item):
+        fields = {field: value for field, value in item.items() if field != 'id'}
+        unknown = sorted(set(fields) - set(EDITABLE_FIELDS))
+        if unknown:
+            return f"Unknown fields: {', '.join(unknown)}"
+        if not fields:
+            return 'No fields to update'
+        for field, value in fields.items():
+            error = _validate_value(field, value)
+            if error:
+                return error
+        if fields.get('year') == '':
+            fields['year'] = None
+        fields.setdefault('reviewed', True)
+        for field, value in fields.items():
+            changes[field][ref_id] = value
+        return None
+
+    def check_review(ref_id, item):
+        flag = item.get('reviewed', True) if isinstance(item, dict) else True
+        if not isinstance(flag, bool):
+            return 'reviewed must be true or false'
+        reviewed[ref_id] = flag
+        return None
+
+    def check_delete(ref_id, item):
+        deleted.append(ref_id)
+        return None
+
+    for item in operations['update']:
+        if not isinstance(item, dict):
+            results.append({'op': 'update', 'id': _item_id(item), 'status': 'invalid', 'error': 'Expected an object'})
+            continue
+        accept('update', item, check_update)
+    for item in operations['review']:
+        accept('review', item, check_review)
+    for item in operations['delete']:
+        accept('delete', item, check_delete)
+
+    # Updates: one UPDATE ... SET column = CASE id WHEN ... END per chunk of rows
+    updated_ids = sorted({ref_id for values in changes.values() for ref_id in values})
+    for chunk in _chunks(updated_ids):
+        # Only the fields some row of this chunk sets; a CASE without a WHEN is invalid SQL
+        values = {
+            field: _set_by_id(chunk, Reference.__table__.c[field], by_id)
+            for field, by_id in changes.items() if any(ref_id in by_id for ref_id in chunk)
+        }
+        if values:
+            db.session.execute(update(Reference.__table__).where(Reference.id.in_(chunk)).values(**values))
+
+    # Review toggles: a single CASE on the reviewed flag
+    review_ids = sorted(reviewed)
+    for chunk in _chunks(review_ids):
+        db.session.execute(
+            update(Reference.__table__)
+            .where(Reference.id.in_(chunk))
+            .values(reviewed=_set_by_id(chunk, Reference.__table__.c.reviewed, reviewed))
+        )
+
+    # Deletes: drop them from the duplicate index first, then one DELETE ... WHERE id IN (...)
+    deleted = sorted(set(deleted))
+    dependents = forget_references(deleted) if deleted else []
+    for chunk in _chunks(deleted):
+        db.session.execute(delete(Reference.__table__).where(Reference.id.in_(chunk)))
+
+    # Keep duplicate links current for edited references, the references marked as
+    # duplicates of them, and the ones whose original was deleted
+    recheck = {ref_id for field in DEDUP_FIELDS for ref_id in changes.get(field, {})}
+    for chunk in _chunks(recheck):
+        recheck.update(db.session.execute(select(Reference.id).where(Reference.duplicate_of.in_(chunk))).scalars())
+    recheck.update(dependents)
+    recheck.difference_update(deleted)
+    if recheck:
+        rows = []
+        for chunk in _chunks(sorted(recheck)):
+            rows.extend(db.session.execute(
+                select(Reference.id, Reference.title, Reference.year, Reference.doi).where(Reference.id.in_(chunk))
+            ).mappings())
+        check_references(project_id, [dict(row) for row in rows])
+
+    # Report the new state of every changed reference that still exists
+    changed = (set(updated_ids) | set(review_ids)) - set(deleted)
+    references = {}
+    for chunk in _chunks(changed):
+        for ref in db.session.execute(
+            select(Reference).where(Reference.id.in_(chunk)).execution_options(populate_existing=True)
+        ).scalars():
+            references[ref.id] = ref.to_dict()
+    for result in results:
+        if result['status'] == 'ok' and result['id'] in references:
+            result['reference'] = references[result['id']]
+    return results
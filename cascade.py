@@ -0,0 +1,222 @@
+import re
+from datetime import date
+from nlp_parser import nlp_parser, parser_version
+from reference_parser import ReferenceParser, BruteForceReferenceParser
+from parsed_reference import ParsedReference
+from reference_lexer import extract_fields, tokenize
+from sandbox import MAX_IDLE_SANDBOXES, run_isolated
+
+# Bumped when the cascade's own handling of the stage results changes, so cached results are redone
+CASCADE_VERSION = '2'
+
+# Parsers tried in order. Each one only sees the lines the previous ones were not confident about.
+DEFAULT_CASCADE = ('reference', 'brute_force', 'nlp')
+
+# Results scoring at least this are accepted without trying the next parser
+MIN_CONFIDENCE = 0.75
+
+# Weight of each core field in the confidence score; they sum to 1
+FIELD_WEIGHTS = {'authors': 0.3, 'year': 0.2, 'title': 0.3, 'container': 0.2}
+
+# Subtracted for an inconsistent volume, issue or pages value
+DETAIL_PENALTY = 0.15
+
+# Stages whose backtracking regexes run in a sandbox process when a time budget is set.
+# The NLP stage is linear in the line length and shares the preloaded model, so it stays in process.
+ISOLATED_STAGES = ('reference', 'brute_force')
+
+# Parser recorded for references given up on after exceeding the time budget
+TIMED_OUT = 'timeout'
+
+# Lines containing this have a DOI link, which score_reference does not check for
+DOI_MARKER = 'doi.org/'
+
+AUTHOR_NAME = re.compile(r"[^\W\d_][\w'\-]*, (?:[A-Z]\. ?)+")
+YEAR_VALUE = re.compile(r'^(\d{4})[a-z]?$')
+PAGE_RANGE = re.compile(r'^(\d+)(?:\s*[–—-]+\s*(\d+))?$')
+NUMBER = re.compile(r'^\d+[A-Za-z]?$')
+YEAR_IN_TEXT = re.compile(r'\(\d{4}[a-z]?\)')
+
+
+def _regex_stage(lines):
+    return [ReferenceParser(line).get_parsed_reference() for line in lines]
+
+
+def _brute_force_stage(lines):
+    return BruteForceReferenceParser('\n'.join(lines)).get_parsed_references()
+
+
+def _nlp_stage(lines, gazetteer_path=None):
+    # All fields, so the spaCy model fills the institution of the lines that get this far
+    return nlp_parser('\n'.join(lines), gazetteer_path=gazetteer_path)
+
+
+# Stage name -> function parsing a list of stripped, non-empty lines in one call
+STAGES = {
+    'reference': _regex_stage,
+    'brute_force': _brute_force_stage,
+    'nlp': _nlp_stage,
+}
+
+
+def score_reference(parsed):
+    """
+    Scores a parse by the coverage and plausibility of its fields.
+
+    Authors, year, title and a container (journal, book title or institution)
+    add their FIELD_WEIGHTS when present and consistent. Implausible volume,
+    issue or pages values subtract DETAIL_PENALTY.
+
+    Args:
+        parsed (ParsedReference): The parser output.
+
+    Returns:
+        tuple: (confidence between 0 and 1, list of problems found)
+    """
+    problems = []
+    confidence = 0.0
+
+    if not parsed.authors:
+        problems.append('no authors')
+    elif not AUTHOR_NAME.search(parsed.authors) or len(parsed.authors) > 1000:
+        problems.append('authors not in "Surname, I." form')
+    else:
+        confidence += FIELD_WEIGHTS['authors']
+
+    year = YEAR_VALUE.match(str(parsed.year).strip())
+    if not parsed.year:
+        problems.append('no year')
+    elif not year or not 1500 <= int(year.group(1)) <= date.today().year + 1:
+        problems.append('implausible year')
+    else:
+        confidence += FIELD_WEIGHTS['year']
+
+    if not parsed.title:
+        problems.append('no title')
+    elif len(parsed.title) > 300 or YEAR_IN_TEXT.search(parsed.title):
+        problems.append('title runs into other fields')
+    else:
+        confidence += FIELD_WEIGHTS['title']
+
+    container = parsed.journal or parsed.book_title or parsed.institution
+    if not container:
+        problems.append('no journal, book or institution')
+    elif len(container) > 200 or YEAR_IN_TEXT.search(container):
+        problems.append('container runs into other fields')
+    else:
+        confidence += FIELD_WEIGHTS['container']
+
+    for field in ('volume', 'issue'):
+        value = getattr(parsed, field)
+        if value and not NUMBER.match(value.strip()):
+            problems.append(f'non-numeric {field}')
+            confidence -= DETAIL_PENALTY
+    if parsed.pages:
+        pages = PAGE_RANGE.match(parsed.pages.strip())
+        if not pages or (pages.group(2) and int(pages.group(2)) < int(pages.group(1))):
+            problems.append('inconsistent pages')
+            confidence -= DETAIL_PENALTY
+
+    return round(max(confidence, 0.0), 2), problems
+
+
+class ParserCascade:
+    """
+    Parses references with the cheapest parser that is confident about them.
+
+    Every stage parses the lines still pending in one batch call; lines whose
+    best result reaches min_confidence are done, the others go to the next
+    stage. The expensive NLP stage therefore only sees the lines the compiled
+    regex parsers could not handle. Each result records the parser that won,
+    its confidence and the reason.
+
+    With a time budget the ISOLATED_STAGES run in a sandbox process (see
+    sandbox.run_isolated). A line that takes longer than the budget in any of
+    them is recorded as a TIMED_OUT failure and not tried by later stages; the
+    parse cache then keeps the failure, so the line is not parsed again.
+
+    Instances are plain data and can be sent to worker processes.
+    """
+
+    def __init__(self, stages=DEFAULT_CASCADE, min_confidence=MIN_CONFIDENCE, time_budget=None, gazetteer_path=None,
+                 max_idle_sandboxes=MAX_IDLE_SANDBOXES):
+        """
+        Args:
+            stages (iterable): Names from STAGES, in the order they are tried.
+            min_confidence (float): Score at which a result is accepted.
+            time_budget (float, optional): Seconds a line may spend in one isolated stage. None or 0 runs
+                every stage in process without a limit.
+            gazetteer_path (str, optional): Gazetteer used by the NLP stage, see gazetteer.get_gazetteer.
+            max_idle_sandboxes (int): Sandbox processes kept for reuse between calls with a time budget.
+        """
+        self.stages = tuple(stages)
+        unknown = [name for name in self.stages if name not in STAGES]
+        if unknown or not self.stages:
+            raise ValueError(f"Unknown or empty parser cascade {self.stages}; choose from {', '.join(STAGES)}")
+        self.min_confidence = float(min_confidence)
+        self.time_budget = float(time_budget) if time_budget else None
+        self.gazetteer_path = gazetteer_path or None
+        self.max_idle_sandboxes = int(max_idle_sandboxes)
+
+    @property
+    def version(self):
+        """
+        Version tag for the parse cache: results change with the parsers, the stages, the threshold,
+        the time budget and the gazetteer.
+        """
+        version = f"cascade{CASCADE_VERSION}-{parser_version(self.gazetteer_path)}:{','.join(self.stages)}@{self.min_confidence}"
+        return f'{version}/{self.time_budget}s' if self.time_budget else version
+
+    def __call__(self, reference_string):
+        """
+        Parses newline separated references like nlp_parser and returns one ParsedReference per non-empty line.
+        """
+        return self.parse_lines([ref.strip() for ref in reference_string.split('\n') if ref.strip()])
+
+    def parse_lines(self, lines):
+        best = [None] * len(lines)
+        scores = [(-1.0, [])] * len(lines)
+        pending = list(range(len(lines)))
+
+        for name in self.stages:
+            if not pending:
+                break
+            batch = [lines[index] for index in pending]
+            if self.time_budget and name in ISOLATED_STAGES:
+                results = run_isolated(name, STAGES[name], batch, self.time_budget, self.max_idle_sandboxes)
+            elif name == 'nlp':
+                results = STAGES[name](batch, gazetteer_path=self.gazetteer_path)
+            else:
+                results = STAGES[name](batch)
+            still_pending = []
+            for index, parsed in zip(pending, results):
+                if parsed is None:
+                    # Over the time budget: a failure, not passed on to the later stages
+                    best[index] = ParsedReference(
+                        original_string=lines[index], parser=TIMED_OUT,
+                        parse_reason=f'{name} parser exceeded the {self.time_budget} s time budget; not retried'
+                    )
+                    continue
+                confidence, problems = score_reference(parsed)
+                if confidence > scores[index][0]:
+                    parsed.parser = name
+                    parsed.confidence = confidence
+                    best[index] = parsed
+                    scores[index] = (confidence, problems)
+                if confidence >= self.min_confidence:
+                    best[index].parse_reason = ', '.join(problems) or 'all checks passed'
+                else:
+                    still_pending.append(index)
+            pending = still_pending
+
+        # Nothing reached the threshold: keep the best attempt and say why
+        for index in pending:
+            confidence, problems = scores[index]
+            best[index].parse_reason = f"below {self.min_confidence} after {', '.join(self.stages)}: {', '.join(problems)}"
+
+        # The regex patterns drop a DOI that does not follow their exact layout (e.g. after ". "),
+        # and a result can be confident without one; the lexer finds it in a single pass
+        for index, parsed in enumerate(best):
+            if not parsed.doi and parsed.parser != TIMED_OUT and DOI_MARKER in lines[index]:
+                parsed.doi = extract_fields(lines[index], tokenize(lines[index])).get('doi', parsed.doi)
+        return best
@@ -0,0 +1,90 @@
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func, select
+from db import db
+from dedup import find_duplicate_clusters, index_unindexed_references
+from search import rebuild_search_index
+from summary import reconcile_summaries
+from upgrade import upgrade_database
+from reparse import REPARSE_CHUNK_SIZE, reparse_references, stale_references
+
+
+@click.command('upgrade-db')
+@with_appcontext
+def upgrade_db_command():
+    """Add the columns, tables, indexes and triggers an older database lacks, keeping its data."""
+    changes = upgrade_database()
+    for change in changes:
+        click.echo(change)
+    click.echo('Database is up to date.' if not changes else f'{len(changes)} changes made.')
+
+
+@click.command('rebuild-search-index')
+@with_appcontext
+def rebuild_search_index_command():
+    """Create the full-text search index if needed and refill it from all references."""
+    rebuild_search_index()
+    click.echo('Search index rebuilt.')
+
+
+@click.command('reconcile-summaries')
+@with_appcontext
+def reconcile_summaries_command():
+    """Create the project summary table if needed and recompute every project's summary."""
+    stale = reconcile_summaries()
+    click.echo(f'Project summaries rebuilt; {stale} were out of date.')
+
+
+@click.command('find-duplicates')
+@click.option('--project-id', type=int, help='Only look inside this project.')
+@with_appcontext
+def find_duplicates_command(project_id):
+    """Index references for duplicate detection and print the duplicate clusters."""
+    indexed = index_unindexed_references(project_id)
+    db.session.commit()
+    if indexed:
+        click.echo(f'{indexed} references indexed.')
+    clusters = find_duplicate_clusters(project_id)
+    for cluster in clusters:
+        click.echo(f"{', '.join(str(ref_id) for ref_id in cluster['ids'])} ({', '.join(cluster['reasons'])})")
+    click.echo(f'{len(clusters)} duplicate clusters found.')
+
+
+@click.command('reparse')
+@click.option('--project-id', type=int, help='Only re-parse this project.')
+@click.option('--chunk-size', type=int, default=REPARSE_CHUNK_SIZE, show_default=True,
+              help='References parsed and committed together.')
+@click.option('--workers', type=int, help='Number of parser processes (default: one per CPU).')
+@click.option('--dry-run', is_flag=True, help='Only count the references that would be re-parsed.')
+@with_appcontext
+def reparse_command(project_id, chunk_size, workers, dry_run):
+    """Re-parse unreviewed references produced by an older parser version.
+
+    Safe to interrupt: every chunk is committed on its own and the next run
+    continues with the references that still have an older version.
+    """
+    from routes import get_parse_cache
+    cache = get_parse_cache()
+    if dry_run:
+        count = db.session.execute(
+            select(func.count()).select_from(stale_references(cache.version, project_id).subquery())
+        ).scalar()
+        click.echo(f'{count} references would be re-parsed with {cache.version}.')
+        return
+
+    progress = None
+    for progress in reparse_references(cache, project_id, chunk_size, workers):
+        if not progress['done']:
+            click.echo(f"{progress['reparsed']} re-parsed, {progress['changed']} changed (up to id {progress['last_id']})")
+    click.echo(f"Re-parsed {progress['reparsed']} references with {cache.version}; {progress['changed']} changed.")
+
+
+def register_commands(app):
+    """
+    Registers the maintenance commands with the flask CLI.
+    """
+    app.cli.add_command(upgrade_db_command)
+    app.cli.add_command(rebuild_search_index_command)
+    app.cli.add_command(reconcile_summaries_command)
+    app.cli.add_command(find_duplicates_command)
+    app.cli.add_command(reparse_command)
@@ -0,0 +1,70 @@
+import os
+
+
+class Config:
+    """
+    Settings shared by every environment. Values can be overridden with environment variables.
+    """
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///references.db')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # SQLite connections run in WAL mode with the pragmas in db.SQLITE_PRAGMAS; 0 keeps SQLite's defaults
+    SQLITE_TUNING = os.environ.get('SQLITE_TUNING', '1') == '1'
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+
+    # Connections kept open per process, extra ones allowed under load, and seconds to wait for one.
+    # Size the pool for the request threads (GUNICORN_THREADS) plus the write queue's thread.
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '10'))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', '5'))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '30'))
+
+    # Reference additions and edits are committed by one thread per process, up to WRITE_BATCH_MAX_SIZE
+    # per transaction, waiting at most WRITE_BATCH_MAX_LATENCY_MS for more; requests get 429 while
+    # WRITE_QUEUE_MAX writes are waiting. 0 commits every request on its own connection.
+    WRITE_QUEUE_ENABLED = os.environ.get('WRITE_QUEUE', '1') == '1'
+    WRITE_BATCH_MAX_SIZE = int(os.environ.get('WRITE_BATCH_MAX_SIZE', '32'))
+    WRITE_BATCH_MAX_LATENCY_MS = float(os.environ.get('WRITE_BATCH_MAX_LATENCY_MS', '0'))
+    WRITE_QUEUE_MAX = int(os.environ.get('WRITE_QUEUE_MAX', '256'))
+
+    # Record parser and database timings for /metrics. Read when the app starts, so every
+    # worker process records the same metrics; restart the workers to change it
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '0') == '1'
+
+    # Load the spaCy model while creating the app instead of on the first parse.
+    # gunicorn.conf.py preloads it in the master process regardless.
+    PRELOAD_MODEL = os.environ.get('PRELOAD_MODEL', '0') == '1'
+
+    # Parsers tried in order for pasted and imported references (see cascade.STAGES), and
+    # the confidence at which a result is accepted instead of trying the next one
+    PARSER_CASCADE = tuple(os.environ.get('PARSER_CASCADE', 'reference,brute_force,nlp').split(','))
+    PARSER_MIN_CONFIDENCE = float(os.environ.get('PARSER_MIN_CONFIDENCE', '0.75'))
+
+    # Seconds one reference may spend in a regex stage of the cascade before it is given up on
+    # (the stages then run in a sandbox process that is killed on overrun); 0 turns the limit off
+    PARSE_TIME_BUDGET = float(os.environ.get('PARSE_TIME_BUDGET', '2'))
+
+    # Idle sandbox processes kept per worker for the next parse; the ones started for
+    # more concurrent parses than this are stopped once they finish
+    PARSE_SANDBOX_POOL_SIZE = int(os.environ.get('PARSE_SANDBOX_POOL_SIZE', '4'))
+
+    # Compiled gazetteer used by nlp_parser to fill journal and institution; empty turns it off.
+    # Build one with: python gazetteer.py --journals journals.txt --institutions institutions.txt -o gazetteer.bin
+    GAZETTEER_PATH = os.environ.get('GAZETTEER_PATH', '')
+
+    # /api/parse collects concurrent requests into one parser call: a batch starts once it
+    # holds PARSE_BATCH_MAX_SIZE lines or its oldest request has waited PARSE_BATCH_MAX_LATENCY_MS,
+    # and requests are answered with 429 while PARSE_QUEUE_MAX lines are waiting
+    PARSE_BATCH_MAX_SIZE = int(os.environ.get('PARSE_BATCH_MAX_SIZE', '64'))
+    PARSE_BATCH_MAX_LATENCY_MS = float(os.environ.get('PARSE_BATCH_MAX_LATENCY_MS', '5'))
+    PARSE_QUEUE_MAX = int(os.environ.get('PARSE_QUEUE_MAX', '1024'))
+
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+
+
+class ProductionConfig(Config):
+    DEBUG = False
+    TESTING = False
+    SECRET_KEY = os.environ.get('SECRET_KEY')
+    SQLALCHEMY_ENGINE_OPTIONS = {'pool_pre_ping': True}
@@ -1,4 +1,56 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
 
 # Initialize the database
 db = SQLAlchemy()
+
+# Set on every new SQLite connection when SQLITE_TUNING is on
+SQLITE_PRAGMAS = {
+    # Readers keep reading a snapshot while one writer appends to the log, instead of blocking each other
+    'journal_mode': 'WAL',
+    # With WAL only checkpoints wait for the disk; a power cut can lose the last commits but not corrupt the file
+    'synchronous': 'NORMAL',
+    # Milliseconds to wait for another connection's write lock before failing with "database is locked"
+    'busy_timeout': 5000,
+    # Page cache per connection, in KiB when negative
+    'cache_size': -65536,
+    # Bytes of the file read through a memory map instead of read() calls
+    'mmap_size': 268435456,
+}
+
+
+def _is_memory_database(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def engine_options(config):
+    """
+    Returns SQLALCHEMY_ENGINE_OPTIONS with the pool sized by DB_POOL_SIZE, DB_MAX_OVERFLOW and DB_POOL_TIMEOUT.
+
+    In-memory SQLite databases keep SQLAlchemy's single-connection pool, which takes no sizing.
+    """
+    options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    if not _is_memory_database(config['SQLALCHEMY_DATABASE_URI']):
+        for option, key in (('pool_size', 'DB_POOL_SIZE'), ('max_overflow', 'DB_MAX_OVERFLOW'), ('pool_timeout', 'DB_POOL_TIMEOUT')):
+            if config.get(key) is not None:
+                options.setdefault(option, config[key])
+    return options
+
+
+def configure_engine(engine, config):
+    """
+    Sets SQLITE_PRAGMAS, with busy_timeout from SQLITE_BUSY_TIMEOUT_MS, on every connection
+    the engine opens. Does nothing for other databases or when SQLITE_TUNING is off.
+    """
+    if engine.dialect.name != 'sqlite' or not config.get('SQLITE_TUNING', True):
+        return
+    pragmas = dict(SQLITE_PRAGMAS, busy_timeout=config.get('SQLITE_BUSY_TIMEOUT_MS', SQLITE_PRAGMAS['busy_timeout']))
+
+    @event.listens_for(engine, 'connect')
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        cursor.close()
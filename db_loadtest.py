@@ -0,0 +1,174 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+# References in the test database before the workers start
+SEED_REFERENCES = 2000
+
+# References read per listing request
+READ_PAGE_SIZE = 50
+
+# Settings of the "baseline" run: SQLite's defaults and one transaction per request
+BASELINE_SETTINGS = {'SQLITE_TUNING': False, 'WRITE_QUEUE_ENABLED': False}
+
+
+def _make_app(database, settings):
+    from app import create_app
+    from config import Config
+
+    class LoadTestConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + database
+
+    for key, value in settings.items():
+        setattr(LoadTestConfig, key, value)
+    return create_app(LoadTestConfig)
+
+
+def _seed(database, settings, references):
+    from db import db
+    from models import Project, Reference
+
+    app = _make_app(database, settings)
+    with app.app_context():
+        db.create_all()
+        project = Project(name='load test')
+        db.session.add(project)
+        db.session.flush()
+        db.session.add_all(
+            Reference(project_id=project.id, author=f'Author {index % 300}, A.', title=f'Title {index}',
+                      journal='Journal of Testing', year=str(1950 + index % 75))
+            for index in range(references)
+        )
+        db.session.commit()
+        return project.id
+
+
+def _worker(database, settings, project_id, threads, duration, write_share, seed, start, results):
+    """
+    Runs in a spawned process: sends a mix of listing reads and reference edits and additions
+    through the app from several threads until duration has passed.
+    """
+    logging.disable(logging.CRITICAL)
+    app = _make_app(database, settings)
+    counts = {'reads': 0, 'writes': 0, 'read_errors': 0, 'write_errors': 0}
+    latencies = {'read': [], 'write': []}
+    lock = threading.Lock()
+
+    def client(thread_seed):
+        rng = random.Random(thread_seed)
+        client = app.test_client()
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            if rng.random() < write_share:
+                kind = 'write'
+                began = time.perf_counter()
+                fields = {'author': f'Author {rng.randrange(300)}, B.', 'title': f'Edited {rng.random()}',
+                          'journal': 'Journal of Testing', 'year': str(rng.randint(1950, 2024)), 'doi': ''}
+                if rng.random() < 0.5:
+                    response = client.post(f'/project/{project_id}/add_reference', data=fields)
+                else:
+                    fields.update(volume='1', issue='2', pages='3')
+                    ref_id = rng.randint(1, SEED_REFERENCES)
+                    response = client.post(f'/project/{project_id}/edit_reference/{ref_id}', data=fields)
+            else:
+                kind = 'read'
+                began = time.perf_counter()
+                response = client.get(f'/project/{project_id}/references.json?limit={READ_PAGE_SIZE}')
+            elapsed = time.perf_counter() - began
+            ok = response.status_code < 400
+            with lock:
+                counts[kind + 's' if ok else kind + '_errors'] += 1
+                if ok:
+                    latencies[kind].append(elapsed)
+
+    workers = [threading.Thread(target=client, args=(seed * 1000 + index,)) for index in range(threads)]
+    start.wait()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    results.put((counts, latencies))
+
+
+def run(name, settings, processes, threads, duration, write_share, references=SEED_REFERENCES):
+    """
+    Runs the load test against a fresh database file.
+
+    Returns:
+        dict: Reads and writes per second over all processes, errors and latencies.
+    """
+    directory = tempfile.mkdtemp(prefix='db-loadtest-')
+    database = os.path.join(directory, 'references.db')
+    project_id = _seed(database, settings, references)
+
+    context = multiprocessing.get_context('spawn')
+    start = context.Event()
+    results = context.Queue()
+    workers = [
+        context.Process(target=_worker, args=(database, settings, project_id, threads, duration, write_share, seed, start, results))
+        for seed in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    # Give every process time to import the app before the clock starts
+    time.sleep(min(30, 2 + processes))
+    start.set()
+    totals = {'reads': 0, 'writes': 0, 'read_errors': 0, 'write_errors': 0}
+    latencies = {'read': [], 'write': []}
+    for _ in workers:
+        counts, worker_latencies = results.get()
+        for key, value in counts.items():
+            totals[key] += value
+        for kind, values in worker_latencies.items():
+            latencies[kind].extend(values)
+    for worker in workers:
+        worker.join()
+
+    result = {
+        'run': name,
+        'processes': processes,
+        'threads': threads,
+        'reads_per_second': round(totals['reads'] / duration, 1),
+        'writes_per_second': round(totals['writes'] / duration, 1),
+        'read_errors': totals['read_errors'],
+        'write_errors': totals['write_errors'],
+    }
+    for kind, values in latencies.items():
+        if values:
+            values.sort()
+            result[f'{kind}_p50_ms'] = round(statistics.median(values) * 1000, 1)
+            result[f'{kind}_p99_ms'] = round(values[int(0.99 * (len(values) - 1))] * 1000, 1)
+    for path in os.listdir(directory):
+        os.remove(os.path.join(directory, path))
+    os.rmdir(directory)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Load test the database with concurrent worker processes reading and writing references.'
+    )
+    parser.add_argument('--processes', type=int, default=4, help='Worker processes, like gunicorn workers.')
+    parser.add_argument('--threads', type=int, default=4, help='Request threads per process.')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds each run lasts.')
+    parser.add_argument('--write-share', type=float, default=0.3, help='Fraction of requests that write.')
+    parser.add_argument('--compare', action='store_true',
+                        help='Also run with SQLite defaults and one transaction per request.')
+    args = parser.parse_args()
+
+    runs = [('tuned', {})]
+    if args.compare:
+        runs.insert(0, ('baseline', BASELINE_SETTINGS))
+    for name, settings in runs:
+        print(json.dumps(run(name, settings, args.processes, args.threads, args.duration, args.write_share)))
+
+
+if __name__ == '__main__':
+    main()
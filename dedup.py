@@ -0,0 +1,372 @@
+import hashlib
+import random
+import re
+import unicodedata
+from collections import defaultdict
+from sqlalchemy import delete, insert, select, update
+from db import db
+from models import Reference, ReferenceBand
+
+# MinHash LSH layout: NUM_BANDS bands of BAND_ROWS rows. Two titles become
+# candidates when one band matches, which happens with probability
+# 1 - (1 - j^BAND_ROWS)^NUM_BANDS for a Jaccard similarity j (about 0.5 at j=0.6).
+NUM_BANDS = 8
+BAND_ROWS = 4
+SHINGLE_SIZE = 3
+
+# Candidates are confirmed when the Jaccard similarity of their title shingles reaches this
+NEAR_DUPLICATE_THRESHOLD = 0.8
+
+# Titles shorter than this (after normalization) are too generic for the near-duplicate tier
+MIN_TITLE_LENGTH = 12
+
+# Buckets with more members than this are only compared against their first members
+MAX_BUCKET_SIZE = 50
+
+# SQLite limits the number of bound parameters per statement
+QUERY_CHUNK_SIZE = 500
+
+_MERSENNE_PRIME = (1 << 61) - 1
+# Fixed seed: signatures must be identical across processes and restarts
+_random = random.Random(20241018)
+_PERMUTATIONS = [
+    (_random.randrange(1, _MERSENNE_PRIME), _random.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_BANDS * BAND_ROWS)
+]
+
+DOI_PREFIX = re.compile(r'^(?:https?://)?(?:dx\.)?(?:doi\.org/)?(?:doi:\s*)?', re.IGNORECASE)
+NON_ALPHANUMERIC = re.compile(r'[^0-9a-z]+')
+YEAR = re.compile(r'\d{4}')
+
+
+def normalize_doi(doi):
+    """
+    Returns the bare, lower-case DOI ("10.1000/xyz") for any of its usual spellings, or ''.
+    """
+    if not doi:
+        return ''
+    doi = DOI_PREFIX.sub('', doi.strip()).rstrip('.,;)').lower()
+    return doi if doi.startswith('10.') else ''
+
+
+def normalize_title(title):
+    """
+    Lower-cases a title and strips accents, punctuation and spacing differences.
+    """
+    if not title:
+        return ''
+    title = unicodedata.normalize('NFKD', title).encode('ascii', 'ignore').decode('ascii').lower()
+    return NON_ALPHANUMERIC.sub(' ', title).strip()
+
+
+def normalize_year(year):
+    match = YEAR.search(str(year)) if year is not None else None
+    return match.group(0) if match else ''
+
+
+def title_key(title, year):
+    """
+    Returns the exact-duplicate key for a title and year, or '' for an empty title.
+    """
+    normalized = normalize_title(title).replace(' ', '')
+    return f'{normalized}:{normalize_year(year)}' if normalized else ''
+
+
+def shingles(normalized_title):
+    text = normalized_title.replace(' ', '')
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def band_hashes(shingle_set):
+    """
+    Computes the MinHash signature of a shingle set and returns one 63-bit hash per LSH band.
+    """
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=8).digest(), 'little') for s in shingle_set]
+    signature = [min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS]
+    bands = []
+    for index in range(NUM_BANDS):
+        rows = signature[index * BAND_ROWS:(index + 1) * BAND_ROWS]
+        digest = hashlib.blake2b(repr((index, rows)).encode('ascii'), digest_size=8).digest()
+        bands.append(int.from_bytes(digest, 'little') >> 1)
+    return bands
+
+
+def jaccard(first, second):
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+class Fingerprint:
+    """
+    Everything the duplicate tiers need to know about one reference.
+    """
+    __slots__ = ('id', 'project_id', 'year', 'doi_key', 'title_key', 'shingles', 'bands')
+
+    def __init__(self, id, project_id, title, year, doi):
+        self.id = id
+        self.project_id = project_id
+        self.year = normalize_year(year)
+        self.doi_key = normalize_doi(doi)
+        self.title_key = title_key(title, year)
+        normalized = normalize_title(title)
+        if len(normalized.replace(' ', '')) >= MIN_TITLE_LENGTH:
+            self.shingles = shingles(normalized)
+            self.bands = band_hashes(self.shingles)
+        else:
+            self.shingles = set()
+            self.bands = []
+
+    def is_near_duplicate(self, other):
+        # Different years usually mean a different edition or paper
+        if self.year and other.year and self.year != other.year:
+            return False
+        return jaccard(self.shingles, other.shingles) >= NEAR_DUPLICATE_THRESHOLD
+
+
+def _chunks(items, size=QUERY_CHUNK_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _fingerprints(ids):
+    """
+    Loads fingerprints for the given reference ids.
+    """
+    fingerprints = {}
+    for chunk in _chunks(ids):
+        rows = db.session.execute(
+            select(Reference.id, Reference.project_id, Reference.title, Reference.year, Reference.doi)
+            .where(Reference.id.in_(chunk))
+        )
+        for row in rows:
+            fingerprints[row.id] = Fingerprint(*row)
+    return fingerprints
+
+
+def index_references(fingerprints):
+    """
+    Stores the exact keys and the LSH bands of the given fingerprints.
+    """
+    fingerprints = list(fingerprints)
+    if not fingerprints:
+        return
+    for chunk in _chunks([fp.id for fp in fingerprints]):
+        db.session.execute(delete(ReferenceBand).where(ReferenceBand.reference_id.in_(chunk)))
+    db.session.execute(
+        update(Reference),
+        [{'id': fp.id, 'doi_key': fp.doi_key, 'title_key': fp.title_key} for fp in fingerprints]
+    )
+    bands = [
+        {'reference_id': fp.id, 'band': band, 'project_id': fp.project_id}
+        for fp in fingerprints for band in dict.fromkeys(fp.bands)
+    ]
+    if bands:
+        db.session.execute(insert(ReferenceBand), bands)
+
+
+def check_references(project_id, refs):
+    """
+    Indexes new or edited references of a project and links every one of them to the
+    oldest earlier reference of the same project it duplicates.
+
+    The exact tier matches normalized DOIs and normalized title/year keys through
+    their indexes. The near-duplicate tier only compares references that share an
+    LSH band of their title MinHash, so the work grows with the number of
+    references checked, not with the size of the project.
+
+    Args:
+        project_id (int): Project the references belong to.
+        refs (iterable): Objects or mappings with id, title, year and doi.
+
+    Returns:
+        dict: Reference id -> id of the reference it duplicates, for duplicates only.
+    """
+    fingerprints = {}
+    for ref in refs:
+        if isinstance(ref, dict):
+            fp = Fingerprint(ref['id'], project_id, ref.get('title'), ref.get('year'), ref.get('doi'))
+        else:
+            fp = Fingerprint(ref.id, project_id, ref.title, ref.year, ref.doi)
+        fingerprints[fp.id] = fp
+    if not fingerprints:
+        return {}
+    index_references(fingerprints.values())
+
+    matches = {}
+
+    def link(ref_id, other_id):
+        if other_id < ref_id and other_id < matches.get(ref_id, ref_id):
+            matches[ref_id] = other_id
+
+    # Exact tier: same normalized DOI or same normalized title and year
+    doi_keys = {fp.doi_key for fp in fingerprints.values() if fp.doi_key}
+    title_keys = {fp.title_key for fp in fingerprints.values() if fp.title_key}
+    by_doi = defaultdict(list)
+    by_title = defaultdict(list)
+    for column, keys, found in ((Reference.doi_key, doi_keys, by_doi), (Reference.title_key, title_keys, by_title)):
+        for chunk in _chunks(keys):
+            rows = db.session.execute(
+                select(Reference.id, column).where(Reference.project_id == project_id, column.in_(chunk))
+            )
+            for ref_id, key in rows:
+                found[key].append(ref_id)
+    for fp in fingerprints.values():
+        for other_id in by_doi.get(fp.doi_key, []) + by_title.get(fp.title_key, []):
+            link(fp.id, other_id)
+
+    # Near-duplicate tier: references sharing at least one LSH band
+    wanted = defaultdict(set)
+    for fp in fingerprints.values():
+        for band in fp.bands:
+            wanted[band].add(fp.id)
+    candidates = defaultdict(set)
+    for chunk in _chunks(wanted):
+        rows = db.session.execute(
+            select(ReferenceBand.band, ReferenceBand.reference_id)
+            .where(ReferenceBand.band.in_(chunk), ReferenceBand.project_id == project_id)
+        )
+        for band, other_id in rows:
+            for ref_id in wanted[band]:
+                if other_id < ref_id:
+                    candidates[ref_id].add(other_id)
+
+    others = _fingerprints({other_id for ids in candidates.values() for other_id in ids} - set(fingerprints))
+    others.update(fingerprints)
+    for ref_id, other_ids in candidates.items():
+        for other_id in sorted(other_ids):
+            if other_id >= matches.get(ref_id, ref_id):
+                break
+            if other_id in others and fingerprints[ref_id].is_near_duplicate(others[other_id]):
+                link(ref_id, other_id)
+                break
+
+    db.session.execute(
+        update(Reference),
+        [{'id': ref_id, 'duplicate_of': matches.get(ref_id)} for ref_id in fingerprints]
+    )
+    return matches
+
+
+def forget_references(ref_ids):
+    """
+    Removes references from the duplicate index before they are deleted.
+
+    Returns:
+        list: Ids of the remaining references that were marked as duplicates of them,
+        so they can be checked again.
+    """
+    dependents = []
+    for chunk in _chunks(ref_ids):
+        db.session.execute(delete(ReferenceBand).where(ReferenceBand.reference_id.in_(chunk)))
+        dependents.extend(db.session.execute(
+            update(Reference)
+            .where(Reference.duplicate_of.in_(chunk))
+            .values(duplicate_of=None)
+            .returning(Reference.id)
+        ).scalars())
+    deleted = set(ref_ids)
+    return [ref_id for ref_id in dependents if ref_id not in deleted]
+
+
+class _UnionFind:
+
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, item):
+        root = self.parent.setdefault(item, item)
+        while root != self.parent[root]:
+            root = self.parent[root]
+        while item != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, first, second):
+        first, second = self.find(first), self.find(second)
+        if first != second:
+            self.parent[max(first, second)] = min(first, second)
+
+
+def index_unindexed_references(project_id=None):
+    """
+    Indexes the references of one project, or of all projects, that were stored before
+    duplicate detection existed. Every write path indexes the references it stores.
+
+    Returns:
+        int: Number of references indexed.
+    """
+    scope = [Reference.project_id == project_id] if project_id is not None else []
+    indexed = 0
+    while True:
+        ids = db.session.execute(
+            select(Reference.id).where(Reference.title_key.is_(None), *scope).limit(QUERY_CHUNK_SIZE * 10)
+        ).scalars().all()
+        if not ids:
+            return indexed
+        index_references(_fingerprints(ids).values())
+        indexed += len(ids)
+
+
+def find_duplicate_clusters(project_id=None):
+    """
+    Groups all duplicate references of one project, or of all projects, into clusters.
+
+    Only reads: references that were never indexed (see index_unindexed_references) are
+    left out. Exact duplicates come from
+    GROUP BY over the key indexes and near duplicates from references sharing an LSH
+    band, so no pairwise comparison over the whole project is needed.
+
+    Args:
+        project_id (int, optional): Limit the search to one project.
+
+    Returns:
+        list: Clusters as dictionaries with the member 'ids' (oldest first) and the 'reasons' found.
+    """
+    scope = [Reference.project_id == project_id] if project_id is not None else []
+    clusters = _UnionFind()
+    reasons = defaultdict(set)
+
+    for column, reason in ((Reference.doi_key, 'doi'), (Reference.title_key, 'title')):
+        rows = db.session.execute(
+            select(column, db.func.group_concat(Reference.id))
+            .where(column != '', *scope)
+            .group_by(column)
+            .having(db.func.count() > 1)
+        )
+        for _, ids in rows:
+            ids = sorted(int(ref_id) for ref_id in ids.split(','))
+            for ref_id in ids:
+                clusters.union(ids[0], ref_id)
+                reasons[ref_id].add(reason)
+
+    band_scope = [ReferenceBand.project_id == project_id] if project_id is not None else []
+    buckets = db.session.execute(
+        select(db.func.group_concat(ReferenceBand.reference_id))
+        .where(*band_scope)
+        .group_by(ReferenceBand.band)
+        .having(db.func.count() > 1)
+    ).scalars().all()
+    buckets = [sorted(int(ref_id) for ref_id in bucket.split(',')) for bucket in buckets]
+    fingerprints = _fingerprints({ref_id for bucket in buckets for ref_id in bucket})
+    for bucket in buckets:
+        bucket = [ref_id for ref_id in bucket if ref_id in fingerprints]
+        for position, ref_id in enumerate(bucket):
+            for other_id in bucket[:min(position, MAX_BUCKET_SIZE)]:
+                if clusters.find(ref_id) == clusters.find(other_id):
+                    break
+                if fingerprints[ref_id].is_near_duplicate(fingerprints[other_id]):
+                    clusters.union(other_id, ref_id)
+                    reasons[ref_id].add('similar_title')
+                    reasons[other_id].add('similar_title')
+                    break
+
+    members = defaultdict(list)
+    for ref_id in list(clusters.parent):
+        members[clusters.find(ref_id)].append(ref_id)
+    return [
+        {'ids': sorted(ids), 'reasons': sorted(set().union(*(reasons[ref_id] for ref_id in ids)))}
+        for _, ids in sorted(members.items())
+        if len(ids) > 1
+    ]
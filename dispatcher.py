@@ -0,0 +1,139 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from metrics import Counter, Histogram, metrics_enabled
+
+# Default batching settings, see ParseDispatcher
+MAX_BATCH_SIZE = 64
+MAX_LATENCY = 0.005
+MAX_QUEUE = 1024
+
+PARSE_BATCH_LINES = Histogram(
+    'reference_parse_batch_lines', 'Lines parsed together by the parse dispatcher.', (),
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+PARSE_QUEUE_SECONDS = Histogram(
+    'reference_parse_queue_seconds', 'Time a parse request waited for its batch to start.'
+)
+PARSE_REJECTED = Counter(
+    'reference_parse_rejected_total', 'Parse requests refused because the dispatcher queue was full.'
+)
+
+
+class QueueFull(Exception):
+    """
+    Raised by ParseDispatcher.submit when accepting the request would exceed the queue bound.
+    """
+
+
+class _Request:
+    __slots__ = ('lines', 'future', 'queued_at')
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.future = Future()
+        self.queued_at = time.monotonic()
+
+
+class ParseDispatcher:
+    """
+    Collects the lines of concurrent parse requests into batches for a single parse call.
+
+    A background thread waits for the first request, then keeps collecting for at
+    most max_latency seconds (or until max_batch_size lines are queued), parses all
+    collected lines with one call and hands every request its own results. While a
+    batch is being parsed new requests queue up, so batches grow with the load.
+    Requests are refused with QueueFull once max_queue lines are waiting.
+    """
+
+    def __init__(self, parse_batch, max_batch_size=MAX_BATCH_SIZE, max_latency=MAX_LATENCY, max_queue=MAX_QUEUE):
+        """
+        Args:
+            parse_batch (callable): Takes a list of lines and returns one result per line, e.g. ParseCache.parse_lines.
+            max_batch_size (int): Lines after which a batch is started without waiting any longer.
+            max_latency (float): Seconds the oldest queued request may wait for more requests to join its batch.
+            max_queue (int): Lines that may be waiting before new requests are refused.
+        """
+        self.parse_batch = parse_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_latency = max(0.0, float(max_latency))
+        self.max_queue = int(max_queue)
+        self._queue = deque()
+        self._queued_lines = 0
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def submit(self, lines):
+        """
+        Queues lines for the next batch.
+
+        Returns:
+            Future: Resolves to one result per line, or to the parser's exception.
+
+        Raises:
+            QueueFull: When max_queue lines are already waiting.
+        """
+        request = _Request(list(lines))
+        with self._condition:
+            if self._queued_lines and self._queued_lines + len(request.lines) > self.max_queue:
+                PARSE_REJECTED.inc()
+                raise QueueFull(f'{self._queued_lines} references are already waiting to be parsed')
+            self._queue.append(request)
+            self._queued_lines += len(request.lines)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='parse-dispatcher', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return request.future
+
+    def parse(self, lines, timeout=None):
+        """
+        Parses lines in the next batch and waits for the results.
+        """
+        return self.submit(lines).result(timeout)
+
+    def queued_lines(self):
+        with self._condition:
+            return self._queued_lines
+
+    def _next_batch(self):
+        with self._condition:
+            while not self._queue:
+                self._condition.wait()
+            deadline = self._queue[0].queued_at + self.max_latency
+            while self._queued_lines < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+            # Whole requests only; a request larger than a batch is parsed on its own
+            batch = [self._queue.popleft()]
+            size = len(batch[0].lines)
+            while self._queue and size + len(self._queue[0].lines) <= self.max_batch_size:
+                size += len(self._queue[0].lines)
+                batch.append(self._queue.popleft())
+            self._queued_lines -= size
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            lines = [line for request in batch for line in request.lines]
+            if metrics_enabled():
+                started = time.monotonic()
+                PARSE_BATCH_LINES.observe(len(lines))
+                for request in batch:
+                    PARSE_QUEUE_SECONDS.observe(started - request.queued_at)
+            try:
+                results = self.parse_batch(lines)
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+
+            start = 0
+            for request in batch:
+                request.future.set_result(results[start:start + len(request.lines)])
+                start += len(request.lines)
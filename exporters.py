@@ -0,0 +1,165 @@
+import json
+import re
+from sqlalchemy import Integer, cast, select
+from db import db
+from models import Reference
+
+# Rows fetched from the database cursor at a time
+EXPORT_BATCH_SIZE = 1000
+
+# Columns read for an export. Plain rows are much cheaper to stream than ORM objects.
+EXPORT_COLUMNS = (
+    Reference.id, Reference.author, Reference.title, Reference.journal, Reference.year,
+    Reference.volume, Reference.issue, Reference.pages, Reference.doi
+)
+
+# "Surname, I. J." groups inside the author column ("Smith, J., & Doe, A.")
+AUTHOR_PATTERN = re.compile(r'([^,&]+?),\s*((?:[A-Z][a-z]?\.\s?)+)')
+
+DOI_PREFIX = re.compile(r'^(?:https?://(?:dx\.)?doi\.org/|doi:\s*)', re.IGNORECASE)
+
+
+def export_query(project_id, order_by, reviewed=None, year_from=None, year_to=None):
+    """
+    Builds the query for the references of a project that match the export filters.
+
+    Args:
+        project_id (int): Project to export.
+        order_by (list): Order of the exported references.
+        reviewed (bool, optional): Only reviewed (True) or unreviewed (False) references.
+        year_from (int, optional): Earliest year, inclusive.
+        year_to (int, optional): Latest year, inclusive.
+    """
+    query = select(*EXPORT_COLUMNS).where(Reference.project_id == project_id)
+    if reviewed is not None:
+        query = query.where(Reference.reviewed == reviewed)
+    # Parsed years such as "2009a" are stored as text, so compare their numeric prefix
+    year = cast(Reference.year, Integer)
+    if year_from is not None:
+        query = query.where(year >= year_from)
+    if year_to is not None:
+        query = query.where(year <= year_to)
+    return query.order_by(*order_by)
+
+
+def iter_references(query, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yields the rows of a query from a server-side cursor, batch_size rows at a time.
+    """
+    yield from db.session.execute(query.execution_options(yield_per=batch_size))
+
+
+def split_authors(author):
+    """
+    Splits the author column into (family, given) pairs, or one (author, '') pair if it has another format.
+    """
+    if not author:
+        return []
+    names = [(family.strip(), given.strip()) for family, given in AUTHOR_PATTERN.findall(author)]
+    return names or [(author.strip(), '')]
+
+
+def split_pages(pages):
+    """
+    Splits "45–67" into ('45', '67'); a single page gives (page, '').
+    """
+    if not pages:
+        return '', ''
+    parts = re.split(r'\s*[–—-]+\s*', pages.strip(), maxsplit=1)
+    return parts[0], parts[1] if len(parts) > 1 else ''
+
+
+def bare_doi(doi):
+    return DOI_PREFIX.sub('', doi.strip()) if doi else ''
+
+
+def _bibtex_escape(value):
+    return re.sub(r'([&%$#_{}])', r'\\\1', str(value))
+
+
+def _bibtex_key(ref):
+    names = split_authors(ref.author)
+    family = re.sub(r'\W+', '', names[0][0]) if names else 'ref'
+    return f"{family or 'ref'}{ref.year or ''}_{ref.id}"
+
+
+def bibtex_entries(references):
+    """
+    Yields one BibTeX entry per reference.
+    """
+    for ref in references:
+        entry_type = 'article' if ref.journal else 'misc'
+        fields = [
+            ('author', ' and '.join(f'{family}, {given}'.rstrip(', ') for family, given in split_authors(ref.author))),
+            ('title', ref.title),
+            ('journal', ref.journal),
+            ('year', ref.year),
+            ('volume', ref.volume),
+            ('number', ref.issue),
+            ('pages', ref.pages.replace('–', '--') if ref.pages else ''),
+            ('doi', bare_doi(ref.doi)),
+        ]
+        lines = [f'@{entry_type}{{{_bibtex_key(ref)},']
+        lines.extend(f'  {name} = {{{_bibtex_escape(value)}}},' for name, value in fields if value)
+        yield '\n'.join(lines) + '\n}\n\n'
+
+
+def ris_entries(references):
+    """
+    Yields one RIS record per reference.
+    """
+    for ref in references:
+        lines = ['TY  - ' + ('JOUR' if ref.journal else 'GEN')]
+        lines.extend('AU  - ' + f'{family}, {given}'.rstrip(', ') for family, given in split_authors(ref.author))
+        start_page, end_page = split_pages(ref.pages)
+        fields = [
+            ('PY', ref.year), ('TI', ref.title), ('JO', ref.journal), ('VL', ref.volume),
+            ('IS', ref.issue), ('SP', start_page), ('EP', end_page), ('DO', bare_doi(ref.doi)),
+        ]
+        lines.extend(f'{tag}  - {value}' for tag, value in fields if value)
+        lines.append('ER  - ')
+        yield '\n'.join(lines) + '\n\n'
+
+
+def csl_item(ref):
+    """
+    Maps a reference to a CSL-JSON item.
+    """
+    item = {
+        'id': str(ref.id),
+        'type': 'article-journal' if ref.journal else 'document',
+        'title': ref.title,
+        'author': [
+            {'family': family, 'given': given} if given else {'literal': family}
+            for family, given in split_authors(ref.author)
+        ],
+    }
+    year = re.match(r'\d+', str(ref.year or ''))
+    if year:
+        item['issued'] = {'date-parts': [[int(year.group(0))]]}
+    optional = [
+        ('container-title', ref.journal), ('volume', ref.volume), ('issue', ref.issue),
+        ('page', ref.pages.replace('–', '-') if ref.pages else ''), ('DOI', bare_doi(ref.doi)),
+    ]
+    item.update((name, value) for name, value in optional if value)
+    return item
+
+
+def csl_json_entries(references):
+    """
+    Yields a CSL-JSON array one item at a time.
+    """
+    yield '['
+    separator = '\n'
+    for ref in references:
+        yield separator + json.dumps(csl_item(ref), ensure_ascii=False)
+        separator = ',\n'
+    yield '\n]\n'
+
+
+# Export formats: formatter, mimetype and file extension
+EXPORT_FORMATS = {
+    'bibtex': (bibtex_entries, 'application/x-bibtex', 'bib'),
+    'ris': (ris_entries, 'application/x-research-info-systems', 'ris'),
+    'csl-json': (csl_json_entries, 'application/vnd.citationstyles.csl+json', 'json'),
+}
@@ -0,0 +1,300 @@
+import argparse
+import hashlib
+import mmap
+import struct
+import sys
+import threading
+import zlib
+from array import array
+from bisect import bisect_left
+from flask import current_app, has_app_context
+from reference_lexer import tokenize
+
+# Kinds of names, in the order their lists are read; the index is stored per entry
+KINDS = ('journal', 'institution')
+
+# File layout: header, then the arrays of Gazetteer.__init__ in this order, each padded to 8 bytes.
+# Arrays are written in the byte order of the machine that built the file.
+MAGIC = b'GAZ1'
+HEADER = struct.Struct('=4sc3xQQQQ32s')
+SECTIONS = (
+    ('keys', 'Q'),          # Transitions as (state << 32 | symbol hash), sorted
+    ('targets', 'I'),       # State each transition leads to
+    ('fail', 'I'),          # Failure link of every state
+    ('entry', 'i'),         # Entry ending at every state, -1 for none
+    ('output', 'I'),        # Nearest state on the failure chain with an entry, 0 for none
+    ('lengths', 'I'),       # Number of symbols of every entry
+    ('kinds', 'B'),         # Index into KINDS of every entry
+    ('offsets', 'I'),       # Start of every entry's text in the blob, plus the end of the last one
+)
+
+# Punctuation that is spelled out; other punctuation and whitespace are not part of the
+# symbols, so "J. Mach. Learn. Res." matches "J Mach Learn Res"
+SYMBOL_ALIASES = {'&': 'and'}
+
+# Open gazetteers by path
+_gazetteers = {}
+_gazetteer_lock = threading.Lock()
+
+
+def _symbols(text, tokens=None):
+    """
+    Returns the matching symbols of a text as (symbol, start, end) with character offsets.
+
+    Symbols are the lexer's letter and digit runs, lower-cased, and SYMBOL_ALIASES,
+    so names match whatever their case, spacing and punctuation.
+    """
+    symbols = []
+    position = 0
+    for token in tokenize(text) if tokens is None else tokens:
+        start = position
+        position += len(token)
+        if token[0].isalnum():
+            symbols.append((token.lower(), start, position))
+        elif token in SYMBOL_ALIASES:
+            symbols.append((SYMBOL_ALIASES[token], start, position))
+    return symbols
+
+
+def _hash(symbol):
+    return zlib.crc32(symbol.encode('utf-8'))
+
+
+class Gazetteer:
+    """
+    Aho-Corasick automaton over the words of known journal and institution names.
+
+    The automaton is read from a file written by build(). Its arrays are used in
+    place from a memory map, so loading takes no time whatever the number of
+    names, and processes using the same file share its pages. A reference is
+    scanned once, word by word, and every name it contains is found whatever
+    the number of names.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): A file written by build().
+        """
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, byteorder, states, transitions, entries, blob_size, digest = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a compiled gazetteer')
+        if byteorder != sys.byteorder[0].encode():
+            raise ValueError(f'{path} was built on a machine with another byte order')
+        self.path = path
+        self.digest = digest.hex()
+        self.entries = entries
+
+        view = memoryview(self._map)
+        offset = HEADER.size
+        sizes = {'keys': transitions, 'targets': transitions, 'fail': states, 'entry': states, 'output': states,
+                 'lengths': entries, 'kinds': entries, 'offsets': entries + 1}
+        for name, typecode in SECTIONS:
+            end = offset + sizes[name] * array(typecode).itemsize
+            setattr(self, name, view[offset:end].cast(typecode))
+            offset = -(-end // 8) * 8
+        self.blob = view[offset:offset + blob_size]
+
+    def name(self, entry):
+        return bytes(self.blob[self.offsets[entry]:self.offsets[entry + 1]]).decode('utf-8')
+
+    def find(self, reference, tokens=None):
+        """
+        Finds every known name in a reference.
+
+        Args:
+            reference (str): A reference string.
+            tokens (list, optional): The reference split by reference_lexer.tokenize, if already done.
+
+        Returns:
+            list: (kind, start, end, words) for every name: its character span and number of symbols,
+            in the order the names end.
+        """
+        symbols = _symbols(reference, tokens)
+        keys, targets, fail = self.keys, self.targets, self.fail
+        transitions = len(keys)
+        candidates = []
+        state = 0
+        for index, (symbol, _, _) in enumerate(symbols):
+            symbol = zlib.crc32(symbol.encode('utf-8'))
+            # Follow failure links until a state has a transition on the symbol, or the root is reached
+            while True:
+                key = state << 32 | symbol
+                position = bisect_left(keys, key)
+                if position < transitions and keys[position] == key:
+                    state = targets[position]
+                    break
+                if state == 0:
+                    break
+                state = fail[state]
+
+            match = state if self.entry[state] >= 0 else self.output[state]
+            while match:
+                candidates.append((self.entry[match], index))
+                match = self.output[match]
+
+        matches = []
+        for entry, index in candidates:
+            first = index - self.lengths[entry] + 1
+            # Symbols are compared by hash; rule out collisions against the stored name
+            if [symbol for symbol, _, _ in symbols[first:index + 1]] == [symbol for symbol, _, _ in _symbols(self.name(entry))]:
+                matches.append((KINDS[self.kinds[entry]], symbols[first][1], symbols[index][2], index + 1 - first))
+        return matches
+
+    def longest_matches(self, reference, tokens=None):
+        """
+        Returns where the longest journal and institution names are in a reference.
+
+        Names inside a longer name of either kind are ignored ("Science" in "University
+        of Science and Technology"). Length is counted in symbols, and ties go to the
+        name that appears last, as the venue usually follows the title.
+
+        Returns:
+            dict: (start, end) character spans by field name, only for the kinds that were found.
+        """
+        kept = []
+        best = {}
+        for kind, start, end, words in sorted(self.find(reference, tokens), key=lambda match: (-match[3], -match[1])):
+            if any(start >= other_start and end <= other_end for other_start, other_end in kept):
+                continue
+            kept.append((start, end))
+            best.setdefault(kind, (start, end))
+        return best
+
+
+def build(names, path):
+    """
+    Compiles (kind, name) pairs into an automaton file for Gazetteer.
+
+    Names are matched word by word (see _symbols); a name that normalizes like an
+    earlier one is skipped.
+
+    Args:
+        names (iterable): (kind, name) pairs, kind being one of KINDS.
+        path (str): File to write.
+
+    Returns:
+        tuple: (number of names, number of states).
+    """
+    entries = {}
+    for kind, name in names:
+        name = ' '.join(name.split())
+        symbols = tuple(symbol for symbol, _, _ in _symbols(name))
+        if symbols and symbols not in entries:
+            entries[symbols] = (KINDS.index(kind), name)
+    records = list(entries.values())
+    keys = [[_hash(symbol) for symbol in symbols] for symbols in entries]
+
+    # Insert the names level by level, so states are numbered in breadth-first order
+    transitions = {}
+    parents = array('I', [0])
+    labels = array('I', [0])
+    entry = array('i', [-1])
+    prefixes = [0] * len(keys)
+    remaining = list(range(len(keys)))
+    depth = 0
+    while remaining:
+        for index in remaining:
+            key = prefixes[index] << 32 | keys[index][depth]
+            state = transitions.get(key)
+            if state is None:
+                state = transitions[key] = len(parents)
+                parents.append(prefixes[index])
+                labels.append(keys[index][depth])
+                entry.append(-1)
+            prefixes[index] = state
+            if len(keys[index]) == depth + 1:
+                entry[state] = index
+        depth += 1
+        remaining = [index for index in remaining if len(keys[index]) > depth]
+
+    # Failure links only point to shallower states, which breadth-first order has already linked
+    fail = array('I', bytes(4 * len(parents)))
+    output = array('I', bytes(4 * len(parents)))
+    for state in range(1, len(parents)):
+        parent, label = parents[state], labels[state]
+        if parent:
+            link = fail[parent]
+            while link and (link << 32 | label) not in transitions:
+                link = fail[link]
+            fail[state] = transitions.get(link << 32 | label, 0)
+        link = fail[state]
+        output[state] = link if entry[link] >= 0 else output[link]
+
+    sorted_keys = array('Q', sorted(transitions))
+    blob = bytearray()
+    offsets = array('I', [0])
+    digest = hashlib.sha256()
+    for kind, name in records:
+        blob += name.encode('utf-8')
+        offsets.append(len(blob))
+        digest.update(f'{kind}\t{name}\n'.encode('utf-8'))
+
+    sections = {
+        'keys': sorted_keys,
+        'targets': array('I', (transitions[key] for key in sorted_keys)),
+        'fail': fail,
+        'entry': entry,
+        'output': output,
+        'lengths': array('I', (len(symbols) for symbols in keys)),
+        'kinds': array('B', (kind for kind, _ in records)),
+        'offsets': offsets,
+    }
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, sys.byteorder[0].encode(), len(parents), len(transitions), len(keys), len(blob),
+                            digest.digest()))
+        for name, _ in SECTIONS:
+            data = sections[name].tobytes()
+            f.write(data + bytes(-(f.tell() + len(data)) % 8))
+        f.write(bytes(blob))
+    return len(keys), len(parents)
+
+
+def get_gazetteer(path=None):
+    """
+    Returns the gazetteer at path, opening it on the first call.
+
+    Args:
+        path (str, optional): A file written by build(). Defaults to the app's GAZETTEER_PATH when
+            called in an app context.
+
+    Returns:
+        Gazetteer: The gazetteer, or None when no path is set.
+    """
+    if not path and has_app_context():
+        path = current_app.config.get('GAZETTEER_PATH')
+    if not path:
+        return None
+    gazetteer = _gazetteers.get(path)
+    if gazetteer is None:
+        with _gazetteer_lock:
+            gazetteer = _gazetteers.get(path)
+            if gazetteer is None:
+                gazetteer = _gazetteers[path] = Gazetteer(path)
+    return gazetteer
+
+
+def _read_names(kind, paths):
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip() and not line.startswith('#'):
+                    yield kind, line
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compile journal and institution name lists into a gazetteer file.')
+    parser.add_argument('--journals', nargs='*', default=[], help='Files with one journal title or abbreviation per line.')
+    parser.add_argument('--institutions', nargs='*', default=[], help='Files with one institution name per line.')
+    parser.add_argument('-o', '--output', default='gazetteer.bin')
+    args = parser.parse_args()
+
+    names = list(_read_names('journal', args.journals)) + list(_read_names('institution', args.institutions))
+    entries, states = build(names, args.output)
+    print(f'{entries} names, {states} states written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
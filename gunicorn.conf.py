@@ -0,0 +1,30 @@
+# Production server settings: gunicorn -c gunicorn.conf.py
+import gc
+import multiprocessing
+import os
+
+wsgi_app = "app:create_app('config.ProductionConfig')"
+bind = os.environ.get('BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+
+# Threads per worker. With more than one, gunicorn uses threaded workers, so
+# concurrent /api/parse requests reaching a worker can share a parser batch.
+threads = int(os.environ.get('GUNICORN_THREADS', '8'))
+
+# Import the application and load the spaCy model once in the master process.
+# Forked workers then share those pages copy-on-write instead of each loading
+# their own copy of the model.
+preload_app = True
+
+# Requests that parse large pastes synchronously can take a while
+timeout = 120
+
+
+def when_ready(server):
+    # Runs in the master after the app is imported and before workers are forked
+    from nlp_parser import preload_model
+    preload_model()
+    # Move everything loaded so far out of the collector's generations, so that
+    # collections in the workers do not touch (and copy) the shared pages
+    gc.collect()
+    gc.freeze()
@@ -0,0 +1,101 @@
+import json
+from itertools import islice
+from sqlalchemy import insert
+from db import db
+from models import Reference
+from dedup import check_references
+from metrics import DB_PHASE_SECONDS
+
+# Number of references parsed, inserted and committed together
+IMPORT_CHUNK_SIZE = 1000
+
+
+def insert_references(rows, project_id):
+    """
+    Bulk inserts Reference rows of one project and runs duplicate detection on them.
+
+    Returns:
+        list: The ids of the new references, in the order of rows.
+    """
+    statement = insert(Reference).returning(Reference.id, sort_by_parameter_order=True)
+    with DB_PHASE_SECONDS.time('insert'):
+        ids = db.session.execute(statement, rows).scalars().all()
+    with DB_PHASE_SECONDS.time('dedup'):
+        check_references(project_id, [dict(row, id=ref_id) for row, ref_id in zip(rows, ids)])
+    return ids
+
+
+def iter_lines(stream, encoding='utf-8'):
+    """
+    Yields decoded lines from a binary stream without reading it all into memory.
+    """
+    for raw_line in stream:
+        yield raw_line.decode(encoding, errors='replace')
+
+
+def segment(lines):
+    """
+    Yields one stripped reference per non-empty line.
+    """
+    for line in lines:
+        line = line.strip()
+        if line:
+            yield line
+
+
+def chunked(iterable, size):
+    """
+    Yields lists of at most size items from iterable.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def parse_chunks(references, cache, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Yields lists of parsed references, parsing chunk_size lines at a time through the parse cache.
+    """
+    for chunk in chunked(references, chunk_size):
+        yield cache.parse_lines(chunk)
+
+
+def import_references(stream, project_id, cache, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Streams references from a file-like object into a project.
+
+    The pipeline is lazy end to end (read line -> segment -> parse -> map to rows),
+    so only one chunk is held in memory at a time. Each chunk is written with a
+    single bulk INSERT, checked for duplicates and committed on its own.
+
+    Args:
+        stream (file-like): Binary stream with one reference per line.
+        project_id (int): Project the references are added to.
+        cache (ParseCache): Cache used to parse the references.
+        chunk_size (int): Number of references per insert and commit.
+
+    Yields:
+        dict: Progress after every committed chunk.
+    """
+    inserted = 0
+    chunks = 0
+    for parsed_refs in parse_chunks(segment(iter_lines(stream)), cache, chunk_size):
+        rows = [parsed_ref.as_row(project_id, cache.version) for parsed_ref in parsed_refs]
+        insert_references(rows, project_id)
+        with DB_PHASE_SECONDS.time('commit'):
+            db.session.commit()
+        inserted += len(rows)
+        chunks += 1
+        yield {'project_id': project_id, 'chunks': chunks, 'inserted': inserted, 'done': False}
+    yield {'project_id': project_id, 'chunks': chunks, 'inserted': inserted, 'done': True}
+
+
+def progress_lines(progress):
+    """
+    Formats progress dictionaries as newline delimited JSON.
+    """
+    for item in progress:
+        yield json.dumps(item) + '\n'
@@ -0,0 +1,146 @@
+import json
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from db import db
+from models import ParseJob
+from importer import insert_references
+from parse_cache import normalize_reference
+from metrics import DB_PHASE_SECONDS
+
+# Number of references sent to a worker process at a time
+JOB_CHUNK_SIZE = 500
+
+# Pastes with more lines than this are parsed in the background
+BACKGROUND_PARSE_THRESHOLD = 200
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _init_worker():
+    """
+    Runs once in every worker process so the spaCy model is loaded a single time per worker.
+    """
+    from nlp_parser import preload_model
+    preload_model()
+
+
+def parse_lines(parser, lines):
+    """
+    Parses a chunk of references inside a worker process with the cache's parser (e.g. a ParserCascade).
+    """
+    return parser('\n'.join(lines))
+
+
+def get_executor(max_workers=None):
+    """
+    Returns the process pool shared by all jobs, creating it on first use.
+
+    Workers are spawned rather than forked so they never inherit the locks and
+    threads of the web server process.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker
+            )
+        return _executor
+
+
+def discard_executor(executor):
+    """
+    Drops a broken pool (for example after a worker was killed) so the next job starts a fresh one.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def submit_job(app, project_id, lines, cache):
+    """
+    Creates a ParseJob for the given lines and starts parsing them in the background.
+
+    Args:
+        app (Flask): The application, used to open an app context in the job thread.
+        project_id (int): Project the references are added to.
+        lines (list): Non-empty reference strings.
+        cache (ParseCache): Cache consulted before, and filled after, parsing.
+
+    Returns:
+        ParseJob: The committed job record.
+    """
+    job = ParseJob(project_id=project_id, total=len(lines))
+    db.session.add(job)
+    db.session.commit()
+
+    thread = threading.Thread(target=_run_job, args=(app, job.id, lines, cache), daemon=True)
+    thread.start()
+    return job
+
+
+def _run_job(app, job_id, lines, cache):
+    with app.app_context():
+        job = db.session.get(ParseJob, job_id)
+        job.status = 'running'
+        db.session.commit()
+
+        chunk_size = app.config.get('JOB_CHUNK_SIZE', JOB_CHUNK_SIZE)
+        errors = []
+        try:
+            executor = get_executor(app.config.get('PARSE_JOB_WORKERS'))
+            pending = {}
+            for start in range(0, len(lines), chunk_size):
+                chunk = lines[start:start + chunk_size]
+                cached = cache.lookup_lines(chunk)
+                missing = [normalize_reference(line) for line, parsed_ref in zip(chunk, cached) if parsed_ref is None]
+                if missing:
+                    future = executor.submit(parse_lines, cache.parser, missing)
+                    pending[future] = (start, chunk, cached, missing)
+                else:
+                    _write_chunk(job, chunk, cached, cache.version)
+
+            for future in as_completed(pending):
+                start, chunk, cached, missing = pending[future]
+                try:
+                    parsed = dict(zip(missing, future.result()))
+                except Exception as e:
+                    if isinstance(e, BrokenProcessPool):
+                        discard_executor(executor)
+                    job.failed += len(chunk)
+                    errors.append({'lines': [start + 1, start + len(chunk)], 'error': str(e)})
+                    job.errors = json.dumps(errors)
+                    db.session.commit()
+                    continue
+
+                cache.store_lines(missing, parsed.values())
+                for index, line in enumerate(chunk):
+                    if cached[index] is None:
+                        cached[index] = parsed[normalize_reference(line)].with_original_string(line)
+                _write_chunk(job, chunk, cached, cache.version)
+
+            job.status = 'done' if job.inserted or not job.failed else 'failed'
+        except Exception as e:
+            db.session.rollback()
+            errors.append({'lines': None, 'error': str(e)})
+            job.status = 'failed'
+        job.errors = json.dumps(errors)
+        db.session.commit()
+
+
+def _write_chunk(job, chunk, parsed_refs, parser_version):
+    """
+    Inserts one chunk of parsed references and updates the job counters in the same transaction.
+    """
+    rows = [parsed_ref.as_row(job.project_id, parser_version) for parsed_ref in parsed_refs]
+    insert_references(rows, job.project_id)
+    job.parsed += len(chunk)
+    job.inserted += len(rows)
+    with DB_PHASE_SECONDS.time('commit'):
+        db.session.commit()
@@ -0,0 +1,169 @@
+import argparse
+import json
+import logging
+import re
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from synthetic_corpus import generate_corpus
+
+# Styles sent by the load test; adversarial lines would measure the regex parsers instead of batching
+LOAD_STYLES = ('apa_journal', 'apa_journal_doi', 'apa_journal_no_issue', 'conference', 'technical_report')
+
+# Sum and count of the dispatcher's batch size histogram in /metrics
+BATCH_METRIC = re.compile(r'^reference_parse_batch_lines_(sum|count) (\S+)$', re.MULTILINE)
+
+
+def _post(url, reference, timeout):
+    """
+    Sends one reference to /api/parse and returns (status code, seconds).
+    """
+    data = json.dumps({'reference': reference}).encode('utf-8')
+    req = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except OSError:
+        status = 0
+    return status, time.perf_counter() - start
+
+
+def _batch_totals(base_url):
+    try:
+        with urllib.request.urlopen(base_url + '/metrics', timeout=10) as response:
+            text = response.read().decode('utf-8')
+    except OSError:
+        return None
+    totals = {name: float(value) for name, value in BATCH_METRIC.findall(text)}
+    return totals if len(totals) == 2 else None
+
+
+def run_load(base_url, references, clients, timeout=60.0):
+    """
+    Sends every reference as its own /api/parse request from concurrent client threads.
+
+    Args:
+        base_url (str): Server address, e.g. http://127.0.0.1:8000.
+        references (list): Reference strings, one request each.
+        clients (int): Number of threads sending requests back to back.
+        timeout (float): Seconds a client waits for an answer.
+
+    Returns:
+        dict: Throughput, latency percentiles of the successful requests and counts by status.
+    """
+    url = base_url + '/api/parse'
+    pending = iter(references)
+    lock = threading.Lock()
+    latencies = []
+    statuses = Counter()
+
+    def client():
+        while True:
+            with lock:
+                reference = next(pending, None)
+            if reference is None:
+                return
+            status, seconds = _post(url, reference, timeout)
+            with lock:
+                statuses[status] += 1
+                if status == 200:
+                    latencies.append(seconds)
+
+    before = _batch_totals(base_url)
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    after = _batch_totals(base_url)
+
+    latencies.sort()
+    result = {
+        'requests': len(references),
+        'clients': clients,
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(len(references) / elapsed, 1),
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+    }
+    if latencies:
+        result.update({
+            'p50_ms': round(statistics.median(latencies) * 1000, 1),
+            'p95_ms': round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 1),
+            'p99_ms': round(latencies[int(0.99 * (len(latencies) - 1))] * 1000, 1),
+        })
+    if before is not None and after is not None and after['count'] > before['count']:
+        result['mean_batch_lines'] = round((after['sum'] - before['sum']) / (after['count'] - before['count']), 1)
+    return result
+
+
+def start_local_server(max_batch_size, max_latency_ms, queue_max):
+    """
+    Serves the app with a threaded development server on a free local port.
+
+    Returns:
+        tuple: (base URL, server); call server.shutdown() when done.
+    """
+    from werkzeug.serving import make_server
+    from app import create_app
+    from config import Config
+
+    class LoadTestConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite://'
+        METRICS_ENABLED = True
+        PRELOAD_MODEL = True
+        PARSE_BATCH_MAX_SIZE = max_batch_size
+        PARSE_BATCH_MAX_LATENCY_MS = max_latency_ms
+        PARSE_QUEUE_MAX = queue_max
+
+    # One access log line per request would cost more than some of the requests
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, create_app(LoadTestConfig), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}', server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test /api/parse with concurrent single-reference requests.')
+    parser.add_argument('--url', help='Server to test, e.g. http://127.0.0.1:8000. By default a local server is started.')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--timeout', type=float, default=60.0, help='Seconds a client waits for an answer.')
+    parser.add_argument('--max-batch-size', type=int, default=64, help='PARSE_BATCH_MAX_SIZE of the local server.')
+    parser.add_argument('--max-latency-ms', type=float, default=5.0, help='PARSE_BATCH_MAX_LATENCY_MS of the local server.')
+    parser.add_argument('--queue-max', type=int, default=1024, help='PARSE_QUEUE_MAX of the local server.')
+    parser.add_argument('--compare', action='store_true',
+                        help='Also run a local server that parses every request on its own (batch size 1).')
+    args = parser.parse_args()
+
+    # Distinct references, so that every request misses the parse cache
+    references = [item['text'] for item in generate_corpus(args.requests, LOAD_STYLES, args.seed)]
+    runs = []
+    if args.url:
+        runs.append(('remote', args.url.rstrip('/'), None))
+    else:
+        if args.compare:
+            runs.append(('unbatched', *start_local_server(1, 0, args.queue_max)))
+        runs.append(('batched', *start_local_server(args.max_batch_size, args.max_latency_ms, args.queue_max)))
+
+    for seed_offset, (name, base_url, server) in enumerate(runs):
+        # Every run gets its own references, so a later run does not hit the cache of an earlier one
+        if seed_offset:
+            references = [item['text'] for item in generate_corpus(args.requests, LOAD_STYLES, args.seed + seed_offset)]
+        result = run_load(base_url, references, args.clients, args.timeout)
+        print(json.dumps({'run': name, **result}))
+        if server is not None:
+            server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,39 @@
+import json
+from datetime import datetime
 from db import db
 
 # Define the Project model
 class Project(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
+    revision = db.Column(db.Integer, nullable=False, default=0)  # Bumped whenever a printed reference field changes
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # Time of the last revision
     references = db.relationship('Reference', backref='project', lazy=True)
+    summary = db.relationship('ProjectSummary', uselist=False, lazy=True)
+
+# Reference counts and year range of a project, kept current by the triggers in summary.py
+class ProjectSummary(db.Model):
+    project_id = db.Column(db.Integer, db.ForeignKey('project.id'), primary_key=True)
+    reference_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    reviewed_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    doi_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # References with a DOI
+    min_year = db.Column(db.Integer)  # Range of the numeric years; years like "2009a" are left out
+    max_year = db.Column(db.Integer)
+
+    @property
+    def unreviewed_count(self):
+        return self.reference_count - self.reviewed_count
+
+    def to_dict(self):
+        return {
+            'project_id': self.project_id,
+            'reference_count': self.reference_count,
+            'reviewed_count': self.reviewed_count,
+            'unreviewed_count': self.unreviewed_count,
+            'doi_count': self.doi_count,
+            'min_year': self.min_year,
+            'max_year': self.max_year
+        }
 
 # Define the Reference model
 class Reference(db.Model):
@@ -20,6 +49,13 @@ class Reference(db.Model):
     doi = db.Column(db.String(200))    # Add DOI field
     original_string = db.Column(db.String(1024))    # Add DOI field
     project_id = db.Column(db.Integer, db.ForeignKey('project.id'), nullable=False)
+    doi_key = db.Column(db.String(200))    # Normalized DOI, see dedup.normalize_doi
+    title_key = db.Column(db.String(300))  # Normalized title and year, see dedup.title_key
+    duplicate_of = db.Column(db.Integer, db.ForeignKey('reference.id'))  # Oldest reference this one duplicates
+    parser = db.Column(db.String(20))            # Parser whose result was kept, see cascade.STAGES
+    parse_confidence = db.Column(db.Float)       # Score of that result, see cascade.score_reference
+    parse_reason = db.Column(db.String(200))     # Why the result was kept (problems found, if any)
+    parser_version = db.Column(db.String(200))   # Version of the parse cache's parser that produced the row, see reparse.py
     
     # Method to convert the model instance to a dictionary
     def to_dict(self):
@@ -34,5 +70,61 @@ class Reference(db.Model):
             'issue': self.issue,
             'pages': self.pages,
             'doi': self.doi,
-            'project_id': self.project_id
+            'project_id': self.project_id,
+            'duplicate_of': self.duplicate_of,
+            'parser': self.parser,
+            'parse_confidence': self.parse_confidence,
+            'parse_reason': self.parse_reason,
+            'parser_version': self.parser_version
+        }
+
+# Composite indexes matching the project page ordering (reviewed, author, year desc)
+# and the print ordering (year desc, author), so both are read in index order
+db.Index('ix_reference_project_listing', Reference.project_id, Reference.reviewed, Reference.author, Reference.year.desc(), Reference.id)
+db.Index('ix_reference_project_print', Reference.project_id, Reference.year.desc(), Reference.author, Reference.id)
+
+# Exact duplicate lookups by normalized DOI or title, within a project or across all of them
+db.Index('ix_reference_doi_key', Reference.doi_key, Reference.project_id)
+db.Index('ix_reference_title_key', Reference.title_key, Reference.project_id)
+
+# MinHash LSH band of a reference's title, used to find near-duplicate candidates
+class ReferenceBand(db.Model):
+    reference_id = db.Column(db.Integer, db.ForeignKey('reference.id'), primary_key=True)
+    band = db.Column(db.BigInteger, primary_key=True)
+    project_id = db.Column(db.Integer, db.ForeignKey('project.id'), nullable=False)
+
+db.Index('ix_reference_band_lookup', ReferenceBand.band, ReferenceBand.project_id)
+
+# Cached parser output, keyed by a hash of the normalized reference string and the parser version
+class ParseCacheEntry(db.Model):
+    key = db.Column(db.String(64), primary_key=True)
+    parser_version = db.Column(db.String(200), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # JSON encoded parsed fields
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+# Background parse job created for large pastes, polled by the project page
+class ParseJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    project_id = db.Column(db.Integer, db.ForeignKey('project.id'), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done or failed
+    total = db.Column(db.Integer, nullable=False, default=0)
+    parsed = db.Column(db.Integer, nullable=False, default=0)
+    inserted = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    errors = db.Column(db.Text, nullable=False, default='[]')  # JSON list of failed chunks
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'project_id': self.project_id,
+            'status': self.status,
+            'total': self.total,
+            'parsed': self.parsed,
+            'inserted': self.inserted,
+            'failed': self.failed,
+            'errors': json.loads(self.errors),
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat()
         }
@@ -1,108 +1,185 @@
-import re
-import spacy
+import threading
+from metrics import PARSER_STEP_SECONDS
+from parsed_reference import ParsedReference
+from reference_lexer import tokenize, extract_fields
+from gazetteer import get_gazetteer
 
-# Load spaCy model globally so it can be reused across multiple function calls
-nlp = spacy.load("en_core_web_sm")
+# spaCy model used for the entity based fields
+MODEL_NAME = "en_core_web_sm"
 
-def nlp_parser(reference_string):
+# The model is loaded on first use (or by preload_model) and then reused by every
+# call in the process. Importing this module stays cheap for the CLI and tests.
+_nlp = None
+_nlp_lock = threading.Lock()
+_loader = None
+_load_error = None
+
+# Bump whenever a change to the extraction changes its output, so cached
+# results from older versions are no longer used
+PARSER_VERSION = '3'
+
+# Fields that are filled from the spaCy document rather than from regexes.
+# When none of them is requested the model is not run at all.
+NLP_FIELDS = ('institution',)
+
+# Pipeline components the NLP fields read from. Everything else (tagger,
+# parser, lemmatizer, ...) is disabled while parsing.
+NLP_COMPONENTS = ('ner',)
+
+# Default nlp.pipe settings for large pastes
+BATCH_SIZE = 256
+N_PROCESS = 1
+
+
+def parser_version(gazetteer_path=None):
+    """
+    Returns PARSER_VERSION, tagged with the digest of the gazetteer when one is configured
+    (see gazetteer.get_gazetteer), as its names change the journals and institutions found.
+    """
+    gazetteer = get_gazetteer(gazetteer_path)
+    if gazetteer is None:
+        return PARSER_VERSION
+    return f'{PARSER_VERSION}+gazetteer-{gazetteer.digest[:12]}'
+
+
+def get_nlp():
+    """
+    Returns the spaCy model, loading it on the first call.
+    """
+    global _nlp
+    if _nlp is None:
+        with _nlp_lock:
+            if _nlp is None:
+                import spacy
+                _nlp = spacy.load(MODEL_NAME)
+    return _nlp
+
+
+def model_loaded():
+    return _nlp is not None
+
+
+def model_load_error():
+    """
+    Returns the error of a failed background load, or None.
+    """
+    return _load_error
+
+
+def load_model_in_background():
+    """
+    Starts loading the model in a daemon thread unless it is loaded or already loading.
+    """
+    global _loader
+    with _nlp_lock:
+        if _nlp is not None or (_loader is not None and _loader.is_alive()):
+            return
+        _loader = threading.Thread(target=_load_model, daemon=True)
+        _loader.start()
+
+
+def _load_model():
+    global _load_error
+    try:
+        get_nlp()
+        _load_error = None
+    except Exception as e:
+        _load_error = f'{type(e).__name__}: {e}'
+
+
+def preload_model():
+    """
+    Loads the model ahead of the first request, e.g. in a pre-fork server's master
+    process so that forked workers share its memory copy-on-write.
+    """
+    get_nlp()
+
+
+def _enabled_components(nlp):
+    """
+    Returns the pipeline components needed for NLP_COMPONENTS, including any
+    shared tok2vec layer they listen to.
+    """
+    enabled = [name for name in NLP_COMPONENTS if name in nlp.pipe_names]
+    for name, component in nlp.pipeline:
+        listeners = getattr(component, 'listening_components', None) or []
+        if name not in enabled and any(listener in enabled for listener in listeners):
+            enabled.append(name)
+    return enabled
+
+
+def nlp_parser(reference_string, fields=None, batch_size=BATCH_SIZE, n_process=N_PROCESS, gazetteer_path=None):
     """
     Parses multiple reference strings separated by newlines to extract authors, year, title, journal, volume, issue, pages, DOI, editors, and institution.
 
+    The regex based fields are extracted line by line. The spaCy model is only
+    run when one of NLP_FIELDS is requested, and then over all lines at once
+    with nlp.pipe and only the components listed in NLP_COMPONENTS.
+
     Args:
         reference_string (str): The reference string or multiple reference strings separated by newlines.
+        fields (iterable, optional): Fields the caller needs. Defaults to all fields.
+        batch_size (int): Number of lines per nlp.pipe batch.
+        n_process (int): Number of processes used by nlp.pipe.
+        gazetteer_path (str, optional): Gazetteer for journal and institution names, see gazetteer.get_gazetteer.
 
     Returns:
-        list: A list of dictionaries, each containing parsed fields for a reference.
+        list: A ParsedReference for each reference.
     """
     # Split the input string by newlines and remove any empty lines
     references = [ref.strip() for ref in reference_string.split('\n') if ref.strip()]
 
-    parsed_references = []
-
-    for reference in references:
-        # Regex for DOI extraction
-        doi_pattern = r'(https?://doi\.org/[^\s]+)'
-        doi_match = re.search(doi_pattern, reference)
-        doi = doi_match.group(0) if doi_match else ''
-
-        # Initialize a dictionary to store parsed data
-        parsed_reference = {
-            'doi': doi,
-            'authors': '',
-            'year': '',
-            'title': '',
-            'journal': '',
-            'volume': '',
-            'issue': '',
-            'pages': '',
-            'editors': '',
-            'institution': '',
-            'type': '',
-            "original_string": reference
-        }
-
-        # Step 1: Extract authors using custom regex pattern
-        # Pattern for authors (matches Last name followed by initials, possibly with multiple authors separated by commas)
-        author_pattern = r'([A-Za-z\-]+(?:, [A-Z]\. ?)+|& [A-Za-z\-]+(?:, [A-Z]\. ?)+)'
-        author_matches = re.findall(author_pattern, reference)
-
-        if author_matches:
-            # Clean up authors list and remove any trailing commas or spaces
-            cleaned_authors = [author.strip() for author in author_matches]
-            parsed_reference['authors'] = ', '.join(cleaned_authors)
-
-        # Process the reference with spaCy for Named Entity Recognition to extract other details
-        doc = nlp(reference)
-
-        # Step 2: Extract year using regex
-        year_pattern = r'\(\d{4}[a-z]?\)'  # Matches (2009a), (2009), etc.
-        year_match = re.search(year_pattern, reference)
-        if year_match:
-            parsed_reference['year'] = year_match.group(0).strip('()')
-
-        # Step 3: Extract title using position heuristics (between year and journal/institution)
-        if year_match:
-            year_end = year_match.end()
-            institution_match = re.search(r'(University|Institute|Laboratory|Technology|School of [^\s]+)', reference, re.IGNORECASE)
-            journal_match = re.search(r'([A-Za-z\s]+),? \d{1,2}\(', reference)  # Simple pattern for journal detection
-
-            # Use heuristics to extract title
-            if institution_match:
-                inst_start = institution_match.start()
-                parsed_reference['title'] = reference[year_end:inst_start].strip('. ')
-            elif journal_match:
-                journal_start = journal_match.start()
-                parsed_reference['title'] = reference[year_end:journal_start].strip('. ')
-            else:
-                # General heuristic to find anything after the year if no match
-                parsed_reference['title'] = reference[year_end:].split('.')[0].strip()
-
-        # Step 4: Extract journal, volume, issue, and pages using regex
-        volume_issue_pages_pattern = r'(\d+)\((\d+)\),\s*(\d+–\d+|\d+)'
-        volume_issue_pages_match = re.search(volume_issue_pages_pattern, reference)
-
-        if volume_issue_pages_match:
-            parsed_reference['volume'] = volume_issue_pages_match.group(1)
-            parsed_reference['issue'] = volume_issue_pages_match.group(2)
-            parsed_reference['pages'] = volume_issue_pages_match.group(3)
-
-        # Step 5: Extract type of publication and institution
-        type_pattern = r'\b(Technical report|Working paper|Thesis|Dissertation)\b'
-        type_match = re.search(type_pattern, reference, re.IGNORECASE)
-        if type_match:
-            parsed_reference['type'] = type_match.group(0)
-
-        # Extract institution (if present)
-        if institution_match:
-            parsed_reference['institution'] = institution_match.group(0)
-
-        # Append parsed reference to the list
-        parsed_references.append(parsed_reference)
+    gazetteer = get_gazetteer(gazetteer_path)
+    parsed_references = [_parse_reference(reference, gazetteer) for reference in references]
+
+    # Only pay for the model when an entity-based field is actually needed
+    needs_nlp = fields is None or any(field in NLP_FIELDS for field in fields)
+    if needs_nlp and references:
+        nlp = get_nlp()
+        with PARSER_STEP_SECONDS.time('spacy'), nlp.select_pipes(enable=_enabled_components(nlp)):
+            docs = nlp.pipe(references, batch_size=batch_size, n_process=n_process)
+            for parsed_reference, doc in zip(parsed_references, docs):
+                # Fall back to the first organisation entity for the institution
+                if not parsed_reference.institution:
+                    organisations = [ent.text for ent in doc.ents if ent.label_ == 'ORG']
+                    if organisations:
+                        parsed_reference.institution = organisations[0]
 
     # Return the list of parsed references
     return parsed_references
 
 
+def _parse_reference(reference, gazetteer=None):
+    """
+    Extracts the regex based fields from a single reference line.
+
+    The line is tokenized once and every field is derived from the tokens (see
+    reference_lexer.extract_fields), instead of scanning the string with a
+    separate regex per field. With a gazetteer the journal and institution
+    are the longest known names found in the same tokens.
+
+    Args:
+        reference (str): A single, stripped reference string.
+        gazetteer (Gazetteer, optional): Known journal and institution names.
+
+    Returns:
+        ParsedReference: The parsed fields for the reference.
+    """
+    with PARSER_STEP_SECONDS.time('tokenize'):
+        tokens = tokenize(reference)
+
+    # Known journal and institution names, which take precedence over the keyword based ones
+    names = None
+    if gazetteer is not None:
+        with PARSER_STEP_SECONDS.time('gazetteer'):
+            names = gazetteer.longest_matches(reference, tokens)
+
+    with PARSER_STEP_SECONDS.time('fields'):
+        fields = extract_fields(reference, tokens, names)
+
+    return ParsedReference(original_string=reference, **fields)
+
+
 # # Example usage:
 # reference_string = """
 # Tang, K., Li, X., Suganthan, P. N., Yang, Z., & Weise, T. (Eds.). (2009a). Benchmark functions for the CEC'2008 special session and competition on large scale global optimization. Technical report (p. 1). University of Science and Technology of China.
@@ -0,0 +1,103 @@
+import base64
+import json
+from sqlalchemy import literal, select, union_all
+from db import db
+
+# Default number of references per page
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+class SortKey:
+    """
+    One column of a keyset ordering.
+    """
+
+    def __init__(self, column, descending=False, nullable=False):
+        self.column = column
+        self.descending = descending
+        self.nullable = nullable
+
+    def order_by(self):
+        return self.column.desc() if self.descending else self.column.asc()
+
+    def value(self, value):
+        # A bound parameter, so booleans compare with < and > like any other value
+        return literal(value, self.column.type)
+
+    def equal(self, value):
+        return self.column.is_(None) if value is None else self.column == self.value(value)
+
+    def after(self, value):
+        """
+        Returns the conditions (one per contiguous index range) for rows that sort after value.
+        SQLite sorts NULLs first in ascending and last in descending order.
+        """
+        if self.descending:
+            if value is None:
+                return []
+            return [self.column < self.value(value)] + ([self.column.is_(None)] if self.nullable else [])
+        if value is None:
+            return [self.column.is_not(None)]
+        return [self.column > self.value(value)]
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(token):
+    """
+    Decodes a cursor from a query string, returning None for a missing or malformed one.
+    """
+    if not token:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+    except ValueError:
+        return None
+    return values if isinstance(values, list) else None
+
+
+def seek_page(model, filters, sort_keys, cursor=None, page_size=PAGE_SIZE):
+    """
+    Fetches one page of model rows with keyset (seek) pagination.
+
+    Instead of an OFFSET, the page starts right after the sort key values of the
+    previous page's last row. Because the sort keys mix directions, "after the
+    cursor" is split into one branch per index range, each fetched in index order
+    with its own LIMIT. Only those few rows are merged and sorted, so the cost does
+    not depend on how deep the page is.
+
+    Args:
+        model: The mapped class to query.
+        filters (list): Conditions every row must match, e.g. the project id.
+        sort_keys (list): SortKey objects; the last one must be unique (the primary key).
+        cursor (list, optional): Sort key values of the last row of the previous page.
+        page_size (int): Number of rows per page.
+
+    Returns:
+        tuple: (rows, next_cursor), where next_cursor is None on the last page.
+    """
+    order = [key.order_by() for key in sort_keys]
+
+    if cursor is None or len(cursor) != len(sort_keys):
+        query = select(model).where(*filters).order_by(*order).limit(page_size + 1)
+    else:
+        branches = []
+        for index in range(len(sort_keys) - 1, -1, -1):
+            prefix = [key.equal(value) for key, value in zip(sort_keys[:index], cursor[:index])]
+            for condition in sort_keys[index].after(cursor[index]):
+                branch = select(model).where(*filters, *prefix, condition).order_by(*order).limit(page_size + 1)
+                branches.append(select(branch.subquery().c.id))
+        if not branches:
+            return [], None
+        candidates = union_all(*branches).subquery()
+        query = select(model).where(model.id.in_(select(candidates.c.id))).order_by(*order).limit(page_size + 1)
+
+    rows = db.session.execute(query).scalars().all()
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    last = rows[-1]
+    return rows, encode_cursor([getattr(last, key.column.key) for key in sort_keys])
@@ -0,0 +1,214 @@
+import hashlib
+import json
+import threading
+import unicodedata
+from collections import OrderedDict
+from flask import has_app_context
+from sqlalchemy import insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from db import db
+from models import ParseCacheEntry
+from parsed_reference import EMPTY, ParsedReference
+from metrics import DB_PHASE_SECONDS
+
+# Databases whose INSERT can skip rows that already exist in one statement
+ON_CONFLICT_INSERTS = {'sqlite': sqlite_insert, 'postgresql': postgresql_insert}
+
+# Default number of parsed references kept in memory per process
+PARSE_CACHE_SIZE = 10000
+
+# SQLite limits the number of bound parameters per statement
+LOOKUP_CHUNK_SIZE = 500
+
+
+def normalize_reference(reference):
+    """
+    Normalizes a reference string so that pastes differing only in unicode form or whitespace share a cache entry.
+    """
+    return ' '.join(unicodedata.normalize('NFC', reference).split())
+
+
+def cache_key(normalized_reference, version):
+    """
+    Returns the content address of a normalized reference for a given parser version.
+    """
+    return hashlib.sha256(f'{version}\0{normalized_reference}'.encode('utf-8')).hexdigest()
+
+
+class ParseCache:
+    """
+    Content-addressed cache in front of a reference parser.
+
+    Lookups go to a bounded in-process LRU first and then to the ParseCacheEntry
+    table, so a freshly started process still gets hits. Only the misses are sent
+    to the parser, in one call. New entries are added to the current database
+    session and are committed together with the caller's changes.
+    """
+
+    def __init__(self, parser, version, max_entries=PARSE_CACHE_SIZE, persistent=True):
+        """
+        Args:
+            parser (callable): Takes newline separated references and returns one ParsedReference per line, like nlp_parser.
+            version (str): Parser version tag. Entries from other versions are never returned.
+            max_entries (int): Size of the in-memory LRU tier.
+            persistent (bool): Whether to use the ParseCacheEntry table.
+        """
+        self.parser = parser
+        self.version = version
+        self.max_entries = max_entries
+        self.persistent = persistent
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {'memory_hits': 0, 'persistent_hits': 0, 'misses': 0, 'evictions': 0}
+
+    def parse(self, reference_string):
+        """
+        Parses newline separated references, skipping empty lines like nlp_parser does.
+        """
+        return self.parse_lines(ref.strip() for ref in reference_string.split('\n') if ref.strip())
+
+    def parse_lines(self, lines):
+        """
+        Parses a sequence of single-line references through the cache.
+
+        Args:
+            lines (iterable): Non-empty reference strings.
+
+        Returns:
+            list: One ParsedReference per line. 'original_string' is always the line as given.
+        """
+        lines = list(lines)
+        results = self.lookup_lines(lines)
+
+        # Parse each distinct miss once
+        missing = {}
+        for line, parsed_reference in zip(lines, results):
+            if parsed_reference is None:
+                missing.setdefault(normalize_reference(line), line)
+        if missing:
+            parsed = dict(zip(missing, self.parser('\n'.join(missing))))
+            self.store_lines(missing, parsed.values())
+            for index, line in enumerate(lines):
+                if results[index] is None:
+                    results[index] = parsed[normalize_reference(line)].with_original_string(line)
+        return results
+
+    def lookup_lines(self, lines):
+        """
+        Looks up already parsed references without running the parser.
+
+        Args:
+            lines (list): Non-empty reference strings.
+
+        Returns:
+            list: The ParsedReference for every line found in the cache, None for the others.
+        """
+        keys = [cache_key(normalize_reference(line), self.version) for line in lines]
+
+        found = self._get_memory(keys)
+        missing = [key for key in dict.fromkeys(keys) if key not in found]
+        if missing and self.persistent and has_app_context():
+            found.update(self._get_persistent(missing))
+
+        results = []
+        for line, key in zip(lines, keys):
+            if key in found:
+                results.append(found[key].with_original_string(line))
+            else:
+                results.append(None)
+        return results
+
+    def store_lines(self, lines, parsed):
+        """
+        Adds parser output for the given lines to both tiers and counts them as misses.
+
+        Args:
+            lines (iterable): The reference strings that were parsed.
+            parsed (list): The parser output, one ParsedReference per line.
+        """
+        entries = {}
+        for line, parsed_reference in zip(lines, parsed):
+            # Entries are shared by every line with the same normalized text
+            entries[cache_key(normalize_reference(line), self.version)] = parsed_reference.with_original_string(EMPTY)
+        with self.lock:
+            self.counters['misses'] += len(entries)
+        self._put_memory(entries)
+        if self.persistent and has_app_context():
+            self._put_persistent(entries)
+
+    def _get_memory(self, keys):
+        found = {}
+        with self.lock:
+            for key in keys:
+                if key in self.entries:
+                    self.entries.move_to_end(key)
+                    found[key] = self.entries[key]
+            self.counters['memory_hits'] += len(found)
+        return found
+
+    def _put_memory(self, entries):
+        with self.lock:
+            for key, parsed_reference in entries.items():
+                self.entries[key] = parsed_reference
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.counters['evictions'] += 1
+
+    def _get_persistent(self, keys):
+        found = {}
+        with DB_PHASE_SECONDS.time('cache_lookup'):
+            for start in range(0, len(keys), LOOKUP_CHUNK_SIZE):
+                chunk = keys[start:start + LOOKUP_CHUNK_SIZE]
+                rows = db.session.query(ParseCacheEntry.key, ParseCacheEntry.payload).filter(
+                    ParseCacheEntry.key.in_(chunk),
+                    ParseCacheEntry.parser_version == self.version
+                )
+                for key, payload in rows:
+                    found[key] = ParsedReference.from_dict(json.loads(payload))
+        with self.lock:
+            self.counters['persistent_hits'] += len(found)
+        # Promote to the memory tier so the next lookup is cheap
+        self._put_memory(found)
+        return found
+
+    def _put_persistent(self, entries):
+        rows = [
+            {'key': key, 'parser_version': self.version, 'payload': json.dumps(parsed_reference.to_dict())}
+            for key, parsed_reference in entries.items()
+        ]
+        if not rows:
+            return
+        # Another process may have stored the same reference in the meantime
+        with DB_PHASE_SECONDS.time('cache_store'):
+            dialect = db.engine.dialect.name
+            if dialect in ON_CONFLICT_INSERTS:
+                db.session.execute(ON_CONFLICT_INSERTS[dialect](ParseCacheEntry).on_conflict_do_nothing(), rows)
+                return
+            # Other databases: one savepoint per row, so a conflict only skips that row
+            for row in rows:
+                try:
+                    with db.session.begin_nested():
+                        db.session.execute(insert(ParseCacheEntry), row)
+                except IntegrityError:
+                    pass
+
+    def stats(self):
+        """
+        Returns the hit/miss/eviction counters and the current size of the memory tier.
+        """
+        with self.lock:
+            stats = dict(self.counters)
+            stats['memory_entries'] = len(self.entries)
+        stats['max_entries'] = self.max_entries
+        stats['version'] = self.version
+        return stats
+
+    def clear(self):
+        """
+        Empties the memory tier. The persistent tier is left untouched.
+        """
+        with self.lock:
+            self.entries.clear()
@@ -0,0 +1,107 @@
+# Value of every field a parser did not find. Falsy, and safe to store in the
+# non-nullable author and title columns.
+EMPTY = ''
+
+# Fields produced by the parsers, in a fixed order. parser, confidence and
+# parse_reason are filled in by the cascade (see cascade.ParserCascade).
+PARSED_FIELDS = (
+    'authors', 'year', 'title', 'journal', 'book_title', 'volume', 'issue', 'pages', 'doi',
+    'editors', 'institution', 'type', 'original_string', 'parser', 'confidence', 'parse_reason'
+)
+
+# Length of Reference.parse_reason
+MAX_REASON_LENGTH = 200
+
+
+class ParsedReference:
+    """
+    The fields parsed from one reference string, produced by every parser.
+
+    A __slots__ record instead of a dict: it is a fraction of the size, all
+    parsers use the same field names and the same EMPTY value for fields they
+    did not find, and as_row() maps it straight to a Reference insert mapping.
+    """
+    __slots__ = PARSED_FIELDS
+
+    def __init__(self, authors=EMPTY, year=EMPTY, title=EMPTY, journal=EMPTY, book_title=EMPTY, volume=EMPTY,
+                 issue=EMPTY, pages=EMPTY, doi=EMPTY, editors=EMPTY, institution=EMPTY, type=EMPTY,
+                 original_string=EMPTY, parser=EMPTY, confidence=0.0, parse_reason=EMPTY):
+        self.authors = authors
+        self.year = year
+        self.title = title
+        self.journal = journal
+        self.book_title = book_title
+        self.volume = volume
+        self.issue = issue
+        self.pages = pages
+        self.doi = doi
+        self.editors = editors
+        self.institution = institution
+        self.type = type
+        self.original_string = original_string
+        self.parser = parser
+        self.confidence = confidence
+        self.parse_reason = parse_reason
+
+    @classmethod
+    def from_match(cls, match, original_string):
+        """
+        Builds a record from a regex match whose group names are PARSED_FIELDS; unmatched groups are EMPTY.
+        """
+        return cls(original_string=original_string, **{
+            field: value for field, value in match.groupdict().items() if value is not None
+        })
+
+    @classmethod
+    def from_dict(cls, fields):
+        """
+        Builds a record from a mapping such as to_dict() output, ignoring unknown keys.
+        """
+        return cls(**{field: fields[field] for field in PARSED_FIELDS if field in fields})
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in PARSED_FIELDS}
+
+    def with_original_string(self, original_string):
+        """
+        Returns a copy of the record for another reference string with the same parse, e.g. a cache hit.
+        """
+        copy = ParsedReference.__new__(ParsedReference)
+        for field in PARSED_FIELDS:
+            setattr(copy, field, getattr(self, field))
+        copy.original_string = original_string
+        return copy
+
+    def as_row(self, project_id, parser_version=None):
+        """
+        Returns the column mapping of a Reference row for bulk inserts.
+
+        Args:
+            project_id (int): Project of the reference.
+            parser_version (str, optional): Version of the parser that produced the record, e.g. ParseCache.version.
+        """
+        return {
+            'author': self.authors,
+            'title': self.title,
+            'journal': self.journal or self.book_title,
+            'year': self.year,
+            'volume': self.volume,
+            'issue': self.issue,
+            'pages': self.pages,
+            'doi': self.doi,
+            'project_id': project_id,
+            'original_string': self.original_string,
+            'parser': self.parser or None,
+            'parse_confidence': self.confidence if self.parser else None,
+            'parse_reason': self.parse_reason[:MAX_REASON_LENGTH] or None,
+            'parser_version': parser_version
+        }
+
+    def __eq__(self, other):
+        if not isinstance(other, ParsedReference):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in PARSED_FIELDS)
+
+    def __repr__(self):
+        fields = ', '.join(f'{field}={getattr(self, field)!r}' for field in PARSED_FIELDS if getattr(self, field))
+        return f'ParsedReference({fields})'
@@ -0,0 +1,234 @@
+import re
+import string
+
+# Splits a reference into maximal runs of ASCII letters, of digits and of whitespace,
+# and single characters for everything else (punctuation, dashes, other letters).
+# The tokens partition the string, so joining any slice of them gives back the text.
+TOKEN = re.compile(r'[A-Za-z]+|\d+|\s+|.', re.DOTALL)
+
+LETTERS = frozenset(string.ascii_letters)
+UPPERCASE = frozenset(string.ascii_uppercase)
+LOWERCASE = frozenset(string.ascii_lowercase)
+
+# Empty tokens appended to the list so the few tokens looked ahead at always exist
+LOOKAHEAD = 8
+
+# Tokens between "http"/"https" and the rest of a DOI link
+DOI_TOKENS = [':', '/', '/', 'doi', '.', 'org', '/']
+
+# Institution keywords, matched case-insensitively anywhere inside a word, and the
+# keyword that must be followed by " of <name>"
+INSTITUTION_WORDS = ('university', 'institute', 'laboratory', 'technology')
+SCHOOL_WORD = 'school'
+
+# Single word and two word publication types
+TYPE_WORDS = frozenset(('thesis', 'dissertation'))
+TYPE_PHRASES = {'technical': 'report', 'working': 'paper'}
+
+
+def tokenize(reference):
+    """
+    Splits a reference string into TOKEN runs.
+    """
+    return TOKEN.findall(reference)
+
+
+def _is_word_char(token):
+    # Whether a token starts with a character of the re module's \w class
+    return token[:1].isalnum() or token[:1] == '_'
+
+
+def _name_end(tokens, index):
+    """
+    Returns the index after an author name starting at tokens[index]: a surname of
+    letters and hyphens followed by ", X." initials, each optionally followed by
+    one space. Returns None if the surname has no initials.
+    """
+    while tokens[index][:1] in LETTERS or tokens[index] == '-':
+        index += 1
+    end = None
+    while tokens[index] == ',' and tokens[index + 1] == ' ' and len(tokens[index + 2]) == 1 \
+            and tokens[index + 2] in UPPERCASE and tokens[index + 3] == '.':
+        index += 4
+        if tokens[index] == ' ':
+            index += 1
+        end = index
+    return end
+
+
+def _non_space_end(tokens, index):
+    while tokens[index] and not tokens[index].isspace():
+        index += 1
+    return index
+
+
+def extract_fields(reference, tokens, names=None):
+    """
+    Derives the regex based fields of a reference from its tokens in a single pass.
+
+    Every field is recognised from the token at hand and a few tokens after it,
+    so the work per line is linear in its length:
+
+    - doi: the first link to https://doi.org/, up to the next whitespace
+    - authors: every "Surname, I. J." name, or "& Surname, I." after the first one
+    - year: the first "(YYYY)" or "(YYYYa)"
+    - volume, issue and pages: the first "V(I), P" or "V(I), P–Q"
+    - type: the first "Technical report", "Working paper", "Thesis" or "Dissertation" word
+    - institution: the first University, Institute, Laboratory, Technology or "School of X"
+    - title: the text after the year, up to the institution, else up to the run of words
+      before "V(" (the journal), else up to the next full stop
+
+    Keywords match case-insensitively. Institution and title are only filled when a year was found.
+    Known names (e.g. from a gazetteer) replace the journal and institution found
+    above, and the title ends at the first of them after the year.
+
+    Args:
+        reference (str): A single, stripped reference string.
+        tokens (list): The reference split by tokenize().
+        names (dict, optional): (start, end) character spans of known names by field name.
+
+    Returns:
+        dict: The fields that were found, by ParsedReference field name.
+    """
+    fields = {}
+    count = len(tokens)
+    tokens = tokens + [''] * LOOKAHEAD
+    authors = []
+    names_from = 0            # Author names never overlap: the next one starts at or after this token
+    in_name = False           # The previous token was part of a surname
+    run_start = None          # Offset of the current run of letters and whitespace
+    year_end = None
+    institution_start = None
+    journal_start = None
+    position = 0
+
+    for index in range(count):
+        token = tokens[index]
+        first = token[0]
+
+        if first in LETTERS:
+            if run_start is None:
+                run_start = position
+            lower = token.lower()
+            after = tokens[index + 1]
+
+            # "https://doi.org/...", possibly glued to the word before it
+            if after == ':' and 'doi' not in fields and token.endswith(('http', 'https')) \
+                    and tokens[index + 1:index + 8] == DOI_TOKENS and tokens[index + 8] and not tokens[index + 8].isspace():
+                link_start = len(token) - (5 if token.endswith('https') else 4)
+                fields['doi'] = token[link_start:] + ''.join(tokens[index + 1:_non_space_end(tokens, index + 8)])
+
+            if institution_start is None and len(token) >= 6:
+                found = [(lower.find(word), word) for word in INSTITUTION_WORDS if word in lower]
+                if lower.endswith(SCHOOL_WORD) and after == ' ' and tokens[index + 2].lower() == 'of' \
+                        and tokens[index + 3] == ' ' and tokens[index + 4]:
+                    found.append((len(token) - len(SCHOOL_WORD), None))
+                if found:
+                    start, word = min(found)
+                    institution_start = position + start
+                    if word is None:
+                        fields['institution'] = token[start:] + ''.join(tokens[index + 1:_non_space_end(tokens, index + 4)])
+                    else:
+                        fields['institution'] = token[start:start + len(word)]
+
+            if 'type' not in fields and (lower in TYPE_WORDS or lower in TYPE_PHRASES) \
+                    and (index == 0 or not _is_word_char(tokens[index - 1][-1])):
+                if lower in TYPE_WORDS:
+                    if not _is_word_char(after):
+                        fields['type'] = token
+                elif after == ' ' and tokens[index + 2].lower() == TYPE_PHRASES[lower] \
+                        and not _is_word_char(tokens[index + 3]):
+                    fields['type'] = token + ' ' + tokens[index + 2]
+
+            # "Surname, I." names start at the first letter or hyphen of a surname
+            if not in_name and index >= names_from:
+                end = _name_end(tokens, index)
+                if end is not None:
+                    authors.append(''.join(tokens[index:end]).strip())
+                    names_from = end
+            in_name = True
+
+        elif first.isspace():
+            if run_start is None:
+                run_start = position
+            in_name = False
+
+        else:
+            after = tokens[index + 1]
+
+            # A run of words followed by ", V(" or " V(" is taken to be the journal name
+            if run_start is not None:
+                if journal_start is None:
+                    if token == ',':
+                        if after == ' ' and len(tokens[index + 2]) <= 2 and tokens[index + 2].isdecimal() \
+                                and tokens[index + 3] == '(':
+                            journal_start = run_start
+                    elif len(token) <= 2 and token.isdecimal() and after == '(' \
+                            and tokens[index - 1][-1] == ' ' and position - run_start >= 2:
+                        journal_start = run_start
+                run_start = None
+
+            if token == '-':
+                if not in_name and index >= names_from:
+                    end = _name_end(tokens, index)
+                    if end is not None:
+                        authors.append(''.join(tokens[index:end]).strip())
+                        names_from = end
+                in_name = True
+            else:
+                in_name = False
+
+            if token == '(':
+                if year_end is None and len(after) == 4 and after.isdecimal():
+                    suffix = tokens[index + 2]
+                    if suffix == ')':
+                        fields['year'] = after
+                        year_end = position + 6
+                    elif len(suffix) == 1 and suffix in LOWERCASE and tokens[index + 3] == ')':
+                        fields['year'] = after + suffix
+                        year_end = position + 7
+
+            elif token == '&':
+                if index >= names_from and after == ' ' \
+                        and (tokens[index + 2][:1] in LETTERS or tokens[index + 2] == '-'):
+                    end = _name_end(tokens, index + 2)
+                    if end is not None:
+                        authors.append(''.join(tokens[index:end]).strip())
+                        names_from = end
+
+            elif after == '(' and 'volume' not in fields and token.isdecimal():
+                # Volume(issue), pages
+                if tokens[index + 2].isdecimal() and tokens[index + 3] == ')' and tokens[index + 4] == ',':
+                    pages = index + 5
+                    if tokens[pages].isspace():
+                        pages += 1
+                    if tokens[pages].isdecimal():
+                        fields['volume'] = token
+                        fields['issue'] = tokens[index + 2]
+                        fields['pages'] = tokens[pages]
+                        if tokens[pages + 1] == '–' and tokens[pages + 2].isdecimal():
+                            fields['pages'] += '–' + tokens[pages + 2]
+
+        position += len(token)
+
+    if authors:
+        fields['authors'] = ', '.join(authors)
+
+    if year_end is not None:
+        if institution_start is not None:
+            fields['title'] = reference[year_end:institution_start].strip('. ')
+        elif journal_start is not None:
+            fields['title'] = reference[year_end:journal_start].strip('. ')
+        else:
+            fields['title'] = reference[year_end:].split('.')[0].strip()
+    elif 'institution' in fields:
+        del fields['institution']
+
+    if names:
+        for field, (start, end) in names.items():
+            fields[field] = reference[start:end]
+        starts = [start for start, _ in names.values() if year_end is not None and start >= year_end]
+        if starts:
+            fields['title'] = reference[year_end:min(starts)].strip('. ')
+
+    return fields
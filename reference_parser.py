@@ -1,76 +1,148 @@
 import re
+from parsed_reference import ParsedReference
 
-class ReferenceParser:
-    
-    def __init__(self, reference_string):
-        self.reference_string = reference_string.strip()
-        self.regex_patterns = self.define_regex_patterns()
-        self.parsed_reference = self.parse_reference()
+# Every supported format has the authors followed by " (YYYY). ", so lines
+# without this marker are rejected before any pattern is tried.
+YEAR_MARKER = re.compile(r' \(\d{4}[a-z]?\)\. ')
 
-    def define_regex_patterns(self):
-        """
-        Define multiple regex patterns for parsing different reference formats.
-        """
-        patterns = [
-            # Pattern 1: General format (authors, year, title, journal, volume(issue), pages)
-            r'(?P<authors>.+?) \((?P<year>\d{4}[a-z]?)\)\. (?P<title>.+?)\. (?P<journal>.+?), (?P<volume>\d+)\((?P<issue>\d+)\), (?P<pages>\d+–?\d*)\.?(?P<doi>https?://[^\s]+)?',
-            
-            # Pattern 2: Format without issue number
-            r'(?P<authors>.+?) \((?P<year>\d{4}[a-z]?)\)\. (?P<title>.+?)\. (?P<journal>.+?), (?P<volume>\d+), (?P<pages>\d+–?\d*)\.?(?P<doi>https?://[^\s]+)?',
-            
-            # Pattern 3: Conference or book format
-            r'(?P<authors>.+?) \((?P<year>\d{4}[a-z]?)\)\. (?P<title>.+?)\. In: (?P<editor>.+?), (?P<book_title>.+?), (?P<pages>\d+–?\d*)\.?(?P<doi>https?://[^\s]+)?',
+# Cheap markers that a line must contain for a given pattern to match
+VOLUME_ISSUE_MARKER = re.compile(r'\d\(\d+\), \d')
+VOLUME_MARKER = re.compile(r', \d+, \d')
+EDITOR_MARKER = 'In: '
+PAGES_MARKER = ', pp. '
 
-            # Pattern 4: Technical report format
-            r'(?P<authors>.+?) \((?P<year>\d{4}[a-z]?)\)\. (?P<title>.+?)\. (?P<report>.+?)\. (?P<institution>.+?)\.?(?P<doi>https?://[^\s]+)?'
-        ]
-        return patterns
 
-    def apply_regex_patterns(self):
+class PatternSet:
+    """
+    A list of regex patterns compiled once and shared by all parser instances.
+
+    Each pattern comes with the markers a line must contain for it to match,
+    so most patterns are skipped without running the backtracking regex. The
+    search stops as soon as no remaining pattern can beat the best score.
+    """
+
+    def __init__(self, patterns, flags=0):
+        """
+        Args:
+            patterns (list): (regex, markers) tuples, in order of preference. Markers are
+                plain strings or compiled regexes that must all be found in the line.
+            flags (int): Flags used to compile every pattern.
         """
-        Apply each regex pattern to the reference string and return the best match.
+        self.patterns = [(re.compile(pattern, flags), tuple(markers)) for pattern, markers in patterns]
+
+        # Highest score any pattern from position i onwards can reach
+        self.remaining_max_scores = []
+        best = 0
+        for pattern, _ in reversed(self.patterns):
+            best = max(best, pattern.groups)
+            self.remaining_max_scores.append(best)
+        self.remaining_max_scores.reverse()
+
+    @staticmethod
+    def has_markers(reference_string, markers):
+        for marker in markers:
+            if isinstance(marker, str):
+                if marker not in reference_string:
+                    return False
+            elif not marker.search(reference_string):
+                return False
+        return True
+
+    def best_match(self, reference_string):
         """
+        Apply the patterns to the reference string and return the match with the
+        most captured groups (the first one on ties), or None.
+        """
+        if not YEAR_MARKER.search(reference_string):
+            return None
+
         best_match = None
         max_score = 0
 
-        for pattern in self.regex_patterns:
-            match = re.search(pattern, self.reference_string)
+        for index, (pattern, markers) in enumerate(self.patterns):
+            # Nothing left can beat the current match
+            if max_score >= self.remaining_max_scores[index]:
+                break
+            if not self.has_markers(reference_string, markers):
+                continue
+
+            match = pattern.search(reference_string)
             if match:
                 # Evaluate how many fields were matched
-                score = len([group for group in match.groupdict().values() if group is not None])
+                score = len([group for group in match.groups() if group is not None])
                 if score > max_score:
                     max_score = score
                     best_match = match
 
         return best_match
 
+
+REFERENCE_PATTERNS = PatternSet([
+    # Pattern 1: General format (authors, year, title, journal, volume(issue), pages)
+    (r'(?P<authors>.+?) \((?P<year>\d{4}[a-z]?)\)\. (?P<title>.+?)\. (?P<journal>.+?), (?P<volume>\d+)\((?P<issue>\d+)\), (?P<pages>\d+–?\d*)\.?(?P<doi>https?://[^\s]+)?',
+     [VOLUME_ISSUE_MARKER]),
+
+    # Pattern 2: Format without issue number
+    (r'(?P<authors>.+?) \((?P<year>\d{4}[a-z]?)\)\. (?P<title>.+?)\. (?P<journal>.+?), (?P<volume>\d+), (?P<pages>\d+–?\d*)\.?(?P<doi>https?://[^\s]+)?',
+     [VOLUME_MARKER]),
+
+    # Pattern 3: Conference or book format
+    (r'(?P<authors>.+?) \((?P<year>\d{4}[a-z]?)\)\. (?P<title>.+?)\. In: (?P<editors>.+?), (?P<book_title>.+?), (?P<pages>\d+–?\d*)\.?(?P<doi>https?://[^\s]+)?',
+     [EDITOR_MARKER]),
+
+    # Pattern 4: Technical report format
+    (r'(?P<authors>.+?) \((?P<year>\d{4}[a-z]?)\)\. (?P<title>.+?)\. (?P<type>.+?)\. (?P<institution>.+?)\.?(?P<doi>https?://[^\s]+)?',
+     []),
+])
+
+BRUTE_FORCE_PATTERNS = PatternSet([
+    # Journal article format with DOI, handling multiline input
+    (r'(?P<authors>.+?) \((?P<year>\d{4}[a-z]?)\)\. (?P<title>.+?)\. (?P<journal>.+?), (?P<volume>\d+)\((?P<issue>\d+)\), (?P<pages>\d+–?\d*)\. (?P<doi>https?://[^\s]+)',
+     [VOLUME_ISSUE_MARKER]),
+
+    # Journal article format without DOI, handling multiline input
+    (r'(?P<authors>.+?) \((?P<year>\d{4}[a-z]?)\)\. (?P<title>.+?)\. (?P<journal>.+?), (?P<volume>\d+)\((?P<issue>\d+)\), (?P<pages>\d+–?\d*)',
+     [VOLUME_ISSUE_MARKER]),
+
+    # Conference paper or book chapter format, handling multiline input
+    (r'(?P<authors>.+?) \((?P<year>\d{4}[a-z]?)\)\. (?P<title>.+?)\. In: (?P<editors>.+?), (?P<book_title>.+?), pp\. (?P<pages>\d+–?\d*)\. (?P<doi>https?://[^\s]+)?',
+     [EDITOR_MARKER, PAGES_MARKER]),
+
+    # Technical report or book format, handling multiline input
+    (r'(?P<authors>.+?) \((?P<year>\d{4}[a-z]?)\)\. (?P<title>.+?)\. (?P<type>.+?)\. (?P<institution>.+?)\. (?P<doi>https?://[^\s]+)?',
+     []),
+], re.DOTALL)
+
+
+class ReferenceParser:
+    
+    def __init__(self, reference_string):
+        self.reference_string = reference_string.strip()
+        self.regex_patterns = self.define_regex_patterns()
+        self.parsed_reference = self.parse_reference()
+
+    def define_regex_patterns(self):
+        """
+        Return the shared, precompiled patterns for the different reference formats.
+        """
+        return REFERENCE_PATTERNS
+
+    def apply_regex_patterns(self):
+        """
+        Apply the regex patterns to the reference string and return the best match.
+        """
+        return self.regex_patterns.best_match(self.reference_string)
+
     def parse_reference(self):
         """
         Parse the reference string by trying multiple regex patterns and choosing the best one.
         """
         match = self.apply_regex_patterns()
         if match:
-            parsed_reference = match.groupdict()
-            # Fill missing fields with a blank space
-            for field in ['authors', 'year', 'title', 'journal', 'volume', 'issue', 'pages', 'doi', 'book_title', 'editor', 'report', 'institution']:
-                if field not in parsed_reference or parsed_reference[field] is None:
-                    parsed_reference[field] = ' '  # Fill missing fields with a blank space
-            return parsed_reference
+            # Fields the pattern did not capture are left EMPTY
+            return ParsedReference.from_match(match, self.reference_string)
         else:
-            return {
-                'authors': ' ',
-                'year': ' ',
-                'title': ' ',
-                'journal': ' ',
-                'volume': ' ',
-                'issue': ' ',
-                'pages': ' ',
-                'doi': ' ',
-                'book_title': ' ',
-                'editor': ' ',
-                'report': ' ',
-                'institution': ' '
-            }
+            return ParsedReference(original_string=self.reference_string)
 
     def get_parsed_reference(self):
         return self.parsed_reference
@@ -85,40 +157,15 @@ class BruteForceReferenceParser:
 
     def define_regex_patterns(self):
         """
-        Define multiple regex patterns for parsing different reference formats.
+        Return the shared, precompiled patterns for the different reference formats.
         """
-        patterns = [
-            # Journal article format with DOI, handling multiline input
-            r'(?P<authors>.+?) \((?P<year>\d{4}[a-z]?)\)\. (?P<title>.+?)\. (?P<journal>.+?), (?P<volume>\d+)\((?P<issue>\d+)\), (?P<pages>\d+–?\d*)\. (?P<doi>https?://[^\s]+)',
-            
-            # Journal article format without DOI, handling multiline input
-            r'(?P<authors>.+?) \((?P<year>\d{4}[a-z]?)\)\. (?P<title>.+?)\. (?P<journal>.+?), (?P<volume>\d+)\((?P<issue>\d+)\), (?P<pages>\d+–?\d*)',
-            
-            # Conference paper or book chapter format, handling multiline input
-            r'(?P<authors>.+?) \((?P<year>\d{4}[a-z]?)\)\. (?P<title>.+?)\. In: (?P<editor>.+?), (?P<book_title>.+?), pp\. (?P<pages>\d+–?\d*)\. (?P<doi>https?://[^\s]+)?',
-
-            # Technical report or book format, handling multiline input
-            r'(?P<authors>.+?) \((?P<year>\d{4}[a-z]?)\)\. (?P<title>.+?)\. (?P<report>.+?)\. (?P<institution>.+?)\. (?P<doi>https?://[^\s]+)?'
-        ]
-        return patterns
+        return BRUTE_FORCE_PATTERNS
 
     def apply_regex_patterns(self, reference_string):
         """
-        Apply each regex pattern to the reference string and return the best match.
+        Apply the regex patterns to the reference string and return the best match.
         """
-        best_match = None
-        max_score = 0
-
-        for pattern in self.regex_patterns:
-            match = re.search(pattern, reference_string, re.DOTALL)
-            if match:
-                # Evaluate how many fields were matched
-                score = len([group for group in match.groupdict().values() if group is not None])
-                if score > max_score:
-                    max_score = score
-                    best_match = match
-
-        return best_match
+        return self.regex_patterns.best_match(reference_string)
 
     def parse_reference(self, reference_string):
         """
@@ -126,27 +173,10 @@ class BruteForceReferenceParser:
         """
         match = self.apply_regex_patterns(reference_string)
         if match:
-            parsed_reference = match.groupdict()
-            # Fill missing fields with a blank space
-            for field in ['authors', 'year', 'title', 'journal', 'volume', 'issue', 'pages', 'doi', 'book_title', 'editor', 'report', 'institution']:
-                if field not in parsed_reference or parsed_reference[field] is None:
-                    parsed_reference[field] = ' '  # Fill missing fields with a blank space
-            return parsed_reference
+            # Fields the pattern did not capture are left EMPTY
+            return ParsedReference.from_match(match, reference_string)
         else:
-            return {
-                'authors': ' ',
-                'year': ' ',
-                'title': ' ',
-                'journal': ' ',
-                'volume': ' ',
-                'issue': ' ',
-                'pages': ' ',
-                'doi': ' ',
-                'book_title': ' ',
-                'editor': ' ',
-                'report': ' ',
-                'institution': ' '
-            }
+            return ParsedReference(original_string=reference_string)
 
     def parse_multiple_references(self):
         """
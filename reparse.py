@@ -0,0 +1,165 @@
+from collections import defaultdict, deque
+from concurrent.futures.process import BrokenProcessPool
+from sqlalchemy import or_, select, update
+from db import db
+from models import Reference
+from bulk import DEDUP_FIELDS
+from dedup import check_references
+from jobs import discard_executor, get_executor, parse_lines
+from parse_cache import normalize_reference
+from parsed_reference import ParsedReference
+from metrics import DB_PHASE_SECONDS
+
+# Number of references read, parsed, written back and committed together
+REPARSE_CHUNK_SIZE = 500
+
+# Chunks being parsed by the pool while the oldest one is written back
+CHUNKS_IN_FLIGHT = 4
+
+# Columns filled by the parser; a row is only rewritten when one of them changes
+PARSED_COLUMNS = ('author', 'title', 'journal', 'year', 'volume', 'issue', 'pages', 'doi')
+
+# Columns describing the parse, written for every re-parsed row
+PARSE_INFO_COLUMNS = ('parser', 'parse_confidence', 'parse_reason', 'parser_version')
+
+
+def stale_references(version, project_id=None):
+    """
+    Returns a query for the references that were parsed by another parser version than
+    the given one (or before versions were recorded) and can be parsed again: they are
+    not reviewed and still have their original string.
+    """
+    query = select(Reference.__table__).where(
+        or_(Reference.parser_version.is_(None), Reference.parser_version != version),
+        Reference.reviewed.is_(False),
+        Reference.original_string.isnot(None),
+        Reference.original_string != ''
+    )
+    if project_id is not None:
+        query = query.where(Reference.project_id == project_id)
+    return query
+
+
+def _read_chunk(version, project_id, after_id, chunk_size):
+    query = stale_references(version, project_id).where(Reference.id > after_id).order_by(Reference.id).limit(chunk_size)
+    return db.session.execute(query).mappings().all()
+
+
+def _comparable(value):
+    # Years come back from SQLite as integers but are parsed as strings
+    return '' if value is None else str(value)
+
+
+def write_back(rows, parsed_refs, version):
+    """
+    Writes re-parsed fields over the given rows with bulk updates and re-checks duplicates.
+
+    Rows whose parsed columns did not change only get their PARSE_INFO_COLUMNS
+    updated, so their project's revision (and printed bibliography) stays valid.
+
+    Args:
+        rows (list): Reference row mappings as read by stale_references().
+        parsed_refs (list): One ParsedReference per row.
+        version (str): Parser version stored on the rows.
+
+    Returns:
+        int: Number of rows whose parsed columns changed.
+    """
+    changed = []
+    unchanged = []
+    recheck = defaultdict(list)
+    for row, parsed_ref in zip(rows, parsed_refs):
+        values = parsed_ref.as_row(row['project_id'], version)
+        if any(_comparable(values[column]) != _comparable(row[column]) for column in PARSED_COLUMNS):
+            changed.append({'id': row['id'], **{column: values[column] for column in PARSED_COLUMNS + PARSE_INFO_COLUMNS}})
+            if any(_comparable(values[column]) != _comparable(row[column]) for column in DEDUP_FIELDS):
+                recheck[row['project_id']].append(row['id'])
+        else:
+            unchanged.append({'id': row['id'], **{column: values[column] for column in PARSE_INFO_COLUMNS}})
+
+    with DB_PHASE_SECONDS.time('update'):
+        if changed:
+            db.session.execute(update(Reference), changed)
+        if unchanged:
+            db.session.execute(update(Reference), unchanged)
+
+    # Re-check the references whose title, year or DOI changed and the ones marked as duplicates of them
+    with DB_PHASE_SECONDS.time('dedup'):
+        for project_id, ids in recheck.items():
+            ids = set(ids)
+            ids.update(db.session.execute(select(Reference.id).where(Reference.duplicate_of.in_(list(ids)))).scalars())
+            refs = db.session.execute(
+                select(Reference.id, Reference.title, Reference.year, Reference.doi).where(Reference.id.in_(sorted(ids)))
+            ).mappings()
+            check_references(project_id, [dict(ref) for ref in refs])
+    return len(changed)
+
+
+def reparse_references(cache, project_id=None, chunk_size=REPARSE_CHUNK_SIZE, max_workers=None):
+    """
+    Re-parses the stale references (see stale_references) with the cache's parser.
+
+    Rows are read in id order, chunk_size at a time, and parsed in the shared job
+    process pool with several chunks in flight. Results already in the parse cache
+    are reused. Every chunk is written back and committed on its own, so an
+    interrupted run loses at most the chunks in flight: the next run skips the
+    rows that already carry the current version and picks up the rest.
+
+    Args:
+        cache (ParseCache): Cache whose parser and version are used.
+        project_id (int, optional): Only re-parse this project's references.
+        chunk_size (int): Number of references per chunk and commit.
+        max_workers (int, optional): Size of the process pool if it is created by this call.
+
+    Yields:
+        dict: Progress after every committed chunk.
+    """
+    executor = get_executor(max_workers)
+    in_flight = deque()
+    after_id = 0
+    exhausted = False
+    progress = {'reparsed': 0, 'changed': 0, 'chunks': 0, 'last_id': None, 'done': False}
+
+    while in_flight or not exhausted:
+        # Keep the pool busy: read and submit chunks until enough are in flight
+        while not exhausted and len(in_flight) < CHUNKS_IN_FLIGHT:
+            rows = _read_chunk(cache.version, project_id, after_id, chunk_size)
+            if not rows:
+                exhausted = True
+                break
+            after_id = rows[-1]['id']
+            lines = [row['original_string'].strip() for row in rows]
+            cached = cache.lookup_lines(lines)
+            for index, line in enumerate(lines):
+                # Whitespace only: nothing to parse, but the row is stamped with the version like the others
+                if not line:
+                    cached[index] = ParsedReference(original_string=rows[index]['original_string'])
+            missing = list(dict.fromkeys(normalize_reference(line) for line, parsed in zip(lines, cached) if parsed is None))
+            future = executor.submit(parse_lines, cache.parser, missing) if missing else None
+            in_flight.append((rows, lines, cached, missing, future))
+        if not in_flight:
+            break
+
+        rows, lines, cached, missing, future = in_flight.popleft()
+        if future is not None:
+            try:
+                parsed = dict(zip(missing, future.result()))
+            except BrokenProcessPool:
+                # Committed chunks are kept; the next run starts over from the first stale row
+                discard_executor(executor)
+                raise
+            cache.store_lines(missing, parsed.values())
+            for index, line in enumerate(lines):
+                if cached[index] is None:
+                    cached[index] = parsed[normalize_reference(line)].with_original_string(rows[index]['original_string'])
+
+        progress['changed'] += write_back(rows, cached, cache.version)
+        with DB_PHASE_SECONDS.time('commit'):
+            db.session.commit()
+        progress['reparsed'] += len(rows)
+        progress['chunks'] += 1
+        progress['last_id'] = rows[-1]['id']
+        yield dict(progress)
+
+    progress['done'] = True
+    yield progress
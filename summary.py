@@ -0,0 +1,119 @@
+from sqlalchemy import event, select, text
+from db import db
+from models import ProjectSummary
+
+# A year is counted in the range when it is numeric. SQLite sorts every number before
+# every string, so "year < ''" holds exactly for numeric years (and not for NULL or
+# text such as "2009a"), and still lets the MIN/MAX lookups use ix_reference_project_print.
+NUMERIC_YEAR = "year < ''"
+
+# SQL for the summary row of one project, computed from its references
+SUMMARY_VALUES = f"""
+    SELECT project.id, COUNT(reference.id), COALESCE(SUM(reference.reviewed), 0),
+           COALESCE(SUM(reference.doi IS NOT NULL AND reference.doi != ''), 0),
+           MIN(CASE WHEN reference.{NUMERIC_YEAR} THEN reference.year END),
+           MAX(CASE WHEN reference.{NUMERIC_YEAR} THEN reference.year END)
+    FROM project LEFT JOIN reference ON reference.project_id = project.id
+    GROUP BY project.id
+"""
+
+
+def _add_reference(row):
+    # Counts a reference in its project's summary; a new year can only widen the range
+    return f"""
+        UPDATE project_summary SET
+            reference_count = reference_count + 1,
+            reviewed_count = reviewed_count + COALESCE({row}.reviewed, 0),
+            doi_count = doi_count + ({row}.doi IS NOT NULL AND {row}.doi != ''),
+            min_year = CASE WHEN {row}.{NUMERIC_YEAR} AND (min_year IS NULL OR {row}.year < min_year)
+                THEN {row}.year ELSE min_year END,
+            max_year = CASE WHEN {row}.{NUMERIC_YEAR} AND (max_year IS NULL OR {row}.year > max_year)
+                THEN {row}.year ELSE max_year END
+        WHERE project_id = {row}.project_id;
+    """
+
+
+def _remove_reference(row):
+    # Uncounts a reference; the range is looked up again only when it ended at its year
+    return f"""
+        UPDATE project_summary SET
+            reference_count = reference_count - 1,
+            reviewed_count = reviewed_count - COALESCE({row}.reviewed, 0),
+            doi_count = doi_count - ({row}.doi IS NOT NULL AND {row}.doi != ''),
+            min_year = CASE WHEN {row}.year = min_year
+                THEN (SELECT MIN(year) FROM reference WHERE project_id = {row}.project_id AND {NUMERIC_YEAR})
+                ELSE min_year END,
+            max_year = CASE WHEN {row}.year = max_year
+                THEN (SELECT MAX(year) FROM reference WHERE project_id = {row}.project_id AND {NUMERIC_YEAR})
+                ELSE max_year END
+        WHERE project_id = {row}.project_id;
+    """
+
+
+# Like the revision triggers, these see every write path (routes, bulk statements,
+# imports, background jobs and re-parsing), so the summary never needs a full count.
+# An update is handled as removing the old row and adding the new one.
+SUMMARY_TRIGGERS_DDL = [
+    """
+    CREATE TRIGGER IF NOT EXISTS project_summary_project_insert AFTER INSERT ON project BEGIN
+        INSERT OR IGNORE INTO project_summary (project_id) VALUES (new.id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS project_summary_project_delete AFTER DELETE ON project BEGIN
+        DELETE FROM project_summary WHERE project_id = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS project_summary_reference_insert AFTER INSERT ON reference BEGIN
+        {_add_reference('new')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS project_summary_reference_delete AFTER DELETE ON reference BEGIN
+        {_remove_reference('old')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS project_summary_reference_update
+    AFTER UPDATE OF reviewed, doi, year, project_id ON reference BEGIN
+        {_remove_reference('old')}
+        {_add_reference('new')}
+    END
+    """,
+]
+
+
+def create_summary_triggers(connection):
+    """
+    Creates the triggers that keep ProjectSummary current if they do not exist yet.
+    """
+    for statement in SUMMARY_TRIGGERS_DDL:
+        connection.execute(text(statement))
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _create_summary_triggers_with_tables(target, connection, **kw):
+    # The triggers span the project, reference and summary tables, so they wait for all of them
+    create_summary_triggers(connection)
+
+
+def reconcile_summaries():
+    """
+    Creates the summary table and its triggers if needed and recomputes every project's
+    summary from its references, in one transaction.
+
+    Returns:
+        int: Number of projects whose stored summary was missing or differed.
+    """
+    with db.engine.begin() as connection:
+        ProjectSummary.__table__.create(connection, checkfirst=True)
+        create_summary_triggers(connection)
+        expected = {row[0]: tuple(row) for row in connection.execute(text(SUMMARY_VALUES))}
+        columns = ProjectSummary.__table__.columns
+        stored = {row[0]: tuple(row) for row in connection.execute(select(*columns))}
+        stale = sum(stored.get(project_id) != row for project_id, row in expected.items()) + len(stored.keys() - expected.keys())
+
+        connection.execute(ProjectSummary.__table__.delete())
+        connection.execute(text(f'INSERT INTO project_summary ({", ".join(column.name for column in columns)}) {SUMMARY_VALUES}'))
+    return stale
@@ -0,0 +1,185 @@
+import argparse
+import json
+import random
+import string
+
+# Citation styles the generator can produce
+STYLES = (
+    'apa_journal',
+    'apa_journal_doi',
+    'apa_journal_no_issue',
+    'conference',
+    'technical_report',
+    'adversarial',
+)
+
+# Fields every labelled reference carries; '' means the field is absent
+FIELDS = ('authors', 'year', 'title', 'journal', 'volume', 'issue', 'pages', 'doi', 'institution', 'type')
+
+SURNAMES = [
+    'Smith', 'Tang', 'Li', 'Garcia', 'Müller', 'Nguyen', 'Okafor', 'Kowalski', 'Suganthan', 'Yang',
+    'Weise', 'Brown', 'Rossi', 'Dubois', 'Ivanov', 'Kim', 'Haddad', 'Johansson', 'Silva', 'Van-Dam',
+]
+TITLE_WORDS = [
+    'adaptive', 'benchmark', 'functions', 'large', 'scale', 'global', 'optimization', 'neural', 'networks',
+    'evolutionary', 'algorithms', 'for', 'the', 'of', 'robust', 'learning', 'sparse', 'graphs', 'analysis',
+    'stochastic', 'search', 'methods', 'a', 'survey', 'on', 'deep', 'models', 'with', 'constraints', 'data',
+]
+JOURNALS = [
+    'Journal of Testing', 'Information Sciences', 'Applied Soft Computing', 'Machine Learning',
+    'IEEE Transactions on Evolutionary Computation', 'Neural Computation', 'Operations Research',
+]
+BOOK_TITLES = [
+    'Proceedings of the Conference on Learning', 'Advances in Neural Information Processing Systems',
+    'Parallel Problem Solving from Nature', 'Genetic and Evolutionary Computation Conference',
+]
+INSTITUTIONS = [
+    'University of Science and Technology of China', 'Massachusetts Institute of Technology',
+    'Max Planck Institute for Informatics', 'Los Alamos National Laboratory', 'Stanford University',
+]
+
+
+def _author(rng):
+    initials = ' '.join(f'{letter}.' for letter in rng.sample(string.ascii_uppercase, rng.randint(1, 2)))
+    return f'{rng.choice(SURNAMES)}, {initials}'
+
+
+def _authors(rng):
+    authors = [_author(rng) for _ in range(rng.randint(1, 5))]
+    if len(authors) == 1:
+        return authors[0]
+    return ', '.join(authors[:-1]) + ', & ' + authors[-1]
+
+
+def _title(rng):
+    return ' '.join(rng.choice(TITLE_WORDS) for _ in range(rng.randint(4, 12))).capitalize()
+
+
+def _pages(rng):
+    start = rng.randint(1, 900)
+    dash = rng.choice(('–', '-'))
+    return f'{start}{dash}{start + rng.randint(1, 40)}'
+
+
+def _doi(rng):
+    return f'https://doi.org/10.{rng.randint(1000, 9999)}/{rng.randint(100000, 999999)}'
+
+
+def _adversarial(rng, length):
+    """
+    Long lines that look like pasted PDF text: no year, unbalanced brackets,
+    many ". " boundaries and numbers that resemble volumes and pages.
+    """
+    pieces = []
+    while sum(len(piece) for piece in pieces) < length:
+        pieces.append(rng.choice([
+            _title(rng) + '.', '(', ')', ', 12', '(3)', ', 45–67', ' In:', ' pp.', _author(rng), '(19', 'et al.',
+        ]))
+    return ' '.join(pieces)[:length]
+
+
+def make_reference(style, rng, adversarial_length=2000):
+    """
+    Generates one reference string in the given style together with its expected fields.
+
+    Returns:
+        dict: 'style', 'text' and 'labels' (a dictionary with every key in FIELDS).
+    """
+    labels = dict.fromkeys(FIELDS, '')
+    if style == 'adversarial':
+        return {'style': style, 'text': _adversarial(rng, adversarial_length), 'labels': labels}
+
+    labels['authors'] = _authors(rng)
+    labels['year'] = str(rng.randint(1950, 2024)) + rng.choice(('', '', '', 'a', 'b'))
+    labels['title'] = _title(rng)
+    head = f"{labels['authors']} ({labels['year']}). {labels['title']}."
+
+    if style in ('apa_journal', 'apa_journal_doi'):
+        labels.update(journal=rng.choice(JOURNALS), volume=str(rng.randint(1, 120)), issue=str(rng.randint(1, 12)), pages=_pages(rng))
+        text = f"{head} {labels['journal']}, {labels['volume']}({labels['issue']}), {labels['pages']}."
+        if style == 'apa_journal_doi':
+            labels['doi'] = _doi(rng)
+            text += ' ' + labels['doi']
+    elif style == 'apa_journal_no_issue':
+        labels.update(journal=rng.choice(JOURNALS), volume=str(rng.randint(1, 120)), pages=_pages(rng))
+        text = f"{head} {labels['journal']}, {labels['volume']}, {labels['pages']}."
+    elif style == 'conference':
+        labels.update(journal=rng.choice(BOOK_TITLES), pages=_pages(rng))
+        text = f"{head} In: {_author(rng)}, {labels['journal']}, pp. {labels['pages']}."
+        if rng.random() < 0.5:
+            labels['doi'] = _doi(rng)
+            text += ' ' + labels['doi']
+    elif style == 'technical_report':
+        labels.update(institution=rng.choice(INSTITUTIONS), type='Technical report')
+        text = f"{head} Technical report. {labels['institution']}."
+    else:
+        raise ValueError(f'Unknown citation style: {style}')
+    return {'style': style, 'text': text, 'labels': labels}
+
+
+# Inputs that sent the backtracking regex parsers into seconds or minutes of work, as
+# (text, times the repeated part is repeated). benchmark.py --regression runs them under
+# the parse time budget. The first one took ReferenceParser 36 s at 100 repeats.
+PATHOLOGICAL = {
+    'repeated_year_markers': ('Smith, J. (2015). {repeated}1(2), 3', 'Smith, J. (2015). ', 100),
+    'sentences_with_every_marker': ('Smith, J. (2015). {repeated}x 1(2), 3, 4, 5, pp. 6', 'w. In: a, ', 400),
+    'sentences_then_volume': ('Smith, J. (2015). {repeated}x 1(2), 3', 'word. ', 2000),
+    'editor_list': ('Smith, J. (2015). T. In: {repeated}, pp. 1', 'a, b. ', 2000),
+    'comma_list': ('Smith, J. (2015). T. {repeated}1(2), x', 'a, ', 2000),
+    'letters_without_volume': ('Smith, J. (2015). {repeated}', 'abc def ', 4000),
+}
+
+
+def pathological_references(scale=1.0, seed=0):
+    """
+    Returns the PATHOLOGICAL inputs plus a long pasted-PDF line without a year, as (name, text) pairs.
+
+    Args:
+        scale (float): Multiplies the number of repeats, to make the inputs shorter or longer.
+        seed (int): Random seed of the pasted-PDF line.
+    """
+    cases = [
+        (name, template.format(repeated=repeated * max(1, int(repeats * scale))))
+        for name, (template, repeated, repeats) in PATHOLOGICAL.items()
+    ]
+    cases.append(('pdf_text_without_year', _adversarial(random.Random(seed), max(1, int(50000 * scale)))))
+    return cases
+
+
+def generate_corpus(lines, styles=STYLES, seed=0, adversarial_share=0.01, adversarial_length=2000):
+    """
+    Yields a reproducible labelled corpus.
+
+    Args:
+        lines (int): Number of references.
+        styles (iterable): Styles to draw from (adversarial lines are controlled by adversarial_share).
+        seed (int): Random seed; the same seed always gives the same corpus.
+        adversarial_share (float): Fraction of adversarial lines.
+        adversarial_length (int): Length of each adversarial line.
+    """
+    rng = random.Random(seed)
+    regular = [style for style in styles if style != 'adversarial']
+    for _ in range(lines):
+        if 'adversarial' in styles and rng.random() < adversarial_share:
+            style = 'adversarial'
+        else:
+            style = rng.choice(regular)
+        yield make_reference(style, rng, adversarial_length)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a labelled synthetic reference corpus as JSON lines.')
+    parser.add_argument('--lines', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--styles', nargs='+', choices=STYLES, default=list(STYLES))
+    parser.add_argument('--adversarial-share', type=float, default=0.01)
+    parser.add_argument('--adversarial-length', type=int, default=2000)
+    parser.add_argument('--output', type=argparse.FileType('w', encoding='utf-8'), default='-')
+    args = parser.parse_args()
+
+    for item in generate_corpus(args.lines, args.styles, args.seed, args.adversarial_share, args.adversarial_length):
+        args.output.write(json.dumps(item, ensure_ascii=False) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+from sqlalchemy import insert
+from bulk import STATEMENT_CHUNK_SIZE
+from db import db
+from models import Project, Reference
+
+
+def _add_references(count):
+    project = Project(name='Bulk')
+    db.session.add(project)
+    db.session.flush()
+    db.session.execute(insert(Reference), [
+        dict(author=f'Author {index}, A.', title=f'Title {index}', journal='Journal', year=2000,
+             project_id=project.id, original_string='')
+        for index in range(count)
+    ])
+    db.session.commit()
+    return project.id, [ref.id for ref in Reference.query.order_by(Reference.id)]
+
+
+def test_update_fields_set_in_different_chunks(client):
+    project_id, ids = _add_references(STATEMENT_CHUNK_SIZE + 100)
+    # Titles only in the first chunk, journals only in the second
+    updates = [{'id': ref_id, 'title': f'New title {ref_id}'} for ref_id in ids[:STATEMENT_CHUNK_SIZE]]
+    updates += [{'id': ref_id, 'journal': 'New journal'} for ref_id in ids[STATEMENT_CHUNK_SIZE:]]
+
+    response = client.post(f'/project/{project_id}/references/batch', json={'update': updates})
+
+    assert response.status_code == 200
+    assert response.json['ok'] == len(updates)
+    first, last = db.session.get(Reference, ids[0]), db.session.get(Reference, ids[-1])
+    assert (first.title, first.journal) == (f'New title {ids[0]}', 'Journal')
+    assert (last.title, last.journal) == (f'Title {len(ids) - 1}', 'New journal')
+
+
+def test_year_validation(client):
+    project_id, ids = _add_references(7)
+    years = [2009, '2009a', '', '815', 'abc', '   ', -5]
+    response = client.post(f'/project/{project_id}/references/batch', json={
+        'update': [{'id': ref_id, 'year': year} for ref_id, year in zip(ids, years)]
+    })
+
+    assert [result['status'] for result in response.json['results']] == ['ok'] * 4 + ['invalid'] * 3
+    assert db.session.get(Reference, ids[2]).year is None
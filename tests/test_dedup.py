@@ -0,0 +1,37 @@
+from sqlalchemy import insert
+from db import db
+from models import Project, Reference
+
+REFERENCE = 'Smith, J. (2019). A study of duplicates. Journal of Testing, 3(2), 1–9.'
+
+
+def _project(client):
+    client.post('/add_project', data={'name': 'Dedup'})
+    return Project.query.one().id
+
+
+def test_delete_rechecks_remaining_duplicates(client):
+    project_id = _project(client)
+    for _ in range(3):
+        client.post(f'/project/{project_id}/add_reference', data={'plain_reference': REFERENCE})
+    assert [ref.duplicate_of for ref in Reference.query.order_by(Reference.id)] == [None, 1, 1]
+
+    client.get(f'/project/{project_id}/delete_reference/1')
+
+    db.session.expire_all()
+    assert [(ref.id, ref.duplicate_of) for ref in Reference.query.order_by(Reference.id)] == [(2, None), (3, 2)]
+
+
+def test_duplicate_report_does_not_write(client):
+    project_id = _project(client)
+    db.session.execute(insert(Reference), [
+        dict(author='Smith, J.', title='Same title', year=2019, project_id=project_id, original_string='')
+        for _ in range(2)
+    ])
+    db.session.commit()
+
+    response = client.get(f'/project/{project_id}/duplicates')
+
+    assert response.json['clusters'] == []
+    db.session.expire_all()
+    assert Reference.query.filter(Reference.title_key.is_not(None)).count() == 0
@@ -0,0 +1,6 @@
+from metrics import metrics_enabled
+
+
+def test_metrics_switch_follows_config(client):
+    assert client.get('/metrics/enabled').json == {'enabled': metrics_enabled()}
+    assert client.post('/metrics/enabled', data={'enabled': '1'}).status_code == 405
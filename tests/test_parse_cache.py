@@ -0,0 +1,16 @@
+import parse_cache
+from db import db
+from models import ParseCacheEntry
+from parse_cache import ParseCache
+from parsed_reference import ParsedReference
+
+
+def test_store_skips_existing_rows_without_on_conflict(app, monkeypatch):
+    # Databases without INSERT ... ON CONFLICT fall back to one savepoint per row
+    monkeypatch.setattr(parse_cache, 'ON_CONFLICT_INSERTS', {})
+    cache = ParseCache(lambda text: [], version='test')
+    cache._put_persistent({'a': ParsedReference(title='First')})
+    cache._put_persistent({'a': ParsedReference(title='Again'), 'b': ParsedReference(title='Second')})
+    db.session.commit()
+
+    assert sorted(entry.key for entry in ParseCacheEntry.query) == ['a', 'b']
@@ -0,0 +1,75 @@
+from sqlalchemy import inspect, literal, text
+from sqlalchemy.schema import CreateColumn
+from db import db
+from bibliography import create_revision_triggers
+from search import create_search_index
+from summary import reconcile_summaries
+
+
+def _column_default(column, dialect):
+    """
+    Returns the DEFAULT clause for adding a NOT NULL column to a table that already has rows.
+
+    SQLite only accepts constant defaults in ALTER TABLE, so a Python default such as
+    datetime.utcnow is evaluated once and every existing row gets that value.
+    """
+    if column.nullable or column.server_default is not None or column.default is None:
+        return ''
+    value = column.default.arg(None) if column.default.is_callable else column.default.arg
+    return ' DEFAULT ' + str(literal(value, column.type).compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+
+
+def upgrade_database():
+    """
+    Brings a database created by an older version of the app up to the current models,
+    keeping its data. Safe to run any number of times.
+
+    - adds the missing columns of existing tables, existing rows getting the column default
+    - creates the missing tables and indexes
+    - creates the revision, search and summary triggers, fills the search index when it is new
+      and recomputes the project summaries
+
+    Returns:
+        list: A description of every change made.
+    """
+    changes = []
+    with db.engine.begin() as connection:
+        inspector = inspect(connection)
+        existing_tables = set(inspector.get_table_names())
+        search_index_existed = 'reference_fts' in existing_tables
+
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                definition = str(CreateColumn(column).compile(dialect=connection.dialect))
+                connection.execute(text(
+                    f'ALTER TABLE {table.name} ADD COLUMN {definition}{_column_default(column, connection.dialect)}'
+                ))
+                changes.append(f'added column {table.name}.{column.name}')
+
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                table.create(connection)
+                changes.append(f'created table {table.name}')
+                continue
+            # Tables created above come with their indexes, older ones may lack the newer indexes
+            existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(connection)
+                    changes.append(f'created index {index.name}')
+
+        create_revision_triggers(connection)
+        create_search_index(connection)
+        if not search_index_existed:
+            connection.execute(text("INSERT INTO reference_fts(reference_fts) VALUES ('rebuild')"))
+            changes.append('created and filled the search index')
+
+    stale = reconcile_summaries()
+    if stale:
+        changes.append(f'recomputed {stale} project summaries')
+    return changes
@@ -0,0 +1,157 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from flask import current_app
+from sqlalchemy import text
+from db import db
+from dispatcher import QueueFull
+from metrics import DB_PHASE_SECONDS, Histogram, metrics_enabled
+
+logger = logging.getLogger(__name__)
+
+# Default batching settings, see WriteQueue
+MAX_BATCH_SIZE = 32
+MAX_LATENCY = 0.0
+MAX_QUEUE = 256
+
+WRITE_BATCH_SIZE = Histogram(
+    'db_write_batch_writes', 'Writes committed together by the write queue.', (),
+    buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+
+
+class WriteQueue:
+    """
+    Runs small database writes of concurrent requests on one thread, several per transaction.
+
+    SQLite has a single write lock per database. Requests writing on their own
+    connections each wait for it, polling with growing sleeps until busy_timeout
+    runs out, and then commit one by one. The queue's thread instead takes the
+    lock once (BEGIN IMMEDIATE), runs every write that is waiting, up to
+    max_batch_size of them, and commits them together; writes that arrive in
+    the meantime form the next batch.
+
+    A write is a function without arguments that uses db.session; it runs in a
+    savepoint, so a failing write is rolled back on its own and its exception
+    goes to its caller while the others are committed.
+    """
+
+    def __init__(self, app, max_batch_size=MAX_BATCH_SIZE, max_latency=MAX_LATENCY, max_queue=MAX_QUEUE):
+        """
+        Args:
+            app (Flask): Application whose database the writes go to; the thread runs in its context.
+            max_batch_size (int): Writes committed together at most.
+            max_latency (float): Seconds the oldest write may wait for others to join its transaction.
+            max_queue (int): Writes that may be waiting before new ones are refused.
+        """
+        self.app = app
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_latency = max(0.0, float(max_latency))
+        self.max_queue = int(max_queue)
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def submit(self, write):
+        """
+        Queues a write for the next transaction.
+
+        Returns:
+            Future: Resolves to the write's return value once it is committed, or to its exception.
+
+        Raises:
+            QueueFull: When max_queue writes are already waiting.
+        """
+        future = Future()
+        with self._condition:
+            if len(self._queue) >= self.max_queue:
+                raise QueueFull(f'{len(self._queue)} writes are already waiting')
+            self._queue.append((write, future, time.monotonic()))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='write-queue', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return future
+
+    def _next_batch(self):
+        with self._condition:
+            while not self._queue:
+                self._condition.wait()
+            deadline = self._queue[0][2] + self.max_latency
+            while len(self._queue) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            return [self._queue.popleft() for _ in range(min(len(self._queue), self.max_batch_size))]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if metrics_enabled():
+                WRITE_BATCH_SIZE.observe(len(batch))
+            with self.app.app_context():
+                self._commit(batch)
+
+    def _commit(self, batch):
+        results = []
+        try:
+            if db.engine.dialect.name == 'sqlite':
+                db.session.execute(text('BEGIN IMMEDIATE'))
+            for write, future, _ in batch:
+                savepoint = db.session.begin_nested()
+                try:
+                    result = write()
+                    savepoint.commit()
+                except Exception as e:
+                    savepoint.rollback()
+                    results.append((future, None, e))
+                else:
+                    results.append((future, result, None))
+            with DB_PHASE_SECONDS.time('commit'):
+                db.session.commit()
+        except Exception as e:
+            # The transaction itself failed, so none of the writes were committed
+            logger.exception('Write batch of %d failed', len(batch))
+            db.session.rollback()
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+def run_write(write, timeout=None):
+    """
+    Runs a write through the app's write queue and returns its result once committed.
+
+    With WRITE_QUEUE_ENABLED off the write runs in the request's own session and is
+    committed directly, as without the queue. Otherwise the request's session is
+    committed first (e.g. new parse cache entries), which also ends its read
+    transaction, so the queue's transaction never waits for the request.
+
+    Raises:
+        QueueFull: When the queue is full.
+    """
+    if not current_app.config.get('WRITE_QUEUE_ENABLED', False):
+        result = write()
+        with DB_PHASE_SECONDS.time('commit'):
+            db.session.commit()
+        return result
+
+    db.session.commit()
+    queue = current_app.extensions.get('write_queue')
+    if queue is None:
+        queue = current_app.extensions.setdefault('write_queue', WriteQueue(
+            current_app._get_current_object(),
+            current_app.config.get('WRITE_BATCH_MAX_SIZE', MAX_BATCH_SIZE),
+            current_app.config.get('WRITE_BATCH_MAX_LATENCY_MS', MAX_LATENCY * 1000) / 1000,
+            current_app.config.get('WRITE_QUEUE_MAX', MAX_QUEUE)
+        ))
+    return queue.submit(write).result(timeout)